@@ -0,0 +1,70 @@
+"""
+Архивация точек давно завершённых забегов.
+
+Строки Position забега, завершённого больше POSITION_ARCHIVE_AFTER_DAYS дней
+назад, удаляются из горячей таблицы; трек остаётся только в упакованном
+RunTrack (app_run/track_storage.py), которым чтения уже пользуются
+(список позиций забега, в т.ч. keyset-пагинация, выгрузка, дистанция, LOD).
+
+Порядок для каждого забега: в одной транзакции трек упаковывается (если его
+ещё нет) и помечается archived_at, затем строки удаляются пачками, каждая
+в своей транзакции. Прерванный прогон безопасен: помеченный трек полон,
+а оставшиеся строки удалит следующий запуск.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from app_run.models import Position, Run, RunTrack
+from app_run.track_storage import store_run_track
+
+
+def archive_candidates(older_than_days=None):
+    # забеги, чьи строки Position ещё лежат в горячей таблице и подлежат архивации
+    older_than_days = settings.POSITION_ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    cutoff = timezone.now() - datetime.timedelta(days=older_than_days)
+    has_positions = Exists(Position.objects.filter(run_id=OuterRef('id')))
+    # у забегов, завершённых до появления finished_at (миграция 0016), его нет - как в stats.py
+    return Run.objects.annotate(finish=Coalesce('finished_at', 'created_at')).filter(
+        has_positions, status='finished', finish__lt=cutoff,
+    ).order_by('id')
+
+
+def archive_run(run_id, chunk_size=None) -> int:
+    # возвращает количество удалённых строк Position
+    chunk_size = chunk_size or settings.POSITION_ARCHIVE_CHUNK_SIZE
+    with transaction.atomic():
+        track = RunTrack.objects.select_for_update().filter(run_id=run_id).first()
+        if track is None:
+            store_run_track(run_id)
+        if track is None or track.archived_at is None:
+            RunTrack.objects.filter(run_id=run_id).update(archived_at=timezone.now())
+        # ссылка на последнюю точку больше не нужна: дистанция забега окончательная
+        Run.objects.filter(id=run_id).update(last_position=None)
+
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            ids = list(Position.objects.filter(run_id=run_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                return deleted
+            Position.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+
+
+def archive_positions(older_than_days=None, chunk_size=None, limit=None, progress=None) -> tuple[int, int]:
+    # (заархивировано забегов, удалено строк); забеги по возрастанию id, повторный запуск продолжает
+    runs = archive_candidates(older_than_days).values_list('id', flat=True)
+    if limit is not None:
+        runs = runs[:limit]
+    archived = deleted = 0
+    for run_id in list(runs):
+        deleted += archive_run(run_id, chunk_size)
+        archived += 1
+        if progress is not None:
+            progress(run_id, archived, deleted)
+    return archived, deleted
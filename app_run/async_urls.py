@@ -0,0 +1,12 @@
+# async-версии эндпоинтов записи для ASGI (app_run/async_views.py);
+# подключаются лениво из project_run/urls.py под префиксом api/async/
+from django.urls import path
+
+from app_run import async_views
+
+urlpatterns = [
+    path('positions/', async_views.position_create),
+    path('positions/batch/', async_views.position_batch),
+    path('runs/<int:run_id>/start/', async_views.run_start),
+    path('runs/<int:run_id>/stop/', async_views.run_stop),
+]
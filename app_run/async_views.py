@@ -0,0 +1,112 @@
+"""
+Async-версии горячих эндпоинтов записи для запуска под ASGI (project_run/asgi.py):
+точки трека и старт/стоп забега. Ответы совпадают с DRF-эндпоинтами.
+
+Чтения и условные UPDATE без блокировок идут через async ORM (aget, aupdate,
+aexists). Транзакции с select_for_update (запись точек под блокировкой забега,
+остановка забега) async ORM не поддерживает, поэтому только эти части
+выполняются через sync_to_async теми же функциями, что и у синхронных
+представлений. Поток занят только на время блокирующей транзакции.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.http import HttpResponse
+from django.views.decorators.http import require_POST
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+
+from app_run.models import Run
+from app_run.renderers import FastJSONResponse
+from app_run.serializers import PositionSerializer
+from app_run.tracking import add_position, ordered_errors, parse_position, range_errors, run_errors, stop_runs
+from app_run.views import position_batch_result
+
+RUN_NOT_FOUND = {'detail': 'No Run matches the given query.'}
+
+
+class BadRequest(Exception):
+    pass
+
+
+def parse_body(request):
+    # JSON или form-data, как парсеры DRF по умолчанию
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'null')
+        except ValueError as exc:
+            raise BadRequest(f'JSON parse error - {exc}')
+    return request.POST
+
+
+@require_POST
+async def position_create(request):
+    try:
+        data = parse_body(request)
+    except BadRequest as exc:
+        return FastJSONResponse({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    payload, response_status = await _create_position(data)
+    return FastJSONResponse(payload, status=response_status)
+
+
+async def _create_position(data):
+    # валидация как у PositionSerializer, забег читается без блокировки
+    if not isinstance(data, dict):
+        # не словарь: сериализатор отклоняет его до полей, без запросов к БД
+        serializer = PositionSerializer(data=data)
+        serializer.is_valid()
+        return serializer.errors, status.HTTP_400_BAD_REQUEST
+
+    serializer = PositionSerializer()
+    fields = serializer.fields
+    run_id, latitude, longitude, errors = parse_position(fields, data)
+    errors.update(range_errors(serializer, latitude, longitude))
+    if run_id is not None:
+        try:
+            run = await Run.objects.only('id', 'status').aget(pk=run_id)
+        except Run.DoesNotExist:
+            run = None
+        errors.update(run_errors(fields, run_id, run))
+    if errors:
+        return ordered_errors(fields, errors), status.HTTP_400_BAD_REQUEST
+
+    try:
+        position = await sync_to_async(add_position)(run_id, latitude, longitude)
+    except ValidationError as exc:
+        return exc.detail, status.HTTP_400_BAD_REQUEST
+    return PositionSerializer(position).data, status.HTTP_201_CREATED
+
+
+@require_POST
+async def position_batch(request):
+    try:
+        data = parse_body(request)
+    except BadRequest as exc:
+        return FastJSONResponse({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    payload, response_status = await sync_to_async(position_batch_result)(data)
+    return FastJSONResponse(payload, status=response_status)
+
+
+@require_POST
+async def run_start(request, run_id):
+    updated = await Run.objects.filter(id=run_id, status='init').aupdate(status='in_progress')
+    if updated:
+        return HttpResponse(status=status.HTTP_200_OK)
+    if not await Run.objects.filter(id=run_id).aexists():
+        return FastJSONResponse(RUN_NOT_FOUND, status=status.HTTP_404_NOT_FOUND)
+    return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
+
+
+@require_POST
+async def run_stop(request, run_id):
+    if await sync_to_async(_stop_run)(run_id):
+        return HttpResponse(status=status.HTTP_200_OK)
+    if not await Run.objects.filter(id=run_id).aexists():
+        return FastJSONResponse(RUN_NOT_FOUND, status=status.HTTP_404_NOT_FOUND)
+    return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
+
+
+def _stop_run(run_id) -> bool:
+    with transaction.atomic():
+        return bool(stop_runs([run_id]))
@@ -0,0 +1,557 @@
+"""
+Замеры горячих эндпоинтов через django.test.Client на текущей базе
+(SQLite или локальный PostgreSQL, заполненные командой seed_load).
+
+Каждый сценарий: setup(ctx) готовит данные один раз, prepare(ctx) - перед
+каждой итерацией (оба вне замера), request(client, ctx) выполняет ровно один
+замеряемый запрос. Пик памяти снимается tracemalloc в отдельной итерации,
+чтобы не искажать задержку. Сценарий выполняется в транзакции,
+которая откатывается, поэтому повторные прогоны сравнимы между коммитами.
+"""
+import asyncio
+import csv
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import django
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection, connections, transaction
+from django.test import AsyncClient, Client, RequestFactory
+from django.utils import timezone
+
+from app_run.models import Run
+from app_run.tracking import ingest_position_batch
+
+PERCENTILES = (50, 90, 95, 99)
+SCENARIOS = {}
+
+
+def scenario(name, setup=None, prepare=None):
+    def register(request):
+        SCENARIOS[name] = (setup, prepare, request)
+        return request
+    return register
+
+
+class SkipScenario(Exception):
+    pass
+
+
+def _athlete():
+    athlete = User.objects.filter(is_staff=False, is_superuser=False).order_by('id').first()
+    if athlete is None:
+        raise SkipScenario('no athletes, run seed_load first')
+    return athlete
+
+
+def _track(n, start=(55.75, 37.61)):
+    rng = np.random.default_rng(n)
+    track = np.round(np.asarray(start) + np.cumsum(rng.normal(0, 0.0001, (n, 2)), axis=0), 4)
+    return track.tolist()
+
+
+def _running_run(positions=0):
+    run = Run.objects.create(athlete=_athlete(), comment='benchmark', status='in_progress')
+    if positions:
+        ingest_position_batch(
+            [{'run': run.id, 'latitude': lat, 'longitude': lon} for lat, lon in _track(positions)]
+        )
+    return run
+
+
+@scenario('runs_list')
+def runs_list(client, ctx):
+    return client.get('/api/runs/?size=50&page=1')
+
+
+def _setup_deep_page(ctx):
+    ctx['last_page'] = max(1, (Run.objects.count() + 49) // 50)
+
+
+@scenario('runs_list_deep_page', setup=_setup_deep_page)
+def runs_list_deep_page(client, ctx):
+    return client.get(f"/api/runs/?size=50&page={ctx['last_page']}")
+
+
+@scenario('runs_list_cursor')
+def runs_list_cursor(client, ctx):
+    return client.get('/api/runs/?size=50&pagination=cursor')
+
+
+@scenario('runs_list_filtered')
+def runs_list_filtered(client, ctx):
+    return client.get('/api/runs/?size=50&status=finished&ordering=-created_at')
+
+
+@scenario('users_list')
+def users_list(client, ctx):
+    return client.get('/api/users/?size=50')
+
+
+def _setup_ingest(ctx):
+    ctx['run'] = _running_run(positions=1)
+    ctx['points'] = iter(_track(100_000, start=(55.0, 37.0)))
+
+
+@scenario('position_ingest', setup=_setup_ingest)
+def position_ingest(client, ctx):
+    lat, lon = next(ctx['points'])
+    return client.post('/api/positions/', {'run': ctx['run'].id, 'latitude': lat, 'longitude': lon})
+
+
+@scenario('position_batch_ingest_500', setup=_setup_ingest)
+def position_batch_ingest(client, ctx):
+    batch = [{'run': ctx['run'].id, 'latitude': lat, 'longitude': lon} for lat, lon in
+             (next(ctx['points']) for _ in range(500))]
+    return client.post('/api/positions/batch/', batch, content_type='application/json')
+
+
+def _prepare_stop(ctx):
+    # каждая итерация останавливает свежий забег на 1000 точек
+    ctx['run'] = _running_run(positions=1000)
+
+
+@scenario('run_stop', prepare=_prepare_stop)
+def run_stop(client, ctx):
+    return client.post(f"/api/runs/{ctx['run'].id}/stop/")
+
+
+def _prepare_start(ctx):
+    ctx['run'] = Run.objects.create(athlete=_athlete(), comment='benchmark', status='init')
+
+
+@scenario('run_start', prepare=_prepare_start)
+def run_start(client, ctx):
+    return client.post(f"/api/runs/{ctx['run'].id}/start/")
+
+
+def _prepare_lifecycle_stop(ctx):
+    ctx['runs'] = [_running_run(positions=100).id for _ in range(20)]
+
+
+@scenario('run_lifecycle_stop_20', prepare=_prepare_lifecycle_stop)
+def run_lifecycle_stop(client, ctx):
+    return client.post('/api/runs/lifecycle/', {'action': 'stop', 'runs': ctx['runs']}, content_type='application/json')
+
+
+def _setup_upload(ctx):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['name', 'uid', 'value', 'latitude', 'longitude', 'url'])
+    for i in range(ctx.get('upload_rows', 5000)):
+        writer.writerow([f'item {i}', f'bench-{i}', i % 100, 55 + i % 100 / 1000, 37.6,
+                         'https://example.com/a.png' if i % 50 else 'not-a-url'])
+    ctx['upload'] = out.getvalue().encode('utf-8')
+
+
+@scenario('collectible_upload_5000', setup=_setup_upload)
+def collectible_upload(client, ctx):
+    upload = io.BytesIO(ctx['upload'])
+    upload.name = 'bench.csv'
+    return client.post('/api/upload_file/', {'file': upload})
+
+
+class QueryCounter:
+    """
+    Счётчик SQL-запросов через connection.execute_wrapper. Не зависит от DEBUG
+    и connection.queries_log (не больше 9000 записей, после заполнения
+    CaptureQueriesContext молча считает 0) и не хранит текст запросов.
+    """
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(name, iterations=20, warmup=3, client=None) -> dict:
+    setup, prepare, request = SCENARIOS[name]
+    client = client or Client()
+    timings, queries, sizes = [], [], []
+
+    def call(ctx):
+        if prepare is not None:
+            prepare(ctx)
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            started = time.perf_counter()
+            response = request(client, ctx)
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+            elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise RuntimeError(f'{name}: HTTP {response.status_code}')
+        return elapsed, counter.count, len(content)
+
+    with transaction.atomic():
+        ctx = {}
+        if setup is not None:
+            setup(ctx)
+        for i in range(warmup + iterations):
+            elapsed, query_count, size = call(ctx)
+            if i >= warmup:
+                timings.append(elapsed * 1000)
+                queries.append(query_count)
+                sizes.append(size)
+
+        tracemalloc.start()
+        try:
+            call(ctx)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        transaction.set_rollback(True)
+
+    timings = np.array(timings)
+    result = {f'p{p}_ms': round(float(np.percentile(timings, p)), 3) for p in PERCENTILES}
+    result.update(
+        mean_ms=round(float(timings.mean()), 3),
+        min_ms=round(float(timings.min()), 3),
+        max_ms=round(float(timings.max()), 3),
+        queries_mean=round(float(np.mean(queries)), 2),
+        queries_max=int(max(queries)),
+        peak_memory_kb=round(peak / 1024, 1),
+        response_bytes=int(max(sizes)),
+        iterations=iterations,
+    )
+    return result
+
+
+def run_benchmarks(names=None, iterations=20, warmup=3, log=None) -> dict:
+    report = {'meta': environment(), 'scenarios': {}}
+    for name in names or SCENARIOS:
+        try:
+            report['scenarios'][name] = measure(name, iterations=iterations, warmup=warmup)
+        except SkipScenario as exc:
+            report['scenarios'][name] = {'skipped': str(exc)}
+        if log is not None:
+            log(name, report['scenarios'][name])
+    return report
+
+
+def environment(counts=True) -> dict:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    meta = {
+        'commit': commit,
+        'timestamp': timezone.now().isoformat(),
+        'database': connection.vendor,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+    }
+    if counts:
+        meta.update(runs=Run.objects.count(), users=User.objects.count())
+    return meta
+
+
+# режим -> URL записи точки
+CONCURRENCY_MODES = {
+    'wsgi': '/api/positions/',  # пул потоков + Client, синхронное представление
+    'asgi_sync': '/api/positions/',  # event loop + AsyncClient, синхронное представление
+    'asgi': '/api/async/positions/',  # event loop + AsyncClient, async-представление
+}
+
+
+def concurrency_benchmark(modes=None, clients=50, requests_per_client=20, threads=8, client_delay_ms=20) -> dict:
+    """
+    Запись точек при множестве одновременных медленных клиентов.
+
+    Каждый клиент - отдельный забег, точки отправляются по одной; client_delay_ms -
+    сколько медленный клиент держит соединение на каждый запрос (передача по сети).
+    wsgi: threads потоков, как у воркера WSGI-сервера, поток занят и во время задержки.
+    asgi*: все клиенты в одном event loop, задержка - asyncio.sleep.
+    Потоки работают со своими соединениями к БД, поэтому данные коммитятся
+    и удаляются после замера.
+    """
+    athlete = _athlete()
+    runs = [
+        Run.objects.create(athlete=athlete, comment='concurrency benchmark', status='in_progress')
+        for _ in range(clients)
+    ]
+    tracks = {run.id: _track(requests_per_client, start=(55.0 + i / 100, 37.0)) for i, run in enumerate(runs)}
+    delay = client_delay_ms / 1000
+    report = {'meta': environment(), 'params': {
+        'clients': clients, 'requests_per_client': requests_per_client,
+        'threads': threads, 'client_delay_ms': client_delay_ms,
+    }, 'modes': {}}
+    try:
+        for mode in modes or CONCURRENCY_MODES:
+            url = CONCURRENCY_MODES[mode]
+            started = time.perf_counter()
+            if mode == 'wsgi':
+                with ThreadPoolExecutor(max_workers=threads) as pool:
+                    results = list(pool.map(
+                        lambda run_id: _wsgi_client(url, run_id, tracks[run_id], delay, started), tracks
+                    ))
+            else:
+                results = asyncio.run(_asgi_clients(url, tracks, delay, started))
+            report['modes'][mode] = _concurrency_result(results, time.perf_counter() - started)
+    finally:
+        Run.objects.filter(id__in=[run.id for run in runs]).delete()
+    return report
+
+
+def _position_body(run_id, lat, lon):
+    return {'run': run_id, 'latitude': lat, 'longitude': lon}
+
+
+def _wsgi_client(url, run_id, points, delay, started):
+    client = Client(raise_request_exception=False)
+    latencies, errors, first_response = [], 0, None
+    try:
+        for lat, lon in points:
+            request_started = time.perf_counter()
+            time.sleep(delay)
+            response = client.post(url, _position_body(run_id, lat, lon), content_type='application/json')
+            latencies.append(time.perf_counter() - request_started)
+            errors += response.status_code >= 400
+            if first_response is None:
+                first_response = time.perf_counter() - started
+    finally:
+        connections.close_all()
+    return latencies, errors, first_response
+
+
+async def _asgi_clients(url, tracks, delay, started):
+    async def run_client(run_id, points):
+        client = AsyncClient(raise_request_exception=False)
+        latencies, errors, first_response = [], 0, None
+        for lat, lon in points:
+            request_started = time.perf_counter()
+            await asyncio.sleep(delay)
+            response = await client.post(url, _position_body(run_id, lat, lon), content_type='application/json')
+            latencies.append(time.perf_counter() - request_started)
+            errors += response.status_code >= 400
+            if first_response is None:
+                first_response = time.perf_counter() - started
+        return latencies, errors, first_response
+
+    try:
+        return await asyncio.gather(*(run_client(run_id, points) for run_id, points in tracks.items()))
+    finally:
+        await sync_to_async(connections.close_all)()
+
+
+def _concurrency_result(results, elapsed) -> dict:
+    first_responses = np.array([first for _, _, first in results if first is not None]) * 1000
+    result = _throughput_result(
+        [latency for client_latencies, _, _ in results for latency in client_latencies],
+        sum(errors for _, errors, _ in results), elapsed,
+    )
+    # сколько клиент ждал первого ответа: очередь за свободным потоком
+    result['first_response_p99_ms'] = round(float(np.percentile(first_responses, 99)), 3)
+    return result
+
+
+# режим -> настройки соединения для DATABASES['default'] (в project_run/settings/pooled.py - из окружения, DB_*)
+DB_CONNECTION_MODES = {
+    'fresh': {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False},  # новое соединение на каждый запрос
+    'persistent': {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True},
+    'pool': {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'pool': True},
+}
+
+
+def connection_benchmark(modes=None, threads=8, requests_per_thread=50) -> dict:
+    """
+    Короткие запросы записи (точка трека и старт забега по очереди) с разными
+    режимами соединений с PostgreSQL: без переиспользования, постоянные, пул.
+
+    Запросы идут через WSGIHandler, а не Client: тестовый клиент не закрывает
+    соединения в конце запроса, а здесь замеряется именно это. Каждый поток -
+    отдельный клиент со своим забегом; данные коммитятся и удаляются после замера.
+    """
+    if connection.vendor != 'postgresql':
+        raise SkipScenario('нужен PostgreSQL: замеряется установка соединения с сервером БД')
+    report = {'meta': environment(), 'params': {
+        'threads': threads, 'requests_per_thread': requests_per_thread,
+    }, 'modes': {}}
+    for mode in modes or DB_CONNECTION_MODES:
+        if DB_CONNECTION_MODES[mode].get('pool') and not _psycopg_pool_available():
+            report['modes'][mode] = {'skipped': 'нужен psycopg[pool] (psycopg 3)'}
+            continue
+        athlete = _athlete()
+        clients = [
+            (
+                Run.objects.create(athlete=athlete, comment='connection benchmark', status='in_progress'),
+                Run.objects.bulk_create(
+                    [Run(athlete=athlete, comment='connection benchmark') for _ in range(requests_per_thread // 2)]
+                ),
+            )
+            for _ in range(threads)
+        ]
+        try:
+            with _database_mode(DB_CONNECTION_MODES[mode], threads):
+                application = WSGIHandler()
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=threads) as pool:
+                    results = list(pool.map(
+                        lambda client: _connection_client(application, *client, requests_per_thread), clients
+                    ))
+                report['modes'][mode] = _connection_result(results, time.perf_counter() - started)
+        finally:
+            Run.objects.filter(athlete=athlete, comment='connection benchmark').delete()
+    return report
+
+
+def _psycopg_pool_available() -> bool:
+    try:
+        import psycopg_pool  # noqa: F401
+        from django.db.backends.postgresql.psycopg_any import is_psycopg3
+    except ImportError:
+        return False
+    return is_psycopg3
+
+
+@contextmanager
+def _database_mode(mode, threads):
+    # настройки меняются на месте: соединения потоков создаются из того же словаря
+    database = connections.settings['default']
+    saved = {key: database.get(key) for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+    saved_options = dict(database['OPTIONS'])
+    connections.close_all()
+    database.update(CONN_MAX_AGE=mode['CONN_MAX_AGE'], CONN_HEALTH_CHECKS=mode['CONN_HEALTH_CHECKS'])
+    if mode.get('pool'):
+        database['OPTIONS']['pool'] = {'min_size': threads, 'max_size': threads}
+    try:
+        yield
+    finally:
+        connections.close_all()
+        if mode.get('pool'):
+            connections['default'].close_pool()
+        database.update(saved)
+        database['OPTIONS'] = saved_options
+
+
+def _connection_client(application, running, pending, requests):
+    factory = RequestFactory()
+    latencies, errors = [], 0
+    try:
+        for i in range(requests):
+            if i % 2 == 0:
+                lat, lon = 55.0 + i / 10000, 37.0
+                request = factory.post('/api/positions/', _position_body(running.id, lat, lon),
+                                       content_type='application/json')
+            else:
+                request = factory.post(f'/api/runs/{pending[i // 2].id}/start/')
+            request_started = time.perf_counter()
+            response = application(request.environ, lambda status, headers, *args: None)
+            errors += response.status_code >= 400
+            b''.join(response)
+            response.close()  # как WSGI-сервер: request_finished закрывает или возвращает соединение
+            latencies.append(time.perf_counter() - request_started)
+    finally:
+        connections.close_all()
+    return latencies, errors
+
+
+def _connection_result(results, elapsed) -> dict:
+    return _throughput_result(
+        [latency for client_latencies, _ in results for latency in client_latencies],
+        sum(errors for _, errors in results), elapsed,
+    )
+
+
+def _throughput_result(latencies, errors, elapsed) -> dict:
+    # общая часть отчётов concurrency и db_connections; latencies - в секундах
+    latencies = np.array(latencies) * 1000
+    requests = len(latencies)
+    return {
+        'requests': requests,
+        'errors': int(errors),
+        'elapsed_s': round(elapsed, 3),
+        'requests_per_second': round(requests / elapsed, 1) if elapsed else None,
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+    }
+
+
+# выполняется в отдельном процессе: импорт WSGI-приложения и один запрос, как при холодном старте Lambda
+COLD_START_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+imported = time.perf_counter()
+from django.test import RequestFactory
+statuses = []
+b''.join(application(RequestFactory().get(sys.argv[1]).environ, lambda status, headers, *args: statuses.append(status)))
+responded = time.perf_counter()
+print(json.dumps({
+    'status': statuses[0],
+    'import_ms': (imported - started) * 1000,
+    'first_response_ms': (responded - started) * 1000,
+    'modules': len(sys.modules),
+    'numpy': 'numpy' in sys.modules,
+}))
+"""
+
+
+def cold_start_benchmark(profiles, url='/api/company_details/', runs=10) -> dict:
+    """
+    Время от старта процесса до первого ответа для каждого модуля настроек.
+
+    import_ms - импорт и настройка Django (get_wsgi_application), first_response_ms -
+    плюс первый запрос к url; process_ms - всё время процесса вместе с запуском
+    интерпретатора. URL лучше брать без обращения к БД, чтобы мерить только импорт.
+    """
+    report = {'meta': {**environment(counts=False), 'url': url, 'runs': runs}, 'profiles': {}}
+    for profile in profiles:
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            completed = subprocess.run(
+                [sys.executable, '-c', COLD_START_SCRIPT, url], capture_output=True, text=True, cwd=settings.BASE_DIR,
+                env={**os.environ, 'DJANGO_SETTINGS_MODULE': profile},
+            )
+            if completed.returncode:
+                raise SkipScenario(f'{profile}: {completed.stderr.strip().splitlines()[-1:]}')
+            sample = json.loads(completed.stdout.splitlines()[-1])
+            sample['process_ms'] = (time.perf_counter() - started) * 1000
+            samples.append(sample)
+        result = {
+            f'{key}_p50': round(float(np.percentile([sample[key] for sample in samples], 50)), 1)
+            for key in ('import_ms', 'first_response_ms', 'process_ms')
+        }
+        result.update(
+            first_response_ms_max=round(max(sample['first_response_ms'] for sample in samples), 1),
+            status=samples[-1]['status'],
+            modules=samples[-1]['modules'],
+            numpy_loaded=samples[-1]['numpy'],
+        )
+        report['profiles'][profile] = result
+    return report
+
+
+def write_report(report: dict, output) -> None:
+    # JSON-отчёт для --output команд benchmark_*
+    with open(output, 'w', encoding='utf-8') as fh:
+        json.dump(report, fh, indent=2, ensure_ascii=False)
+
+
+def compare(baseline: dict, report: dict, metric='p95_ms') -> list[tuple]:
+    # (сценарий, было, стало, изменение в %) по общим сценариям
+    rows = []
+    for name, result in report['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name, {}).get(metric)
+        after = result.get(metric)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before * 100 if before else 0.0
+        rows.append((name, before, after, round(change, 1)))
+    return rows
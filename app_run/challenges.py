@@ -0,0 +1,100 @@
+"""
+Челленджи как декларативные правила над AthleteStats.
+
+Правило срабатывает, когда метрика атлета пересекает порог. При остановке
+забега проверяются только пороги между значениями «до» и «после» (бинарный
+поиск по отсортированным порогам каждой метрики), поэтому время остановки
+не растёт с количеством правил. Награды пишутся одним bulk_create с
+ignore_conflicts по уникальному (athlete, full_name).
+"""
+from bisect import bisect_right
+
+from app_run import response_cache
+from app_run.models import AthleteStats, Challenge
+
+
+class Rule:
+    metric = None
+
+    def __init__(self, full_name, threshold):
+        self.full_name = full_name
+        self.threshold = threshold
+
+
+class FinishedRunsRule(Rule):
+    metric = 'finished_runs'
+
+
+class DistanceRule(Rule):
+    metric = 'total_distance'  # км
+
+
+RULES = [
+    FinishedRunsRule("Сделай 10 Забегов!", 10),
+    DistanceRule("Пробеги 50 километров!", 50),
+]
+
+
+class RuleSet:
+    def __init__(self, rules):
+        self.by_metric = {}
+        for rule in sorted(rules, key=lambda r: r.threshold):
+            self.by_metric.setdefault(rule.metric, []).append(rule)
+        self.thresholds = {
+            metric: [rule.threshold for rule in metric_rules]
+            for metric, metric_rules in self.by_metric.items()
+        }
+
+    def crossed(self, before, after) -> list[str]:
+        # правила с порогом в (before, after]; before=None - все достигнутые пороги
+        names = []
+        for metric, thresholds in self.thresholds.items():
+            low = bisect_right(thresholds, before[metric]) if before is not None else 0
+            high = bisect_right(thresholds, after[metric])
+            names.extend(rule.full_name for rule in self.by_metric[metric][low:high])
+        return names
+
+    def reached(self, stats) -> list[str]:
+        return self.crossed(None, stats)
+
+
+default_rules = RuleSet(RULES)
+
+
+def award(athlete_id, names) -> None:
+    Challenge.objects.bulk_create(
+        [Challenge(athlete_id=athlete_id, full_name=name) for name in names],
+        ignore_conflicts=True,
+    )
+    response_cache.bump('challenges', athlete_id)
+
+
+def award_for_stats_delta(athlete_id, before, after, rules=default_rules) -> list[str]:
+    names = rules.crossed(before, after)
+    if names:
+        award(athlete_id, names)
+    return names
+
+
+def backfill(rules=default_rules, chunk_size=1000) -> int:
+    # пересмотр всех атлетов пачками по id, например после добавления правила;
+    # возвращает количество проверенных атлетов
+    processed = 0
+    last_id = 0
+    fields = ['user_id'] + list(rules.thresholds)
+    while True:
+        chunk = list(
+            AthleteStats.objects.filter(user_id__gt=last_id).order_by('user_id').values(*fields)[:chunk_size]
+        )
+        if not chunk:
+            return processed
+        challenges = [
+            Challenge(athlete_id=stats['user_id'], full_name=name)
+            for stats in chunk
+            for name in rules.reached(stats)
+        ]
+        Challenge.objects.bulk_create(challenges, ignore_conflicts=True, batch_size=chunk_size)
+        if challenges:
+            response_cache.bump('challenges', *{challenge.athlete_id for challenge in challenges})
+        processed += len(chunk)
+        last_id = chunk[-1]['user_id']
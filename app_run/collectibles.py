@@ -0,0 +1,26 @@
+from django.db.models import Q
+
+from app_run import geohash
+from app_run.models import CollectibleItem
+
+
+def items_in_bbox(min_lat, min_lon, max_lat, max_lon):
+    # кандидаты по диапазонам geohash (btree-индекс), затем точный фильтр по координатам
+    cells = Q()
+    for prefix in geohash.cover_bbox(min_lat, min_lon, max_lat, max_lon):
+        low, high = geohash.prefix_range(prefix)
+        cells |= Q(geohash__gte=low, geohash__lt=high) if high is not None else Q(geohash__gte=low)
+
+    lon_filter = Q(longitude__gte=min_lon, longitude__lte=max_lon)
+    if min_lon > max_lon:
+        lon_filter = Q(longitude__gte=min_lon) | Q(longitude__lte=max_lon)
+    return CollectibleItem.objects.filter(cells, lon_filter, latitude__gte=min_lat, latitude__lte=max_lat)
+
+
+def items_near(latitude, longitude, radius):
+    # предметы в радиусе radius метров, по возрастанию id
+    candidates = items_in_bbox(*geohash.radius_bbox(latitude, longitude, radius)).order_by('id')
+    return [
+        item for item in candidates
+        if geohash.haversine(latitude, longitude, item.latitude, item.longitude) <= radius
+    ]
@@ -0,0 +1,160 @@
+"""
+Векторный расчёт дистанции трека.
+
+Координаты забега загружаются одним запросом в массив NumPy формы (n, 2)
+(широта, долгота в градусах), длины всех сегментов считаются за один проход.
+
+Методы и погрешность относительно geopy.distance.geodesic (эллипсоид WGS-84):
+
+* ``vincenty`` - векторная обратная задача Винсенти на WGS-84. Погрешность
+  формулы не превышает 0.5 мм на сегмент, т.е. после округления до метров
+  результат совпадает с geodesic. Пары, для которых итерация не сошлась
+  (почти антиподальные точки), досчитываются точным алгоритмом Карни.
+* ``haversine`` - сфера среднего радиуса 6371.0088 км. Относительная
+  погрешность до 0.56% (зависит от широты и направления сегмента),
+  зато примерно в 10 раз быстрее Винсенти.
+* ``karney`` - точный алгоритм Карни (geographiclib) для каждой пары,
+  без векторизации. Эталон для сверки, в горячем пути не используется.
+"""
+import numpy as np
+from django.conf import settings
+
+from app_run.models import Position
+from app_run.track_storage import load_stored_track
+
+HAVERSINE = 'haversine'
+VINCENTY = 'vincenty'
+KARNEY = 'karney'
+METHODS = (HAVERSINE, VINCENTY, KARNEY)
+
+# WGS-84
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = (1 - WGS84_F) * WGS84_A
+MEAN_EARTH_RADIUS = 6371008.8
+
+VINCENTY_MAX_ITERATIONS = 200
+VINCENTY_TOLERANCE = 1e-12
+
+
+def load_track(run_id) -> np.ndarray:
+    # упакованный трек завершённого забега, если он есть
+    stored = load_stored_track(run_id)
+    if stored is not None:
+        return stored[1]
+    # иначе values_list без создания моделей, порядок точек - по id
+    rows = Position.objects.filter(run_id=run_id).order_by('id').values_list('latitude', 'longitude')
+    return as_track(list(rows))
+
+
+def as_track(points) -> np.ndarray:
+    track = np.asarray(points, dtype=np.float64)
+    if track.size == 0:
+        return np.empty((0, 2), dtype=np.float64)
+    return track.reshape(-1, 2)
+
+
+def haversine_segments(track: np.ndarray) -> np.ndarray:
+    lat = np.radians(track[:, 0])
+    lon = np.radians(track[:, 1])
+    dlat = np.diff(lat)
+    dlon = np.diff(lon)
+    h = np.sin(dlat / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(dlon / 2) ** 2
+    return 2 * MEAN_EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def vincenty_segments(track: np.ndarray) -> np.ndarray:
+    lat = np.radians(track[:, 0])
+    lon = np.radians(track[:, 1])
+    f = WGS84_F
+
+    u1 = np.arctan((1 - f) * np.tan(lat[:-1]))
+    u2 = np.arctan((1 - f) * np.tan(lat[1:]))
+    sin_u1, cos_u1 = np.sin(u1), np.cos(u1)
+    sin_u2, cos_u2 = np.sin(u2), np.cos(u2)
+    big_l = np.diff(lon)
+
+    lam = big_l.copy()
+    active = np.ones(big_l.shape, dtype=bool)
+    sin_sigma = cos_sigma = sigma = cos_sq_alpha = cos_2sigma_m = None
+
+    for _ in range(VINCENTY_MAX_ITERATIONS):
+        sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+        sin_sigma = np.hypot(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+        cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+        sigma = np.arctan2(sin_sigma, cos_sigma)
+
+        # совпадающие точки дают sin_sigma == 0
+        safe_sin_sigma = np.where(sin_sigma == 0, 1.0, sin_sigma)
+        sin_alpha = cos_u1 * cos_u2 * sin_lam / safe_sin_sigma
+        cos_sq_alpha = 1 - sin_alpha ** 2
+        # сегмент по экватору даёт cos_sq_alpha == 0
+        safe_cos_sq_alpha = np.where(cos_sq_alpha == 0, 1.0, cos_sq_alpha)
+        cos_2sigma_m = np.where(
+            cos_sq_alpha == 0, 0.0, cos_sigma - 2 * sin_u1 * sin_u2 / safe_cos_sq_alpha
+        )
+        c = f / 16 * cos_sq_alpha * (4 + f * (4 - 3 * cos_sq_alpha))
+        lam_next = big_l + (1 - c) * f * sin_alpha * (
+            sigma + c * sin_sigma * (cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2))
+        )
+        converged = np.abs(lam_next - lam) <= VINCENTY_TOLERANCE
+        lam = np.where(active, lam_next, lam)
+        active &= ~converged
+        if not active.any():
+            break
+
+    u_sq = cos_sq_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    a_coef = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    b_coef = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = b_coef * sin_sigma * (
+        cos_2sigma_m + b_coef / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+            - b_coef / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)
+        )
+    )
+    segments = WGS84_B * a_coef * (sigma - delta_sigma)
+    segments = np.where(sin_sigma == 0, 0.0, segments)
+
+    if active.any():
+        # итерация не сошлась - точный расчёт только для этих пар
+        idx = np.nonzero(active)[0]
+        segments[idx] = karney_pairs(track[idx], track[idx + 1])
+    return segments
+
+
+def karney_pairs(start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    from geographiclib.geodesic import Geodesic
+
+    geod = Geodesic.WGS84
+    return np.array(
+        [
+            geod.Inverse(lat1, lon1, lat2, lon2, Geodesic.DISTANCE)['s12']
+            for (lat1, lon1), (lat2, lon2) in zip(start, end)
+        ],
+        dtype=np.float64,
+    )
+
+
+def karney_segments(track: np.ndarray) -> np.ndarray:
+    return karney_pairs(track[:-1], track[1:])
+
+
+SEGMENT_FUNCTIONS = {
+    HAVERSINE: haversine_segments,
+    VINCENTY: vincenty_segments,
+    KARNEY: karney_segments,
+}
+
+
+def segment_lengths(track: np.ndarray, method: str = None) -> np.ndarray:
+    # длины сегментов в метрах
+    method = method or settings.RUN_DISTANCE_METHOD
+    if method not in SEGMENT_FUNCTIONS:
+        raise ValueError(f"Unknown distance method: {method!r}. Expected one of {METHODS}.")
+    if len(track) < 2:
+        return np.empty(0, dtype=np.float64)
+    return SEGMENT_FUNCTIONS[method](track)
+
+
+def track_distance_km(track: np.ndarray, method: str = None) -> float:
+    return float(segment_lengths(track, method).sum()) / 1000
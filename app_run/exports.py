@@ -0,0 +1,84 @@
+"""
+Потоковая выгрузка трека забега в GeoJSON и GPX.
+
+Точки читаются серверным курсором (iterator(chunk_size=...)) или из упакованного
+трека и отдаются кусками, поэтому память не зависит от длины забега.
+"""
+import zlib
+
+from django.conf import settings
+
+from app_run.models import Position
+from app_run.track_storage import format_coordinate, stored_track_data, unpack_track
+
+CONTENT_TYPES = {
+    'geojson': 'application/geo+json',
+    'gpx': 'application/gpx+xml',
+}
+
+
+def iter_track_points(run_id, chunk_size=None):
+    # (широта, долгота) строками с 4 знаками, в порядке id позиций
+    chunk_size = chunk_size or settings.TRACK_EXPORT_CHUNK_SIZE
+    data = stored_track_data(run_id)
+    if data is not None:
+        _, scaled = unpack_track(data)
+        for lat, lon in scaled.tolist():
+            yield format_coordinate(lat), format_coordinate(lon)
+        return
+
+    points = Position.objects.filter(run_id=run_id).order_by('id').values_list('latitude', 'longitude')
+    for lat, lon in points.iterator(chunk_size=chunk_size):
+        yield f'{lat:f}', f'{lon:f}'
+
+
+def _batched(strings, size):
+    batch = []
+    for value in strings:
+        batch.append(value)
+        if len(batch) >= size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def geojson_chunks(run):
+    yield (
+        '{"type":"Feature","properties":'
+        f'{{"run":{run.id},"athlete":{run.athlete_id},"status":"{run.status}","distance":{run.distance}}},'
+        '"geometry":{"type":"LineString","coordinates":['
+    )
+    yield from _batched(_geojson_points(run.id), settings.TRACK_EXPORT_CHUNK_SIZE)
+    yield ']}}'
+
+
+def _geojson_points(run_id):
+    separator = ''
+    for lat, lon in iter_track_points(run_id):
+        yield f'{separator}[{lon},{lat}]'
+        separator = ','
+
+
+def gpx_chunks(run):
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<gpx version="1.1" creator="project_run" xmlns="http://www.topografix.com/GPX/1/1">'
+        f'<trk><name>Run {run.id}</name><trkseg>'
+    )
+    points = (f'<trkpt lat="{lat}" lon="{lon}"/>' for lat, lon in iter_track_points(run.id))
+    yield from _batched(points, settings.TRACK_EXPORT_CHUNK_SIZE)
+    yield '</trkseg></trk></gpx>\n'
+
+
+def track_chunks(run, fmt):
+    return geojson_chunks(run) if fmt == 'geojson' else gpx_chunks(run)
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 - формат gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,110 @@
+"""
+Быстрое чтение для list-эндпоинтов: строки из .values() без экземпляров моделей
+и без полей DRF. Вывод совпадает с соответствующим ModelSerializer байт в байт
+(проверяется тестами), порядок ключей берётся из самого сериализатора.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+from app_run.serializers import RunSerializer, UserSerializer, PositionSerializer
+
+
+def format_datetime(value):
+    # как serializers.DateTimeField при USE_TZ и ISO 8601
+    value = timezone.localtime(value).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def decimal_formatter(decimal_places):
+    # как serializers.DecimalField с COERCE_DECIMAL_TO_STRING
+    quantum = Decimal(1).scaleb(-decimal_places)
+
+    def format_decimal(value):
+        return '{:f}'.format(value.quantize(quantum, rounding=ROUND_HALF_UP))
+    return format_decimal
+
+
+class FastListSerializer:
+    serializer_class = None
+    # поле ответа -> (колонка .values() или кортеж (поле, колонка) для вложенного объекта, преобразование)
+    columns = {}
+
+    def __init__(self):
+        names = list(self.serializer_class().fields)
+        if set(names) != set(self.columns):
+            raise ImproperlyConfigured(
+                f'{type(self).__name__} is out of sync with {self.serializer_class.__name__}: '
+                f'{sorted(set(names) ^ set(self.columns))}'
+            )
+        self.fields = [(name,) + self.columns[name] for name in names]
+
+    def values(self, queryset):
+        sources = []
+        for _, source, _ in self.fields:
+            if isinstance(source, tuple):
+                sources.extend(column for _, column in source)
+            else:
+                sources.append(source)
+        return queryset.values(*dict.fromkeys(sources))
+
+    def to_representation(self, rows) -> list:
+        data = []
+        for row in rows:
+            item = {}
+            for name, source, convert in self.fields:
+                if isinstance(source, tuple):
+                    item[name] = {nested_name: row[column] for nested_name, column in source}
+                    continue
+                value = row[source]
+                item[name] = convert(value) if convert is not None and value is not None else value
+            data.append(item)
+        return data
+
+
+class FastRunSerializer(FastListSerializer):
+    serializer_class = RunSerializer
+    columns = {
+        'id': ('id', None),
+        'athlete_data': ((
+            ('id', 'athlete_id'),
+            ('username', 'athlete__username'),
+            ('last_name', 'athlete__last_name'),
+            ('first_name', 'athlete__first_name'),
+        ), None),
+        'created_at': ('created_at', format_datetime),
+        'comment': ('comment', None),
+        'status': ('status', None),
+        'distance': ('distance', float),
+        'finished_at': ('finished_at', format_datetime),
+        'running_distance': ('running_distance', float),
+        'athlete': ('athlete_id', None),
+        'last_position': ('last_position_id', None),
+        'summary': ('summary', None),
+    }
+
+
+class FastUserSerializer(FastListSerializer):
+    serializer_class = UserSerializer
+    columns = {
+        'id': ('id', None),
+        'date_joined': ('date_joined', format_datetime),
+        'username': ('username', None),
+        'last_name': ('last_name', None),
+        'first_name': ('first_name', None),
+        'type': ('is_staff', lambda is_staff: 'coach' if is_staff else 'athlete'),
+        'runs_finished': ('runs_finished', int),
+    }
+
+
+class FastPositionSerializer(FastListSerializer):
+    serializer_class = PositionSerializer
+    columns = {
+        'id': ('id', None),
+        'run': ('run_id', None),
+        'latitude': ('latitude', decimal_formatter(4)),
+        'longitude': ('longitude', decimal_formatter(4)),
+    }
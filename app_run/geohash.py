@@ -0,0 +1,105 @@
+"""
+Geohash для пространственного индекса без PostGIS.
+
+Ячейка geohash - префикс строки, поэтому «точки внутри ячейки» - это
+диапазон [prefix, следующий префикс) по обычному btree-индексу (SQLite и PostgreSQL).
+Верхняя граница - префикс с последним символом, увеличенным в алфавите base32:
+в нём только цифры и строчные латинские буквы, и их порядок одинаков и при
+побайтовом сравнении (SQLite, COLLATE "C"), и в локалях PostgreSQL вроде
+en_US.UTF-8 (в отличие от '~', который там сортируется раньше цифр и букв).
+Прямоугольник покрывается небольшим набором ячеек подходящей точности,
+точная фильтрация по расстоянию выполняется уже над найденными строками.
+"""
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION = 9  # ячейка ~4.8 x 4.8 м, точность хранимого значения
+MAX_COVER_CELLS = 16
+EARTH_RADIUS = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+
+def _bits(precision):
+    total = precision * 5
+    return (total + 1) // 2, total // 2  # бит долготы, бит широты
+
+
+def _index(value, low, high, bits):
+    cells = 1 << bits
+    return min(cells - 1, max(0, int((value - low) / (high - low) * cells)))
+
+
+def _encode_indices(lon_index, lat_index, precision):
+    lon_bits, lat_bits = _bits(precision)
+    code = 0
+    # биты чередуются начиная с долготы
+    for i in range(precision * 5):
+        if i % 2 == 0:
+            lon_bits -= 1
+            bit = (lon_index >> lon_bits) & 1
+        else:
+            lat_bits -= 1
+            bit = (lat_index >> lat_bits) & 1
+        code = (code << 1) | bit
+    return ''.join(BASE32[(code >> shift) & 31] for shift in range((precision - 1) * 5, -1, -5))
+
+
+def encode(latitude, longitude, precision=PRECISION) -> str:
+    lon_bits, lat_bits = _bits(precision)
+    return _encode_indices(
+        _index(longitude, -180.0, 180.0, lon_bits),
+        _index(latitude, -90.0, 90.0, lat_bits),
+        precision,
+    )
+
+
+def prefix_range(prefix) -> tuple[str, str | None]:
+    # [нижняя, верхняя) граница строк с этим префиксом; None - сверху не ограничено ('zzz...')
+    stripped = prefix.rstrip(BASE32[-1])
+    if not stripped:
+        return prefix, None
+    return prefix, stripped[:-1] + BASE32[BASE32.index(stripped[-1]) + 1]
+
+
+def cover_bbox(min_lat, min_lon, max_lat, max_lon, max_cells=MAX_COVER_CELLS) -> list[str]:
+    # набор префиксов, покрывающих прямоугольник; min_lon > max_lon - переход через 180-й меридиан
+    if min_lon > max_lon:
+        return cover_bbox(min_lat, min_lon, max_lat, 180.0, max_cells) + \
+            cover_bbox(min_lat, -180.0, max_lat, max_lon, max_cells)
+
+    best = None
+    for precision in range(1, PRECISION + 1):
+        lon_bits, lat_bits = _bits(precision)
+        lon_range = (_index(min_lon, -180.0, 180.0, lon_bits), _index(max_lon, -180.0, 180.0, lon_bits))
+        lat_range = (_index(min_lat, -90.0, 90.0, lat_bits), _index(max_lat, -90.0, 90.0, lat_bits))
+        cells = (lon_range[1] - lon_range[0] + 1) * (lat_range[1] - lat_range[0] + 1)
+        if best is not None and cells > max_cells:
+            break
+        best = precision, lon_range, lat_range
+
+    precision, (lon_from, lon_to), (lat_from, lat_to) = best
+    return [
+        _encode_indices(lon_index, lat_index, precision)
+        for lon_index in range(lon_from, lon_to + 1)
+        for lat_index in range(lat_from, lat_to + 1)
+    ]
+
+
+def radius_bbox(latitude, longitude, radius) -> tuple[float, float, float, float]:
+    # прямоугольник, описанный вокруг круга радиусом radius метров
+    dlat = radius / METERS_PER_DEGREE
+    min_lat, max_lat = max(-90.0, latitude - dlat), min(90.0, latitude + dlat)
+    cos_lat = min(math.cos(math.radians(min_lat)), math.cos(math.radians(max_lat)))
+    if min_lat <= -90.0 or max_lat >= 90.0 or cos_lat <= 0 or radius / (METERS_PER_DEGREE * cos_lat) >= 180:
+        return min_lat, -180.0, max_lat, 180.0
+    dlon = radius / (METERS_PER_DEGREE * cos_lat)
+    min_lon = (longitude - dlon + 180) % 360 - 180
+    max_lon = (longitude + dlon + 180) % 360 - 180
+    return min_lat, min_lon, max_lat, max_lon
+
+
+def haversine(lat1, lon1, lat2, lon2) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    h = math.sin((phi2 - phi1) / 2) ** 2 + \
+        math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(min(1.0, h)))
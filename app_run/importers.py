@@ -0,0 +1,167 @@
+import csv
+import io
+from itertools import islice
+
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.fields import empty
+
+from app_run.models import CollectibleItem
+from app_run.pickups import items_changed
+from app_run.serializers import CollectibleItemSerializer
+
+HEADER_MAP = {
+    "name": "name",
+    "uid": "uid",
+    "value": "value",
+    "latitude": "latitude",
+    "longitude": "longitude",
+    "url": "picture",
+}
+
+
+def clean_value(key: str, value):
+    if value is None:
+        return None
+
+    # чистимо строки
+    if isinstance(value, str):
+        v = value.strip()
+
+        # типова проблема з Excel/CSV-експортом: зайвий ; або лапки
+        v = v.strip('";\' ')
+        if v.endswith(";"):
+            v = v[:-1].strip()
+
+        value = v
+
+    # приводимо типи
+    if key in ("latitude", "longitude"):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return value  # хай впаде валідація
+
+    if key == "value":
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return value
+
+    return value
+
+
+def iter_rows(uploaded_file):
+    # построчное чтение: xlsx в режиме read_only (без DOM всей книги) или csv
+    name = (getattr(uploaded_file, 'name', '') or '').lower()
+    content_type = getattr(uploaded_file, 'content_type', '') or ''
+    if name.endswith('.csv') or content_type in ('text/csv', 'application/csv'):
+        yield from _iter_csv_rows(uploaded_file)
+    else:
+        yield from _iter_xlsx_rows(uploaded_file)
+
+
+def _iter_xlsx_rows(uploaded_file):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        yield from wb.active.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def _iter_csv_rows(uploaded_file):
+    text = io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', newline='')
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    for row in csv.reader(text, dialect):
+        # пустые ячейки csv - как пустые ячейки xlsx
+        yield tuple(v if v != '' else None for v in row)
+
+
+class RowValidator:
+    # правила CollectibleItemSerializer без создания сериализатора на каждую строку
+    def __init__(self):
+        self.serializer = CollectibleItemSerializer()
+        self.fields = {
+            name: field for name, field in self.serializer.fields.items() if not field.read_only
+        }
+
+    def validate(self, data: dict):
+        validated = {}
+        for name, field in self.fields.items():
+            try:
+                value = field.run_validation(data.get(name, empty))
+                validate_method = getattr(self.serializer, f'validate_{name}', None)
+                if validate_method is not None:
+                    value = validate_method(value)
+            except serializers.ValidationError:
+                return None
+            validated[name] = value
+        return validated
+
+
+def import_collectible_items(uploaded_file, batch_size=None, progress=None) -> list:
+    """
+    Импорт предметов из xlsx/csv. Возвращает невалидные строки "как есть"
+    (list of lists). progress(processed, rejected) вызывается после каждой пачки.
+    """
+    batch_size = batch_size or settings.COLLECTIBLE_IMPORT_BATCH_SIZE
+    rows = iter_rows(uploaded_file)
+
+    # читаємо заголовки
+    raw_headers = next(rows, None) or ()
+    raw_headers = [h if h is not None else "" for h in raw_headers]
+
+    # будуємо список полів, у які будемо мапити колонки
+    mapped_fields = []
+    for h in raw_headers:
+        h_norm = str(h).strip().lower()
+        mapped_fields.append(HEADER_MAP.get(h_norm))  # може бути None, якщо колонка зайва/невідома
+
+    validator = RowValidator()
+    invalid_rows = []
+    processed = created = 0
+
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            break
+
+        items = []
+        for row in chunk:
+            # пропускаємо повністю пусті рядки
+            if row is None or all(v is None for v in row):
+                continue
+            processed += 1
+
+            # формуємо data лише по відомих колонках
+            data = {}
+            for field_name, cell_value in zip(mapped_fields, row):
+                if not field_name:
+                    continue
+                data[field_name] = clean_value(field_name, cell_value)
+
+            validated = validator.validate(data)
+            if validated is None:
+                # по ТЗ: повертаємо "сирий" рядок (list of lists)
+                invalid_rows.append(list(row))
+                continue
+            item = CollectibleItem(**validated)
+            item.fill_geohash()
+            items.append(item)
+
+        CollectibleItem.objects.bulk_create(items, batch_size=batch_size)
+        created += len(items)
+        if progress is not None:
+            progress(processed, len(invalid_rows))
+
+    # каталог изменился: сетка предметов для сбора (app_run/pickups.py) перестроится
+    if created:
+        items_changed()
+    return invalid_rows
@@ -0,0 +1,77 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connection, transaction
+from django.utils import timezone
+
+from app_run.importers import import_collectible_items
+from app_run.models import ImportJob
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    # пул воркеров в процессе веб-сервера, без внешнего брокера
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMPORT_WORKERS,
+                thread_name_prefix='import-job',
+            )
+    return _executor
+
+
+def create_import_job(uploaded_file) -> ImportJob:
+    # файл сохраняем локально, обработка - вне запроса после коммита записи о задаче
+    upload_dir = Path(settings.IMPORT_UPLOAD_DIR)
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    file_name = os.path.basename(uploaded_file.name or 'upload')
+
+    job = ImportJob.objects.create(file_name=file_name)
+    path = upload_dir / f'{job.id}_{file_name}'
+    with open(path, 'wb') as destination:
+        for chunk in uploaded_file.chunks():
+            destination.write(chunk)
+    job.file_path = str(path)
+    job.save(update_fields=['file_path'])
+
+    transaction.on_commit(lambda: get_executor().submit(run_import_job, job.id))
+    return job
+
+
+def run_import_job(job_id) -> None:
+    job = ImportJob.objects.get(pk=job_id)
+    ImportJob.objects.filter(pk=job_id).update(status='running', started_at=timezone.now())
+
+    def progress(processed, rejected):
+        ImportJob.objects.filter(pk=job_id).update(rows_processed=processed, rows_rejected=rejected)
+
+    try:
+        with open(job.file_path, 'rb') as fh:
+            # importers определяет формат по исходному имени файла
+            invalid_rows = import_collectible_items(File(fh, name=job.file_name), progress=progress)
+    except Exception as exc:
+        logger.exception('Import job %s failed', job_id)
+        ImportJob.objects.filter(pk=job_id).update(
+            status='failed', error=str(exc), finished_at=timezone.now()
+        )
+    else:
+        ImportJob.objects.filter(pk=job_id).update(
+            status='finished', invalid_rows=invalid_rows, finished_at=timezone.now()
+        )
+    finally:
+        # загруженный файл удаляется и после ошибки импорта
+        try:
+            os.remove(job.file_path)
+        except FileNotFoundError:
+            pass
+        connection.close()
@@ -0,0 +1,168 @@
+"""
+Лидерборды по дистанции и количеству завершённых забегов.
+
+Неделя и месяц - таблица LeaderboardEntry (итоги атлета за период),
+«за всё время» - AthleteStats. Итоги обновляются в транзакции остановки
+забега, топ читается по индексу (период, начало периода, -метрика) и
+кешируется на LEADERBOARD_CACHE_TIMEOUT; версия доски меняется после
+каждого обновления. Ранг атлета - 1 + количество атлетов со строго большим
+значением метрики (COUNT по тому же индексу, без сортировки всей таблицы).
+"""
+import datetime
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import Coalesce, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from app_run.models import AthleteStats, LeaderboardEntry, Run
+
+WEEK = 'week'
+MONTH = 'month'
+ALL_TIME = 'all'
+PERIODS = (WEEK, MONTH, ALL_TIME)
+METRICS = {
+    'distance': 'total_distance',
+    'runs': 'finished_runs',
+}
+TRUNCATE = {WEEK: TruncWeek, MONTH: TruncMonth}
+
+
+def period_start(period, day: datetime.date):
+    if period == WEEK:
+        return day - datetime.timedelta(days=day.weekday())
+    if period == MONTH:
+        return day.replace(day=1)
+    return None
+
+
+def record_run(run: Run) -> None:
+    # вызывать в транзакции остановки забега, после AthleteStats (доска «за всё время»)
+    day = timezone.localdate(run.finished_at)
+    for period in TRUNCATE:
+        start = period_start(period, day)
+        entry, _ = LeaderboardEntry.objects.select_for_update().get_or_create(
+            athlete_id=run.athlete_id, period=period, period_start=start,
+        )
+        entry.finished_runs += 1
+        entry.total_distance += run.distance
+        entry.save(update_fields=['finished_runs', 'total_distance'])
+        invalidate(period, start)
+    invalidate(ALL_TIME, None)
+
+
+def rebuild_leaderboards(athlete_ids=None) -> int:
+    # полный пересчёт недельных и месячных итогов по таблице забегов
+    runs = Run.objects.filter(status='finished')
+    entries = LeaderboardEntry.objects.all()
+    if athlete_ids is not None:
+        runs = runs.filter(athlete_id__in=athlete_ids)
+        entries = entries.filter(athlete_id__in=athlete_ids)
+
+    new_entries = []
+    for period, truncate in TRUNCATE.items():
+        rows = runs.annotate(
+            start=truncate(Coalesce('finished_at', 'created_at'), output_field=DateField()),
+        ).values('athlete_id', 'start').annotate(finished_runs=Count('id'), total_distance=Sum('distance'))
+        new_entries.extend(
+            LeaderboardEntry(
+                athlete_id=row['athlete_id'], period=period, period_start=row['start'],
+                finished_runs=row['finished_runs'], total_distance=row['total_distance'],
+            )
+            for row in rows
+        )
+
+    if athlete_ids is None:
+        invalidate_all()
+    else:
+        # только доски периодов, где у этих атлетов были или появились итоги
+        boards = set(entries.values_list('period', 'period_start'))
+        boards.update((entry.period, entry.period_start) for entry in new_entries)
+        for period, start in boards:
+            invalidate(period, start)
+
+    entries.delete()
+    created = LeaderboardEntry.objects.bulk_create(new_entries, batch_size=1000)
+    return len(created)
+
+
+def board(period, day=None):
+    # queryset итогов периода: LeaderboardEntry или AthleteStats
+    if period == ALL_TIME:
+        return AthleteStats.objects.annotate(athlete_id=F('user_id')), 'user'
+    start = period_start(period, day or timezone.localdate())
+    return LeaderboardEntry.objects.filter(period=period, period_start=start), 'athlete'
+
+
+def top(period, metric, limit, day=None) -> list[dict]:
+    start = period_start(period, day or timezone.localdate())
+    key = f'leaderboard:{_version(period, start)}:{period}:{start}:{metric}:{limit}'
+    rows = cache.get(key)
+    if rows is None:
+        queryset, user_field = board(period, day)
+        field = METRICS[metric]
+        rows = list(
+            queryset.filter(**{f'{field}__gt': 0})
+            .order_by(f'-{field}', user_field)
+            .values('athlete_id', f'{user_field}__username', f'{user_field}__first_name',
+                    f'{user_field}__last_name', 'finished_runs', 'total_distance')[:limit]
+        )
+        rows = [_entry(row, user_field) for row in rows]
+        # ранг: одинаковые значения делят место (1, 2, 2, 4)
+        for index, row in enumerate(rows):
+            previous = rows[index - 1] if index else None
+            row['rank'] = previous['rank'] if previous and previous[field] == row[field] else index + 1
+        cache.set(key, rows, settings.LEADERBOARD_CACHE_TIMEOUT)
+    return rows
+
+
+def rank(athlete_id, period, metric, day=None):
+    # место атлета или None, если в периоде у него нет завершённых забегов
+    queryset, user_field = board(period, day)
+    field = METRICS[metric]
+    rows = queryset.filter(**{user_field: athlete_id}).values(
+        'athlete_id', f'{user_field}__username', f'{user_field}__first_name', f'{user_field}__last_name',
+        'finished_runs', 'total_distance',
+    )[:1]
+    row = next(iter(rows), None)
+    if row is None or not row[field]:
+        return None
+    entry = _entry(row, user_field)
+    entry['rank'] = queryset.filter(**{f'{field}__gt': row[field]}).count() + 1
+    return entry
+
+
+def _entry(row, user_field) -> dict:
+    return {
+        'athlete': row['athlete_id'],
+        'username': row[f'{user_field}__username'],
+        'first_name': row[f'{user_field}__first_name'],
+        'last_name': row[f'{user_field}__last_name'],
+        'finished_runs': row['finished_runs'],
+        'total_distance': round(row['total_distance'], 3),
+    }
+
+
+GENERATION_CACHE_KEY = 'leaderboard-generation'
+
+
+def _version_key(period, start) -> str:
+    return f'leaderboard-version:{period}:{start}'
+
+
+def _version(period, start) -> str:
+    # поколение меняет полный rebuild_leaderboards, версию доски - забеги и пересчёт атлетов
+    versions = cache.get_many([GENERATION_CACHE_KEY, _version_key(period, start)])
+    return f'{versions.get(GENERATION_CACHE_KEY)}.{versions.get(_version_key(period, start))}'
+
+
+def invalidate(period, start) -> None:
+    # после коммита: иначе параллельный запрос может закешировать доску без этого забега
+    transaction.on_commit(lambda: cache.set(_version_key(period, start), uuid.uuid4().hex, None))
+
+
+def invalidate_all() -> None:
+    transaction.on_commit(lambda: cache.set(GENERATION_CACHE_KEY, uuid.uuid4().hex, None))
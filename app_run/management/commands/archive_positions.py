@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app_run.archive import archive_positions
+
+
+class Command(BaseCommand):
+    help = 'Переносит точки давно завершённых забегов из Position в упакованный трек (RunTrack)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.POSITION_ARCHIVE_AFTER_DAYS,
+                            help='архивировать забеги, завершённые больше N дней назад')
+        parser.add_argument('--chunk-size', type=int, default=settings.POSITION_ARCHIVE_CHUNK_SIZE,
+                            help='строк Position в одном DELETE')
+        parser.add_argument('--limit', type=int, help='не больше N забегов за запуск')
+
+    def handle(self, *args, days=None, chunk_size=None, limit=None, **options):
+        def progress(run_id, archived, deleted):
+            if archived % 100 == 0:
+                self.stdout.write(f'archived runs: {archived} (last id {run_id}), deleted positions: {deleted}')
+
+        archived, deleted = archive_positions(days, chunk_size, limit, progress)
+        self.stdout.write(self.style.SUCCESS(f'archived runs: {archived}, deleted positions: {deleted}'))
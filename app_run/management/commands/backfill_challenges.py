@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from app_run.challenges import backfill
+
+
+class Command(BaseCommand):
+    help = 'Проверяет правила челленджей для всех атлетов и выдаёт недостающие награды'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='атлетов за один проход')
+
+    def handle(self, *args, chunk_size=1000, **options):
+        processed = backfill(chunk_size=chunk_size)
+        self.stdout.write(self.style.SUCCESS(f'athletes checked: {processed}'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from app_run.models import Run
+from app_run.summaries import backfill_summaries
+
+
+class Command(BaseCommand):
+    help = 'Считает сводку (Run.summary) для завершённых забегов без неё'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='параллельных потоков')
+        parser.add_argument('--batch-size', type=int, default=200, help='забегов в одной пачке')
+        parser.add_argument('--force', action='store_true', help='пересчитать и уже посчитанные сводки')
+
+    def handle(self, *args, workers=4, batch_size=200, force=False, **options):
+        runs = Run.objects.filter(status='finished')
+        if not force:
+            runs = runs.filter(summary__isnull=True)
+        run_ids = list(runs.order_by('id').values_list('id', flat=True))
+
+        def progress(done, total):
+            self.stdout.write(f'summaries {done}/{total}')
+
+        count = backfill_summaries(run_ids, workers=workers, batch_size=batch_size, progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'run summaries: {count}'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app_run.benchmarks import SkipScenario, cold_start_benchmark, write_report
+
+DEFAULT_PROFILES = ['project_run.settings.production', 'project_run.settings.serverless']
+
+
+class Command(BaseCommand):
+    help = 'Замеряет холодный старт: время от импорта приложения до первого ответа для модулей настроек'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', action='append', dest='profiles',
+                            help='модуль настроек (можно несколько), по умолчанию production и serverless')
+        parser.add_argument('--url', default='/api/company_details/', help='URL первого запроса')
+        parser.add_argument('--runs', type=int, default=10, help='запусков процесса на профиль')
+        parser.add_argument('--output', help='путь для JSON-отчёта')
+
+    def handle(self, *args, profiles=None, url='/api/company_details/', runs=10, output=None, **options):
+        try:
+            report = cold_start_benchmark(profiles or DEFAULT_PROFILES, url=url, runs=runs)
+        except SkipScenario as exc:
+            raise CommandError(str(exc))
+
+        for profile, result in report['profiles'].items():
+            self.stdout.write(
+                f'{profile:<36} import={result["import_ms_p50"]:>7.1f}ms '
+                f'first_response={result["first_response_ms_p50"]:>7.1f}ms '
+                f'process={result["process_ms_p50"]:>7.1f}ms modules={result["modules"]} '
+                f'numpy={result["numpy_loaded"]} status={result["status"]}'
+            )
+
+        if output:
+            write_report(report, output)
+            self.stdout.write(self.style.SUCCESS(f'report written to {output}'))
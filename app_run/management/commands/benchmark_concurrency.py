@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app_run.benchmarks import CONCURRENCY_MODES, SkipScenario, concurrency_benchmark, write_report
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает пропускную способность записи точек под WSGI и ASGI при множестве медленных клиентов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', action='append', dest='modes', choices=list(CONCURRENCY_MODES),
+                            help='режим (можно несколько), по умолчанию все')
+        parser.add_argument('--clients', type=int, default=50, help='одновременных клиентов')
+        parser.add_argument('--requests-per-client', type=int, default=20)
+        parser.add_argument('--threads', type=int, default=8, help='потоков WSGI-воркера')
+        parser.add_argument('--client-delay-ms', type=float, default=20,
+                            help='сколько медленный клиент держит соединение на каждый запрос')
+        parser.add_argument('--output', help='путь для JSON-отчёта')
+
+    def handle(self, *args, modes=None, clients=50, requests_per_client=20, threads=8, client_delay_ms=20,
+               output=None, **options):
+        try:
+            report = concurrency_benchmark(
+                modes, clients=clients, requests_per_client=requests_per_client,
+                threads=threads, client_delay_ms=client_delay_ms,
+            )
+        except SkipScenario as exc:
+            raise CommandError(str(exc))
+
+        for mode, result in report['modes'].items():
+            self.stdout.write(
+                f'{mode:<10} {result["requests_per_second"]:>8.1f} req/s p50={result["p50_ms"]:>8.2f}ms '
+                f'p99={result["p99_ms"]:>8.2f}ms first_response_p99={result["first_response_p99_ms"]:>9.2f}ms '
+                f'errors={result["errors"]}'
+            )
+
+        if output:
+            write_report(report, output)
+            self.stdout.write(self.style.SUCCESS(f'report written to {output}'))
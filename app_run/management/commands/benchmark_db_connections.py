@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app_run.benchmarks import DB_CONNECTION_MODES, SkipScenario, connection_benchmark, write_report
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает req/s и p99 коротких запросов записи без переиспользования соединений, ' \
+           'с постоянными соединениями и с пулом (нужен локальный PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', action='append', dest='modes', choices=list(DB_CONNECTION_MODES),
+                            help='режим (можно несколько), по умолчанию все')
+        parser.add_argument('--threads', type=int, default=8, help='потоков WSGI-воркера')
+        parser.add_argument('--requests-per-thread', type=int, default=50)
+        parser.add_argument('--output', help='путь для JSON-отчёта')
+
+    def handle(self, *args, modes=None, threads=8, requests_per_thread=50, output=None, **options):
+        try:
+            report = connection_benchmark(modes, threads=threads, requests_per_thread=requests_per_thread)
+        except SkipScenario as exc:
+            raise CommandError(str(exc))
+
+        for mode, result in report['modes'].items():
+            if 'skipped' in result:
+                self.stdout.write(f'{mode:<12} skipped: {result["skipped"]}')
+                continue
+            self.stdout.write(
+                f'{mode:<12} {result["requests_per_second"]:>8.1f} req/s p50={result["p50_ms"]:>8.2f}ms '
+                f'p99={result["p99_ms"]:>8.2f}ms errors={result["errors"]}'
+            )
+
+        if output:
+            write_report(report, output)
+            self.stdout.write(self.style.SUCCESS(f'report written to {output}'))
@@ -0,0 +1,44 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app_run.benchmarks import SCENARIOS, compare, run_benchmarks, write_report
+
+
+class Command(BaseCommand):
+    help = 'Замеряет горячие эндпоинты (перцентили задержки, число SQL-запросов, пик памяти) и пишет JSON-отчёт'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=sorted(SCENARIOS),
+                            help='сценарий (можно несколько), по умолчанию все')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--output', help='путь для JSON-отчёта')
+        parser.add_argument('--compare', dest='baseline', help='JSON-отчёт предыдущего прогона для сравнения')
+
+    def handle(self, *args, scenarios=None, iterations=20, warmup=3, output=None, baseline=None, **options):
+        def log(name, result):
+            if 'skipped' in result:
+                self.stdout.write(f'{name:<28} skipped: {result["skipped"]}')
+                return
+            self.stdout.write(
+                f'{name:<28} p50={result["p50_ms"]:>9.2f}ms p95={result["p95_ms"]:>9.2f}ms '
+                f'p99={result["p99_ms"]:>9.2f}ms queries={result["queries_mean"]:>6} '
+                f'peak={result["peak_memory_kb"]:>9.1f}KB'
+            )
+
+        report = run_benchmarks(scenarios, iterations=iterations, warmup=warmup, log=log)
+
+        if output:
+            write_report(report, output)
+            self.stdout.write(self.style.SUCCESS(f'report written to {output}'))
+
+        if baseline:
+            try:
+                with open(baseline, encoding='utf-8') as fh:
+                    baseline_report = json.load(fh)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'cannot read baseline report: {exc}')
+            self.stdout.write(f'p95 vs {baseline_report.get("meta", {}).get("commit")}:')
+            for name, before, after, change in compare(baseline_report, report):
+                self.stdout.write(f'  {name:<28} {before:>9.2f} -> {after:>9.2f} ms ({change:+.1f}%)')
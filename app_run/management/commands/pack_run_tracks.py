@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from app_run.models import Run
+from app_run.track_storage import store_run_track
+
+
+class Command(BaseCommand):
+    help = 'Упаковывает треки завершённых забегов в компактное хранилище'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='забегов за один проход')
+        parser.add_argument('--force', action='store_true', help='перепаковать уже упакованные треки')
+
+    def handle(self, *args, batch_size=500, force=False, **options):
+        runs = Run.objects.filter(status='finished')
+        if not force:
+            runs = runs.filter(track__isnull=True)
+        else:
+            # у заархивированных забегов строк Position нет, трек из них не пересобрать
+            runs = runs.exclude(track__archived_at__isnull=False)
+        run_ids = list(runs.order_by('id').values_list('id', flat=True))
+
+        for start in range(0, len(run_ids), batch_size):
+            for run_id in run_ids[start:start + batch_size]:
+                store_run_track(run_id)
+            self.stdout.write(f'packed {min(start + batch_size, len(run_ids))}/{len(run_ids)}')
+
+        self.stdout.write(self.style.SUCCESS(f'packed runs: {len(run_ids)}'))
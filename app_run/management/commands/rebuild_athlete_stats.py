@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app_run.stats import rebuild_athlete_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает таблицу AthleteStats по завершённым забегам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--athlete', type=int, action='append', dest='athlete_ids', help='id атлета (можно несколько)')
+
+    def handle(self, *args, athlete_ids=None, **options):
+        with transaction.atomic():
+            count = rebuild_athlete_stats(athlete_ids)
+        self.stdout.write(self.style.SUCCESS(f'athlete stats rebuilt: {count}'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app_run.leaderboards import rebuild_leaderboards
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает недельные и месячные итоги лидербордов по завершённым забегам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--athlete', type=int, action='append', dest='athlete_ids', help='id атлета (можно несколько)')
+
+    def handle(self, *args, athlete_ids=None, **options):
+        with transaction.atomic():
+            count = rebuild_leaderboards(athlete_ids)
+        self.stdout.write(self.style.SUCCESS(f'leaderboard entries rebuilt: {count}'))
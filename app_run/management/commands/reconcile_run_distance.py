@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app_run.models import Run
+from app_run.tracking import lock_run, reconcile_run_distance, rebuild_running_distance
+
+
+class Command(BaseCommand):
+    help = 'Сверяет накопленную дистанцию забегов с полным пересчётом трека'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--run', type=int, action='append', dest='run_ids', help='id забега (можно несколько)')
+        parser.add_argument('--status', default='in_progress', help='статус проверяемых забегов')
+        parser.add_argument('--tolerance', type=float, default=settings.RUN_DISTANCE_RECONCILE_TOLERANCE, help='допуск, км')
+        parser.add_argument('--fix', action='store_true', help='пересчитать накопленную дистанцию у расходящихся забегов')
+
+    def handle(self, *args, run_ids=None, status=None, tolerance=None, fix=False, **options):
+        runs = Run.objects.filter(id__in=run_ids) if run_ids else Run.objects.filter(status=status)
+        checked = mismatched = 0
+        for run in runs.order_by('id').iterator():
+            checked += 1
+            incremental, full = reconcile_run_distance(run)
+            if abs(incremental - full) <= tolerance:
+                continue
+            mismatched += 1
+            self.stdout.write(f'run {run.id}: incremental={incremental:.6f} km, full={full:.6f} km')
+            if fix:
+                with transaction.atomic():
+                    rebuild_running_distance(lock_run(run.id))
+
+        self.stdout.write(self.style.SUCCESS(f'checked: {checked}, mismatched: {mismatched}'))
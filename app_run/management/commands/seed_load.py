@@ -0,0 +1,89 @@
+import random
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from app_run import leaderboards
+from app_run.distance import as_track, segment_lengths
+from app_run.models import Run, Position, CollectibleItem
+from app_run.stats import rebuild_athlete_stats
+from app_run.summaries import track_summary
+from app_run.track_storage import store_run_track
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими пользователями, забегами, позициями и предметами для нагрузочных замеров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='атлетов')
+        parser.add_argument('--coaches', type=int, default=10, help='тренеров')
+        parser.add_argument('--runs-per-user', type=int, default=20)
+        parser.add_argument('--positions-per-run', type=int, default=500)
+        parser.add_argument('--items', type=int, default=10000, help='предметов CollectibleItem')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default='load', help='префикс username, чтобы не пересекаться с реальными')
+
+    def handle(self, *args, users, coaches, runs_per_user, positions_per_run, items, seed, prefix, **options):
+        rng = np.random.default_rng(seed)
+        random.seed(seed)
+        center = np.array([55.7558, 37.6173])
+
+        with transaction.atomic():
+            created = User.objects.bulk_create([
+                User(username=f'{prefix}_{i}', first_name=f'Name{i}', last_name=f'Last{i}',
+                     is_staff=i < coaches, password='!')
+                for i in range(users + coaches)
+            ], batch_size=1000)
+            athletes = [user for user in created if not user.is_staff]
+
+            statuses = ['finished'] * 7 + ['in_progress'] * 2 + ['init']
+            now = timezone.now()
+            runs = Run.objects.bulk_create([
+                Run(athlete=athlete, comment=f'{prefix} run', status=random.choice(statuses))
+                for athlete in athletes
+                for _ in range(runs_per_user)
+            ], batch_size=1000)
+            self.stdout.write(f'users: {len(created)}, runs: {len(runs)}')
+
+            positions_total = 0
+            for run in runs:
+                if run.status == 'init' or positions_per_run == 0:
+                    continue
+                # случайное блуждание ~10 м на шаг
+                start = center + rng.normal(0, 0.05, 2)
+                track = np.round(start + np.cumsum(rng.normal(0, 0.0001, (positions_per_run, 2)), axis=0), 4)
+                positions = Position.objects.bulk_create(
+                    [Position(run=run, latitude=lat, longitude=lon) for lat, lon in track.tolist()],
+                    batch_size=2000,
+                )
+                positions_total += len(positions)
+                distance = float(segment_lengths(as_track(track)).sum()) / 1000
+                run.running_distance = distance
+                run.last_position = positions[-1]
+                if run.status == 'finished':
+                    run.distance = round(distance, 3)
+                    run.finished_at = now
+                run.save(update_fields=['running_distance', 'last_position', 'distance', 'finished_at'])
+                if run.status == 'finished':
+                    # как при остановке забега: упакованный трек и сводка
+                    run.summary = track_summary(store_run_track(run.id).data)
+                    run.save(update_fields=['summary'])
+            self.stdout.write(f'positions: {positions_total}')
+
+            coords = center + rng.uniform(-0.5, 0.5, (items, 2))
+            collectibles = []
+            for i, (lat, lon) in enumerate(coords.tolist()):
+                item = CollectibleItem(name=f'{prefix} item {i}', uid=f'{prefix}-{i}', latitude=lat, longitude=lon,
+                                       picture='https://example.com/item.png', value=random.randint(1, 100))
+                item.fill_geohash()
+                collectibles.append(item)
+            CollectibleItem.objects.bulk_create(collectibles, batch_size=2000)
+            self.stdout.write(f'collectible items: {items}')
+
+            rebuild_athlete_stats()
+            leaderboards.rebuild_leaderboards()
+
+        self.stdout.write(self.style.SUCCESS('seed complete'))
@@ -0,0 +1,267 @@
+"""
+Метрики запросов в памяти процесса: для каждого URL-шаблона время ответа,
+время в БД, количество SQL-запросов и размер ответа.
+
+Гистограммы накопительные (как принято в Prometheus, окна считает rate()),
+плюс скользящее окно METRICS_WINDOW_SECONDS, по которому отдаются квантили.
+Выдача - GET /api/_metrics/ в текстовом формате Prometheus (только для админов).
+METRICS_SAMPLE_RATE < 1 замеряет только долю запросов.
+"""
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+HISTOGRAMS = {
+    'request_duration_seconds': ('Время обработки запроса', DURATION_BUCKETS),
+    'db_duration_seconds': ('Суммарное время SQL-запросов за запрос', DURATION_BUCKETS),
+    'db_queries': ('Количество SQL-запросов за запрос', (1, 2, 3, 5, 10, 20, 50, 100, 500)),
+    'response_size_bytes': ('Размер тела ответа', (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)),
+}
+WINDOW_QUANTILES = (0.5, 0.9, 0.99)
+PREFIX = 'app_'
+
+
+class Histogram:
+    def __init__(self, buckets, window_seconds, window_slots):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последний - +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.slot_seconds = window_seconds / window_slots
+        self.slot_counts = [[0] * (len(buckets) + 1) for _ in range(window_slots)]
+        self.slot_ids = [None] * window_slots
+
+    def observe(self, value, now):
+        index = bisect_left(self.buckets, value)
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+        slot_id = int(now // self.slot_seconds)
+        slot = slot_id % len(self.slot_ids)
+        if self.slot_ids[slot] != slot_id:
+            self.slot_ids[slot] = slot_id
+            self.slot_counts[slot] = [0] * len(self.counts)
+        self.slot_counts[slot][index] += 1
+
+    def window_counts(self, now):
+        current = int(now // self.slot_seconds)
+        window = [0] * len(self.counts)
+        for slot_id, counts in zip(self.slot_ids, self.slot_counts):
+            if slot_id is not None and current - slot_id < len(self.slot_ids):
+                window = [a + b for a, b in zip(window, counts)]
+        return window
+
+    def window_quantile(self, q, now):
+        # оценка квантиля по границам корзин (линейная интерполяция внутри корзины)
+        counts = self.window_counts(now)
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}  # (имя, метки) -> Histogram
+        self.counters = {}  # (имя, метки) -> значение
+        self.counter_help = {}
+
+    def observe(self, name, labels, value, now=None):
+        now = time.time() if now is None else now
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(
+                    HISTOGRAMS[name][1], settings.METRICS_WINDOW_SECONDS, settings.METRICS_WINDOW_SLOTS
+                )
+            histogram.observe(value, now)
+
+    def increment(self, name, labels, value=1, help_text=''):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            if help_text:
+                self.counter_help.setdefault(name, help_text)
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def render(self, now=None) -> str:
+        now = time.time() if now is None else now
+        lines = []
+        with self.lock:
+            by_name = {}
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                by_name.setdefault(name, []).append((labels, histogram))
+            for name, series in by_name.items():
+                metric = PREFIX + name
+                lines.append(f'# HELP {metric} {HISTOGRAMS[name][0]}')
+                lines.append(f'# TYPE {metric} histogram')
+                for labels, histogram in series:
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{metric}_bucket{_labels(labels + (("le", _number(bound)),))} {cumulative}')
+                    lines.append(f'{metric}_sum{_labels(labels)} {_number(histogram.sum)}')
+                    lines.append(f'{metric}_count{_labels(labels)} {histogram.count}')
+
+                window_metric = f'{metric}_window'
+                lines.append(f'# HELP {window_metric} Квантили {name} за последние {settings.METRICS_WINDOW_SECONDS} с')
+                lines.append(f'# TYPE {window_metric} gauge')
+                for labels, histogram in series:
+                    for q in WINDOW_QUANTILES:
+                        value = histogram.window_quantile(q, now)
+                        if value is not None:
+                            lines.append(f'{window_metric}{_labels(labels + (("quantile", str(q)),))} {_number(value)}')
+
+            counter_names = sorted({name for name, _ in self.counters})
+            for name in counter_names:
+                metric = PREFIX + name
+                lines.append(f'# HELP {metric} {self.counter_help.get(name, name)}')
+                lines.append(f'# TYPE {metric} counter')
+                for (counter_name, labels), value in sorted(self.counters.items()):
+                    if counter_name == name:
+                        lines.append(f'{metric}{_labels(labels)} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value) -> str:
+    if isinstance(value, str):
+        return value
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+
+
+class QueryTimer:
+    # количество и суммарное время SQL-запросов текущего запроса
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+# таймер текущего запроса; contextvar переносится и в потоки sync_to_async,
+# поэтому запросы async-представлений тоже учитываются
+current_timer = ContextVar('metrics_query_timer', default=None)
+
+
+def time_query(execute, sql, params, many, context):
+    # постоянная обёртка connection.execute_wrappers каждого соединения
+    timer = current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.duration += time.perf_counter() - started
+        timer.count += 1
+
+
+def install_query_timer(connection, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, time_query)
+
+
+connection_created.connect(install_query_timer)
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # соединения, открытые до загрузки middleware
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not sampled():
+            return self.get_response(request)
+
+        timer = QueryTimer()
+        token = current_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timer.reset(token)
+        record(request, response, time.perf_counter() - started, timer)
+        return response
+
+    async def __acall__(self, request):
+        if not sampled():
+            return await self.get_response(request)
+
+        timer = QueryTimer()
+        token = current_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timer.reset(token)
+        record(request, response, time.perf_counter() - started, timer)
+        return response
+
+
+def sampled() -> bool:
+    return settings.METRICS_ENABLED and random.random() < settings.METRICS_SAMPLE_RATE
+
+
+def record(request, response, elapsed, timer: QueryTimer) -> None:
+    match = getattr(request, 'resolver_match', None)
+    route = (match.route or match.view_name) if match is not None else 'unmatched'
+    labels = (('route', route), ('method', request.method))
+    now = time.time()
+    registry.observe('request_duration_seconds', labels, elapsed, now)
+    registry.observe('db_duration_seconds', labels, timer.duration, now)
+    registry.observe('db_queries', labels, timer.count, now)
+    registry.observe('response_size_bytes', labels, _response_size(response), now)
+    registry.increment(
+        'requests_total', labels + (('status', str(response.status_code)),),
+        help_text='Количество замеренных запросов',
+    )
+
+
+def _response_size(response) -> int:
+    if getattr(response, 'streaming', False):
+        return int(response.get('Content-Length') or 0)
+    return len(response.content)
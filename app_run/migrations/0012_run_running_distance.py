@@ -0,0 +1,55 @@
+# Generated by Django 5.2 on 2026-10-18 05:53
+
+import math
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+MEAN_EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(points) -> float:
+    # без импорта app_run.distance: миграция не должна зависеть от текущего кода приложения
+    total = 0.0
+    for (lat1, lon1), (lat2, lon2) in zip(points, points[1:]):
+        lat1, lon1, lat2, lon2 = (math.radians(float(value)) for value in (lat1, lon1, lat2, lon2))
+        h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        total += 2 * MEAN_EARTH_RADIUS_KM * math.asin(math.sqrt(min(max(h, 0.0), 1.0)))
+    return total
+
+
+def fill_running_distance(apps, schema_editor):
+    # забеги в процессе получают накопленную дистанцию (по сфере; точный метод из настроек -
+    # manage.py reconcile_run_distance --fix) и последнюю точку
+    Run = apps.get_model('app_run', 'Run')
+    Position = apps.get_model('app_run', 'Position')
+    for run in Run.objects.filter(status='in_progress'):
+        rows = list(
+            Position.objects.filter(run_id=run.id).order_by('id').values_list('id', 'latitude', 'longitude')
+        )
+        if not rows:
+            continue
+        run.running_distance = haversine_km([(lat, lon) for _, lat, lon in rows])
+        run.last_position_id = rows[-1][0]
+        run.save(update_fields=['running_distance', 'last_position'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_run', '0011_collectibleitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='run',
+            name='last_position',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='app_run.position'),
+        ),
+        migrations.AddField(
+            model_name='run',
+            name='running_distance',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(fill_running_distance, migrations.RunPython.noop),
+    ]
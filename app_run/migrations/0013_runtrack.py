@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 05:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_run', '0012_run_running_distance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RunTrack',
+            fields=[
+                ('run', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='track', serialize=False, to='app_run.run')),
+                ('data', models.BinaryField()),
+                ('point_count', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2 on 2026-10-18 05:56
+
+from django.db import migrations, models
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION = 9
+
+
+def encode(latitude, longitude) -> str:
+    # geohash как в app_run.geohash.encode на момент миграции, без импорта кода приложения
+    total = PRECISION * 5
+    lon_bits, lat_bits = (total + 1) // 2, total // 2
+    lon_index = min((1 << lon_bits) - 1, max(0, int((longitude - -180.0) / (180.0 - -180.0) * (1 << lon_bits))))
+    lat_index = min((1 << lat_bits) - 1, max(0, int((latitude - -90.0) / (90.0 - -90.0) * (1 << lat_bits))))
+    code = 0
+    # биты чередуются начиная с долготы
+    for i in range(total):
+        if i % 2 == 0:
+            lon_bits -= 1
+            bit = (lon_index >> lon_bits) & 1
+        else:
+            lat_bits -= 1
+            bit = (lat_index >> lat_bits) & 1
+        code = (code << 1) | bit
+    return ''.join(BASE32[(code >> shift) & 31] for shift in range(total - 5, -1, -5))
+
+
+def fill_geohash(apps, schema_editor):
+    CollectibleItem = apps.get_model('app_run', 'CollectibleItem')
+    items = list(CollectibleItem.objects.only('id', 'latitude', 'longitude'))
+    for item in items:
+        item.geohash = encode(item.latitude, item.longitude)
+    CollectibleItem.objects.bulk_update(items, ['geohash'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_run', '0013_runtrack'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collectibleitem',
+            name='geohash',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=12),
+        ),
+        migrations.RunPython(fill_geohash, migrations.RunPython.noop),
+    ]
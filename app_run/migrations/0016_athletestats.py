@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-18 05:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def fill_athlete_stats(apps, schema_editor):
+    Run = apps.get_model('app_run', 'Run')
+    AthleteStats = apps.get_model('app_run', 'AthleteStats')
+    rows = Run.objects.filter(status='finished').values('athlete_id').annotate(
+        finished_runs=Count('id'), total_distance=Sum('distance'), last_run_at=Max('created_at')
+    )
+    AthleteStats.objects.bulk_create([AthleteStats(user_id=row.pop('athlete_id'), **row) for row in rows])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_run', '0015_importjob'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AthleteStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='athlete_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('finished_runs', models.IntegerField(default=0)),
+                ('total_distance', models.FloatField(default=0)),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='run',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_athlete_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 05:59
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_challenges(apps, schema_editor):
+    # перед уникальным ограничением оставляем по одной записи на (athlete, full_name)
+    Challenge = apps.get_model('app_run', 'Challenge')
+    keep = Challenge.objects.values('athlete_id', 'full_name').annotate(keep_id=Min('id')).values('keep_id')
+    Challenge.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_run', '0016_athletestats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_challenges, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='challenge',
+            constraint=models.UniqueConstraint(fields=('athlete', 'full_name'), name='unique_challenge_per_athlete'),
+        ),
+    ]
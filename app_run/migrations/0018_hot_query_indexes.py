@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-18 06:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_run', '0017_challenge_rules'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # сначала составные индексы, потом удаляем ставшие лишними индексы по FK
+        migrations.AddIndex(
+            model_name='position',
+            index=models.Index(fields=['run', 'id'], name='position_run_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='run',
+            index=models.Index(fields=['athlete', 'status'], name='run_athlete_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='run',
+            index=models.Index(fields=['-created_at', '-id'], name='run_created_at_id_idx'),
+        ),
+        migrations.AlterField(
+            model_name='position',
+            name='run',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='app_run.run'),
+        ),
+        migrations.AlterField(
+            model_name='run',
+            name='athlete',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        # auth_user - таблица django.contrib.auth, индекс для списка пользователей по роли
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS app_run_user_role_idx ON auth_user (is_staff, is_superuser, id)',
+            'DROP INDEX IF EXISTS app_run_user_role_idx',
+        ),
+    ]
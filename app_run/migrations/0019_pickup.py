@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-18 06:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_run', '0018_hot_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Pickup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('picked_at', models.DateTimeField(auto_now_add=True)),
+                ('athlete', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app_run.collectibleitem')),
+                ('run', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='app_run.run')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('athlete', 'item'), name='unique_pickup_per_athlete')],
+            },
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2 on 2026-10-18 06:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, TruncMonth, TruncWeek
+
+
+def fill_leaderboards(apps, schema_editor):
+    Run = apps.get_model('app_run', 'Run')
+    LeaderboardEntry = apps.get_model('app_run', 'LeaderboardEntry')
+    runs = Run.objects.filter(status='finished')
+    entries = []
+    for period, truncate in (('week', TruncWeek), ('month', TruncMonth)):
+        rows = runs.annotate(
+            start=truncate(Coalesce('finished_at', 'created_at'), output_field=models.DateField()),
+        ).values('athlete_id', 'start').annotate(finished_runs=Count('id'), total_distance=Sum('distance'))
+        entries.extend(
+            LeaderboardEntry(athlete_id=row['athlete_id'], period=period, period_start=row['start'],
+                             finished_runs=row['finished_runs'], total_distance=row['total_distance'])
+            for row in rows
+        )
+    LeaderboardEntry.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_run', '0019_pickup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'week'), ('month', 'month')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('finished_runs', models.IntegerField(default=0)),
+                ('total_distance', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='athletestats',
+            index=models.Index(fields=['-total_distance', 'user'], name='athletestats_distance_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='athletestats',
+            index=models.Index(fields=['-finished_runs', 'user'], name='athletestats_runs_idx'),
+        ),
+        migrations.AddField(
+            model_name='leaderboardentry',
+            name='athlete',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardentry',
+            index=models.Index(fields=['period', 'period_start', '-total_distance', 'athlete'], name='leaderboard_distance_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardentry',
+            index=models.Index(fields=['period', 'period_start', '-finished_runs', 'athlete'], name='leaderboard_runs_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='leaderboardentry',
+            constraint=models.UniqueConstraint(fields=('period', 'period_start', 'athlete'), name='unique_leaderboard_entry'),
+        ),
+        migrations.RunPython(fill_leaderboards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 06:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_run', '0020_leaderboards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='run',
+            name='summary',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 06:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_run', '0021_run_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='runtrack',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
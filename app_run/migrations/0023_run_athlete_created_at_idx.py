@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 07:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_run', '0022_runtrack_archived_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='run',
+            index=models.Index(fields=['athlete', '-created_at', '-id'], name='run_athlete_created_at_id_idx'),
+        ),
+    ]
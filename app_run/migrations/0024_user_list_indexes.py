@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_run', '0023_run_athlete_created_at_idx'),
+    ]
+
+    operations = [
+        # список пользователей фильтрует "NOT is_superuser": частичные индексы подходят
+        # к этому условию как есть, без переписывания запроса под планировщик
+        migrations.RunSQL(
+            'DROP INDEX IF EXISTS app_run_user_role_idx',
+            'CREATE INDEX IF NOT EXISTS app_run_user_role_idx ON auth_user (is_staff, is_superuser, id)',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS app_run_user_list_idx ON auth_user (id) WHERE NOT is_superuser',
+            'DROP INDEX IF EXISTS app_run_user_list_idx',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS app_run_user_type_idx ON auth_user (is_staff, id) WHERE NOT is_superuser',
+            'DROP INDEX IF EXISTS app_run_user_type_idx',
+        ),
+    ]
@@ -1,10 +1,14 @@
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
+from app_run import geohash
+
 
 class Run(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
-    athlete = models.ForeignKey(User, on_delete=models.CASCADE)
+    # отдельный индекс по athlete не нужен: его заменяет составной (athlete, status)
+    athlete = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     comment = models.TextField()
     RUN_STATUS_CHOICES = [
         ("init", "init"),
@@ -17,6 +21,29 @@ class Run(models.Model):
         default="init",
     )
     distance = models.FloatField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # накопленная дистанция (км, без округления) и последняя точка трека,
+    # обновляются при добавлении каждой позиции
+    running_distance = models.FloatField(default=0)
+    last_position = models.ForeignKey(
+        'Position',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='+',
+    )
+    # сводка трека, считается при остановке забега (app_run/summaries.py)
+    summary = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # забеги атлета по статусу (фильтры списка, статистика, челленджи)
+            models.Index(fields=["athlete", "status"], name="run_athlete_status_idx"),
+            # список забегов по дате создания, в т.ч. keyset-пагинация (-created_at, -id)
+            models.Index(fields=["-created_at", "-id"], name="run_created_at_id_idx"),
+            # забеги одного атлета в keyset-пагинации (?athlete=&pagination=cursor)
+            models.Index(fields=["athlete", "-created_at", "-id"], name="run_athlete_created_at_id_idx"),
+        ]
 
 
 class AthleteInfo(models.Model):
@@ -31,15 +58,76 @@ class AthleteInfo(models.Model):
     def __str__(self):
         return f"AthleteInfo({self.user})"
 
+class AthleteStats(models.Model):
+    # агрегаты по завершённым забегам, обновляются в транзакции остановки забега (app_run/stats.py)
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="athlete_stats",
+    )
+    finished_runs = models.IntegerField(default=0)
+    total_distance = models.FloatField(default=0)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # лидерборд «за всё время»: топ и ранг атлета (app_run/leaderboards.py)
+            models.Index(fields=["-total_distance", "user"], name="athletestats_distance_idx"),
+            models.Index(fields=["-finished_runs", "user"], name="athletestats_runs_idx"),
+        ]
+
+    def __str__(self):
+        return f"AthleteStats({self.user_id}, {self.finished_runs}, {self.total_distance})"
+
+class LeaderboardEntry(models.Model):
+    # итоги атлета за неделю или месяц, обновляются при остановке забега (app_run/leaderboards.py)
+    PERIOD_CHOICES = [
+        ("week", "week"),
+        ("month", "month"),
+    ]
+    athlete = models.ForeignKey(User, on_delete=models.CASCADE)
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    finished_runs = models.IntegerField(default=0)
+    total_distance = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["period", "period_start", "athlete"], name="unique_leaderboard_entry"),
+        ]
+        indexes = [
+            models.Index(fields=["period", "period_start", "-total_distance", "athlete"],
+                         name="leaderboard_distance_idx"),
+            models.Index(fields=["period", "period_start", "-finished_runs", "athlete"],
+                         name="leaderboard_runs_idx"),
+        ]
+
+    def __str__(self):
+        return f"LeaderboardEntry({self.period}, {self.period_start}, {self.athlete_id})"
+
 class Challenge(models.Model):
     athlete = models.ForeignKey(User, on_delete=models.CASCADE)
     full_name = models.TextField()
 
+    class Meta:
+        constraints = [
+            # награды пишутся bulk_create(ignore_conflicts=True)
+            models.UniqueConstraint(fields=["athlete", "full_name"], name="unique_challenge_per_athlete"),
+        ]
+
 class Position(models.Model):
-    run = models.ForeignKey(Run, on_delete=models.CASCADE)
+    # отдельный индекс по run не нужен: его заменяет составной (run, id)
+    run = models.ForeignKey(Run, on_delete=models.CASCADE, db_index=False)
     latitude = models.DecimalField(max_digits=7, decimal_places=4)
     longitude = models.DecimalField(max_digits=8, decimal_places=4)
 
+    class Meta:
+        indexes = [
+            # трек забега в порядке записи точек
+            models.Index(fields=["run", "id"], name="position_run_id_idx"),
+        ]
+
     def __str__(self):
         return f"Position({self.run}, {self.latitude}, {self.longitude})"
 
@@ -49,4 +137,66 @@ class CollectibleItem(models.Model):
     latitude = models.FloatField()
     longitude = models.FloatField()
     picture = models.URLField()
-    value = models.IntegerField()
\ No newline at end of file
+    value = models.IntegerField()
+    # пространственный индекс: geohash координат, поиск по диапазонам префиксов
+    geohash = models.CharField(max_length=12, db_index=True, editable=False, default='')
+
+    def save(self, *args, **kwargs):
+        self.fill_geohash()
+        super().save(*args, **kwargs)
+
+    def fill_geohash(self):
+        # bulk_create не вызывает save(), поэтому отдельным методом
+        self.geohash = geohash.encode(self.latitude, self.longitude)
+
+
+class Pickup(models.Model):
+    # предмет, собранный атлетом на забеге (app_run/pickups.py); каждый предмет - один раз
+    athlete = models.ForeignKey(User, on_delete=models.CASCADE)
+    item = models.ForeignKey(CollectibleItem, on_delete=models.CASCADE)
+    run = models.ForeignKey(Run, null=True, blank=True, on_delete=models.SET_NULL)
+    picked_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # подборы пишутся bulk_create(ignore_conflicts=True)
+            models.UniqueConstraint(fields=["athlete", "item"], name="unique_pickup_per_athlete"),
+        ]
+
+    def __str__(self):
+        return f"Pickup({self.athlete_id}, {self.item_id})"
+
+
+class RunTrack(models.Model):
+    # упакованный трек завершённого забега (см. app_run/track_storage.py)
+    run = models.OneToOneField(
+        Run,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='track',
+    )
+    data = models.BinaryField()
+    point_count = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # когда строки Position забега удалены и трек хранится только здесь (app_run/archive.py)
+    archived_at = models.DateTimeField(null=True, blank=True)
+
+
+class ImportJob(models.Model):
+    # фоновый импорт предметов (см. app_run/jobs.py)
+    STATUS_CHOICES = [
+        ("queued", "queued"),
+        ("running", "running"),
+        ("finished", "finished"),
+        ("failed", "failed"),
+    ]
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="queued")
+    file_name = models.CharField(max_length=255)
+    file_path = models.CharField(max_length=500)
+    rows_processed = models.IntegerField(default=0)
+    rows_rejected = models.IntegerField(default=0)
+    invalid_rows = models.JSONField(default=list, encoder=DjangoJSONEncoder)  # в xlsx бывают даты
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
@@ -0,0 +1,174 @@
+"""
+Сбор предметов (CollectibleItem) во время записи точек трека.
+
+Координаты всех предметов держатся в памяти процесса в равномерной сетке
+с ячейкой не меньше радиуса сбора: кандидаты для точки - предметы из
+соседних ячеек, точная проверка - гаверсинус по массивам NumPy.
+Сетка перестраивается, когда меняется версия каталога (её увеличивает
+импорт предметов) или истёк COLLECTIBLE_GRID_TTL.
+Подборы пишутся bulk_create с ignore_conflicts по уникальному (athlete, item).
+"""
+import math
+import threading
+import time
+import uuid
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from app_run import response_cache
+from app_run.geohash import EARTH_RADIUS, METERS_PER_DEGREE
+from app_run.models import CollectibleItem, Pickup
+
+VERSION_CACHE_KEY = 'collectible-items-version'
+MAX_LON_SPAN = 16  # ближе к полюсам проверяем все предметы перебором
+
+
+class ItemGrid:
+    def __init__(self, ids, latitudes, longitudes, radius, version=None):
+        self.radius = radius
+        self.version = version
+        self.built_at = time.monotonic()
+
+        cell = radius / METERS_PER_DEGREE
+        self.lat_cells = max(1, int(180 // cell))
+        self.lon_cells = max(1, int(360 // cell))
+        self.lat_step = 180 / self.lat_cells
+        self.lon_step = 360 / self.lon_cells
+
+        keys = self._keys(latitudes, longitudes)
+        order = np.argsort(keys, kind='stable')
+        self.ids = ids[order]
+        self.latitudes = latitudes[order]
+        self.longitudes = longitudes[order]
+        cell_keys, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+        # ячейка -> (начало, конец) в отсортированных массивах
+        self.cells = {
+            key: (start, start + count)
+            for key, start, count in zip(cell_keys.tolist(), starts.tolist(), counts.tolist())
+        }
+
+    @classmethod
+    def build(cls, radius, version=None):
+        rows = np.array(CollectibleItem.objects.values_list('id', 'latitude', 'longitude'), dtype=np.float64)
+        rows = rows.reshape(-1, 3)
+        return cls(rows[:, 0].astype(np.int64), rows[:, 1], rows[:, 2], radius, version)
+
+    def _keys(self, latitudes, longitudes):
+        # номер ячейки: ряд по широте * количество столбцов + столбец по долготе
+        lat_keys = np.clip(np.floor((latitudes + 90) / self.lat_step), 0, self.lat_cells - 1).astype(np.int64)
+        lon_keys = np.floor((longitudes + 180) / self.lon_step).astype(np.int64) % self.lon_cells
+        return lat_keys * self.lon_cells + lon_keys
+
+    def _candidates(self, key):
+        # индексы предметов из соседних ячеек; None - проверять все
+        lat_key, lon_key = divmod(key, self.lon_cells)
+        edge = max(abs(lat_key * self.lat_step - 90), abs((lat_key + 1) * self.lat_step - 90)) + self.lat_step
+        cos_lat = math.cos(math.radians(min(90.0, edge)))
+        if cos_lat <= 0:
+            return None
+        lon_span = math.ceil(self.radius / (METERS_PER_DEGREE * cos_lat * self.lon_step))
+        if lon_span > MAX_LON_SPAN or 2 * lon_span + 1 >= self.lon_cells:
+            return None
+
+        ranges = [
+            self.cells[neighbour]
+            for neighbour in (
+                lat * self.lon_cells + (lon_key + offset) % self.lon_cells
+                for lat in (lat_key - 1, lat_key, lat_key + 1)
+                if 0 <= lat < self.lat_cells
+                for offset in range(-lon_span, lon_span + 1)
+            )
+            if neighbour in self.cells
+        ]
+        if not ranges:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(start, stop) for start, stop in ranges])
+
+    def find(self, latitudes, longitudes) -> list[int]:
+        # id предметов в радиусе хотя бы одной из точек
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        if not len(self.ids) or not len(latitudes):
+            return []
+
+        keys = self._keys(latitudes, longitudes)
+        if len(keys) == 1:
+            groups = [(int(keys[0]), np.zeros(1, dtype=np.int64))]
+        else:
+            order = np.argsort(keys, kind='stable')
+            cell_keys, starts = np.unique(keys[order], return_index=True)
+            groups = zip(cell_keys.tolist(), np.split(order, starts[1:]))
+
+        found = set()
+        for key, points in groups:
+            candidates = self._candidates(key)
+            if candidates is None:
+                candidates = np.arange(len(self.ids))
+            if not len(candidates):
+                continue
+            distances = haversine(
+                latitudes[points][:, None], longitudes[points][:, None],
+                self.latitudes[candidates][None, :], self.longitudes[candidates][None, :],
+            )
+            found.update(self.ids[candidates][(distances <= self.radius).any(axis=0)].tolist())
+        return sorted(found)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    h = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(np.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(1.0, h)))
+
+
+_grid = None
+_grid_lock = threading.Lock()
+
+
+def get_grid() -> ItemGrid:
+    global _grid
+    version = cache.get(VERSION_CACHE_KEY)
+    radius = settings.COLLECTIBLE_PICKUP_RADIUS
+    if _is_fresh(_grid, version, radius):
+        return _grid
+    with _grid_lock:
+        if not _is_fresh(_grid, version, radius):
+            _grid = ItemGrid.build(radius, version)
+        return _grid
+
+
+def _is_fresh(grid, version, radius) -> bool:
+    return (
+        grid is not None
+        and grid.version == version
+        and grid.radius == radius
+        and time.monotonic() - grid.built_at < settings.COLLECTIBLE_GRID_TTL
+    )
+
+
+def items_changed() -> None:
+    # вызывать после изменения каталога предметов: сетки всех процессов перестроятся;
+    # версия меняется после коммита, иначе параллельная запись точки построит сетку без новых предметов
+    transaction.on_commit(lambda: cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, None))
+    response_cache.bump('collectibles')
+
+
+def record_pickups(run, positions, grid=None) -> list[int]:
+    # вызывать в транзакции записи точек; возвращает id предметов рядом с точками
+    if not positions:
+        return []
+    grid = grid or get_grid()
+    item_ids = grid.find(
+        [float(position.latitude) for position in positions],
+        [float(position.longitude) for position in positions],
+    )
+    if item_ids:
+        # сетка может отставать от каталога на COLLECTIBLE_GRID_TTL: удалённые предметы отбрасываем
+        existing = CollectibleItem.objects.filter(id__in=item_ids).values_list('id', flat=True)
+        Pickup.objects.bulk_create(
+            [Pickup(athlete_id=run.athlete_id, item_id=item_id, run=run) for item_id in existing],
+            ignore_conflicts=True,
+        )
+    return item_ids
@@ -0,0 +1,118 @@
+"""
+Проверка планов запросов: EXPLAIN для перехваченных SQL-запросов (SQLite и PostgreSQL)
+и поиск полного сканирования или сортировки по большим таблицам.
+
+    with CaptureQueriesContext(connection) as ctx:
+        client.get('/api/runs/?pagination=cursor')
+    problems = plan_problems(ctx.captured_queries)
+
+Полное сканирование - "SCAN <table>" без индекса в SQLite и "Seq Scan" в PostgreSQL
+(с enable_seqscan/enable_sort = off, чтобы на пустой тестовой базе планировщик
+выбирал индекс всегда, когда он вообще применим). Сортировка - "USE TEMP B-TREE" в SQLite
+и узел Sort в PostgreSQL.
+"""
+import json
+import re
+
+from django.db import connections
+
+LARGE_TABLES = frozenset({
+    'app_run_run',
+    'app_run_position',
+    'app_run_collectibleitem',
+    'app_run_challenge',
+    'auth_user',
+})
+
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)')
+SQLITE_SORT = re.compile(r'^USE TEMP B-TREE FOR (.+)$')
+TABLE_NAME = re.compile(r'\bFROM\s+"?(\w+)"?|\bJOIN\s+"?(\w+)"?', re.IGNORECASE)
+
+
+def explain(sql, using='default') -> list:
+    # строки плана: [(операция, таблица или None, описание), ...]
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        return _explain_sqlite(connection, sql)
+    if connection.vendor == 'postgresql':
+        return _explain_postgresql(connection, sql)
+    raise NotImplementedError(f'EXPLAIN is not supported for {connection.vendor}')
+
+
+def _explain_sqlite(connection, sql):
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        details = [row[3] for row in cursor.fetchall()]
+
+    tables = _query_tables(sql)
+    steps = []
+    for detail in details:
+        scan = SQLITE_SCAN.match(detail)
+        if scan and 'USING' not in detail:
+            steps.append(('full_scan', scan.group(1), detail))
+        elif SQLITE_SORT.match(detail):
+            # SQLite не сообщает, что сортирует: считаем сортировкой по всем таблицам запроса
+            steps.extend(('sort', table, detail) for table in sorted(tables))
+        else:
+            steps.append(('ok', None, detail))
+    return steps
+
+
+def _explain_postgresql(connection, sql):
+    with connection.cursor() as cursor:
+        cursor.execute('SET enable_seqscan = off')
+        cursor.execute('SET enable_sort = off')
+        try:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql)
+            plan = cursor.fetchone()[0]
+        finally:
+            cursor.execute('RESET enable_seqscan')
+            cursor.execute('RESET enable_sort')
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    steps = []
+    _walk_postgresql(plan[0]['Plan'], steps)
+    return steps
+
+
+def _walk_postgresql(node, steps):
+    node_type = node['Node Type']
+    if node_type == 'Seq Scan':
+        steps.append(('full_scan', node.get('Relation Name'), f"Seq Scan on {node.get('Relation Name')}"))
+    elif node_type in ('Sort', 'Incremental Sort'):
+        tables = set()
+        _collect_relations(node, tables)
+        steps.extend((
+            'sort', table, f"{node_type} by {', '.join(node.get('Sort Key', []))}"
+        ) for table in sorted(tables))
+    else:
+        steps.append(('ok', node.get('Relation Name'), node_type))
+    for child in node.get('Plans', []):
+        _walk_postgresql(child, steps)
+
+
+def _collect_relations(node, tables):
+    if 'Relation Name' in node:
+        tables.add(node['Relation Name'])
+    for child in node.get('Plans', []):
+        _collect_relations(child, tables)
+
+
+def _query_tables(sql) -> set:
+    return {from_table or join_table for from_table, join_table in TABLE_NAME.findall(sql)}
+
+
+def plan_problems(queries, using='default', large_tables=LARGE_TABLES) -> list[str]:
+    """
+    queries - список SQL или CaptureQueriesContext.captured_queries.
+    Возвращает описания проблем: полное сканирование или сортировка по большой таблице.
+    """
+    problems = []
+    for query in queries:
+        sql = query['sql'] if isinstance(query, dict) else query
+        if not sql.lstrip().upper().startswith('SELECT'):
+            continue
+        for step, table, detail in explain(sql, using):
+            if step != 'ok' and table in large_tables:
+                problems.append(f'{step} on {table}: {detail}\n    {sql}')
+    return problems
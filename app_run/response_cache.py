@@ -0,0 +1,78 @@
+"""
+Кеш готовых JSON-ответов для часто читаемых эндпоинтов.
+
+Тело ответа хранится в кеше Django под ключом с версией области
+(например, ``athlete:<id>``); запись данных области меняет версию
+(``bump``), и старые ответы больше не находятся. Ответ отдаётся с ETag
+(хеш тела), поэтому при совпадении If-None-Match возвращается 304.
+Попадания и промахи - счётчик app_response_cache_total в /api/_metrics/.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from app_run import metrics
+from app_run.renderers import dumps
+
+
+def _version_key(scope, key) -> str:
+    return f'response-version:{scope}:{key}'
+
+
+def version(scope, key=None) -> str:
+    version_key = _version_key(scope, key)
+    value = cache.get(version_key)
+    if value is None:
+        cache.add(version_key, uuid.uuid4().hex, None)
+        value = cache.get(version_key)
+    return value
+
+
+def bump(scope, *keys) -> None:
+    # вызывать при записи данных области; версия меняется после коммита,
+    # иначе параллельный запрос успеет закешировать старые данные под новой версией
+    keys = keys or (None,)
+    transaction.on_commit(
+        lambda: cache.set_many({_version_key(scope, key): uuid.uuid4().hex for key in keys}, None)
+    )
+
+
+def cached_response(request, scope, build, key=None):
+    """
+    ``build()`` возвращает DRF Response; в кеш попадают только ответы 200
+    в JSON (браузерный API DRF и ошибки отдаются как есть).
+    """
+    if not settings.RESPONSE_CACHE_ENABLED or getattr(request.accepted_renderer, 'format', None) != 'json':
+        return build()
+
+    path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    cache_key = f'response:{scope}:{key}:{version(scope, key)}:{path_hash}'
+    entry = cache.get(cache_key)
+    if entry is None:
+        response = build()
+        if response.status_code != 200:
+            return response
+        content = dumps(response.data)
+        entry = (content, quote_etag(hashlib.md5(content).hexdigest()))
+        cache.set(cache_key, entry, settings.RESPONSE_CACHE_TIMEOUT)
+        _count(scope, 'miss')
+    else:
+        _count(scope, 'hit')
+
+    content, etag = entry
+    response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    return get_conditional_response(request, etag=etag, response=response) or response
+
+
+def _count(scope, result) -> None:
+    metrics.registry.increment(
+        'response_cache_total', (('scope', scope), ('result', result)),
+        help_text='Запросы к кешу ответов по областям: hit/miss',
+    )
@@ -1,6 +1,7 @@
 from django.contrib.auth.models import User
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Run, AthleteInfo, Challenge, Position, CollectibleItem
+from .models import Run, AthleteInfo, Challenge, Position, CollectibleItem, ImportJob, Pickup
 
 
 class AthleteDataSerializer(serializers.ModelSerializer):
@@ -14,6 +15,7 @@ class RunSerializer(serializers.ModelSerializer):
     class Meta:
         model = Run
         fields = '__all__'
+        read_only_fields = ('running_distance', 'last_position', 'summary')
 
 class UserSerializer(serializers.ModelSerializer):
     type = serializers.SerializerMethodField()  # Задаем вычисляемое поле type
@@ -47,6 +49,11 @@ class ChallengeSerializer(serializers.ModelSerializer):
         model = Challenge
         fields = ("athlete", "full_name")
 
+class PickupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Pickup
+        fields = ("athlete", "item", "run", "picked_at")
+
 class PositionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Position
@@ -77,7 +84,7 @@ class PositionSerializer(serializers.ModelSerializer):
 class CollectibleItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = CollectibleItem
-        fields = '__all__'
+        exclude = ('geohash',)
 
     def validate_latitude(self, latitude):
         if latitude < -90 or latitude > 90:
@@ -91,4 +98,18 @@ class CollectibleItemSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 "Longitude must be in range [-180.0, 180.0]."
             )
-        return longitude
\ No newline at end of file
+        return longitude
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    rows_per_second = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJob
+        fields = ('id', 'status', 'file_name', 'rows_processed', 'rows_rejected', 'rows_per_second',
+                  'error', 'created_at', 'started_at', 'finished_at', 'invalid_rows')
+
+    def get_rows_per_second(self, obj):
+        if obj.started_at is None:
+            return None
+        elapsed = ((obj.finished_at or timezone.now()) - obj.started_at).total_seconds()
+        return round(obj.rows_processed / elapsed, 1) if elapsed > 0 else None
@@ -0,0 +1,84 @@
+"""
+Упрощение трека Дугласом-Пекером для карт (уровни детализации).
+
+Вместо упрощения под каждый допуск считается «важность» каждой точки -
+отклонение (м), при котором алгоритм оставил бы её в треке. Важность
+точки не больше важности точки-родителя, поэтому трек для допуска
+``tolerance`` - это в точности точки с ``importance > tolerance``,
+а ``max_points`` самых важных точек - самый подробный трек такого размера.
+Один массив важности даёт любые уровни детализации.
+
+Разбиение идёт по уровням: на каждом шаге расстояния для всех точек всех
+текущих отрезков считаются одним векторным проходом.
+"""
+import numpy as np
+
+EARTH_RADIUS = 6371008.8
+
+
+def to_metres(coords) -> np.ndarray:
+    # локальная равнопромежуточная проекция (м) относительно средней широты трека
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if not len(coords):
+        return coords
+    lat = np.radians(coords[:, 0])
+    lon = np.unwrap(np.radians(coords[:, 1]))  # без скачка на 180-м меридиане
+    return np.stack([
+        (lon - lon[0]) * np.cos(lat.mean()) * EARTH_RADIUS,
+        (lat - lat[0]) * EARTH_RADIUS,
+    ], axis=1)
+
+
+def segment_distances(points, starts, ends) -> np.ndarray:
+    # расстояние от каждой точки до своего отрезка [start, end]
+    direction = ends - starts
+    length2 = np.einsum('ij,ij->i', direction, direction)
+    t = np.einsum('ij,ij->i', points - starts, direction) / np.where(length2 > 0, length2, 1.0)
+    nearest = starts + np.clip(t, 0.0, 1.0)[:, None] * direction
+    return np.hypot(*(points - nearest).T)
+
+
+def douglas_peucker_importance(xy) -> np.ndarray:
+    xy = np.asarray(xy, dtype=np.float64)
+    n = len(xy)
+    importance = np.zeros(n)
+    if n == 0:
+        return importance
+    importance[[0, -1]] = np.inf
+    starts, ends, parents = np.array([0]), np.array([n - 1]), np.array([np.inf])
+
+    while len(starts):
+        inner = ends - starts - 1
+        active = inner > 0
+        starts, ends, parents, inner = starts[active], ends[active], parents[active], inner[active]
+        if not len(starts):
+            break
+
+        # индексы внутренних точек всех отрезков подряд
+        offsets = np.cumsum(inner) - inner
+        segment = np.repeat(np.arange(len(starts)), inner)
+        index = np.arange(inner.sum()) - offsets[segment] + starts[segment] + 1
+        distances = segment_distances(xy[index], xy[starts[segment]], xy[ends[segment]])
+
+        # самая удалённая точка каждого отрезка (первая при равенстве)
+        farthest = np.maximum.reduceat(distances, offsets)
+        hits = np.flatnonzero(distances == farthest[segment])
+        first = hits[np.unique(segment[hits], return_index=True)[1]]
+        split = index[first]
+
+        weight = np.minimum(farthest, parents)
+        importance[split] = weight
+        starts = np.concatenate([starts, split])
+        ends = np.concatenate([split, ends])
+        parents = np.concatenate([weight, weight])
+
+    return importance
+
+
+def select(importance, tolerance=None, max_points=None) -> np.ndarray:
+    # индексы оставляемых точек в порядке трека
+    keep = np.flatnonzero(importance > tolerance) if tolerance is not None else np.arange(len(importance))
+    if max_points is not None and len(keep) > max_points:
+        ranked = np.argsort(-importance[keep], kind='stable')[:max_points]
+        keep = np.sort(keep[ranked])
+    return keep
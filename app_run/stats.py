@@ -0,0 +1,45 @@
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import Coalesce
+
+from app_run import leaderboards
+from app_run.models import AthleteStats, Run
+
+STATS_FIELDS = ('finished_runs', 'total_distance', 'last_run_at')
+
+
+def record_finished_run(run: Run) -> tuple[dict, dict]:
+    # вызывать в транзакции смены статуса; возвращает агрегаты до и после забега
+    stats, _ = AthleteStats.objects.select_for_update().get_or_create(user_id=run.athlete_id)
+    before = {name: getattr(stats, name) for name in STATS_FIELDS}
+
+    stats.finished_runs += 1
+    stats.total_distance += run.distance
+    stats.last_run_at = run.finished_at
+    stats.save(update_fields=list(STATS_FIELDS))
+    return before, {name: getattr(stats, name) for name in STATS_FIELDS}
+
+
+def rebuild_athlete_stats(athlete_ids=None) -> int:
+    # полный пересчёт по таблице забегов (всех атлетов или только указанных)
+    runs = Run.objects.filter(status='finished')
+    stats = AthleteStats.objects.all()
+    if athlete_ids is not None:
+        runs = runs.filter(athlete_id__in=athlete_ids)
+        stats = stats.filter(user_id__in=athlete_ids)
+
+    rows = runs.values('athlete_id').annotate(
+        finished_runs=Count('id'),
+        total_distance=Sum('distance'),
+        last_run_at=Max(Coalesce('finished_at', 'created_at')),
+    )
+    stats.delete()
+    created = AthleteStats.objects.bulk_create(
+        [
+            AthleteStats(user_id=row['athlete_id'], **{name: row[name] for name in STATS_FIELDS})
+            for row in rows
+        ],
+        batch_size=1000,
+    )
+    # доска «за всё время» читается из AthleteStats
+    leaderboards.invalidate(leaderboards.ALL_TIME, None)
+    return len(created)
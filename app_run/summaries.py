@@ -0,0 +1,90 @@
+"""
+Сводка завершённого забега: дистанция, границы километровых отрезков,
+bbox, первая и последняя точки, количество точек.
+
+Считается один раз при остановке забега одним векторным проходом по треку
+и хранится в Run.summary, поэтому чтение сводки не обращается к Position.
+Времени у точек нет, поэтому отрезки - это только их границы на треке
+(координаты интерполируются внутри сегмента, где набирается очередной км).
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.db import connection
+
+from app_run.distance import segment_lengths
+from app_run.models import Run
+from app_run.track_storage import SCALE, run_track_points, unpack_track
+
+SPLIT_METRES = 1000
+
+
+def build_summary(ids, track) -> dict:
+    # ids позиций и координаты в градусах формы (n, 2) в порядке записи
+    ids = np.asarray(ids, dtype=np.int64)
+    track = np.asarray(track, dtype=np.float64).reshape(-1, 2)
+    if not len(track):
+        return {'distance': 0.0, 'point_count': 0, 'start': None, 'end': None, 'bbox': None, 'splits': []}
+
+    # пройденное расстояние (м) до каждой точки
+    travelled = np.concatenate([[0.0], np.cumsum(segment_lengths(track))])
+    boundaries = np.arange(1, int(travelled[-1] // SPLIT_METRES) + 1) * SPLIT_METRES
+    after = np.searchsorted(travelled, boundaries)  # первая точка не ближе границы
+    covered = travelled[after] - travelled[after - 1]
+    fraction = (boundaries - travelled[after - 1]) / np.where(covered > 0, covered, 1.0)
+    points = track[after - 1] + fraction[:, None] * (track[after] - track[after - 1])
+    minimum, maximum = track.min(axis=0), track.max(axis=0)
+
+    return {
+        'distance': round(float(travelled[-1]) / 1000, 3),
+        'point_count': len(track),
+        'start': _point(track[0]),
+        'end': _point(track[-1]),
+        'bbox': {
+            'min_lat': round(float(minimum[0]), 4), 'min_lon': round(float(minimum[1]), 4),
+            'max_lat': round(float(maximum[0]), 4), 'max_lon': round(float(maximum[1]), 4),
+        },
+        'splits': [
+            {'km': km, 'position': position_id, 'latitude': round(lat, 6), 'longitude': round(lon, 6)}
+            for km, position_id, (lat, lon) in zip(
+                range(1, len(boundaries) + 1), ids[after].tolist(), points.tolist()
+            )
+        ],
+    }
+
+
+def _point(coords) -> dict:
+    return {'latitude': round(float(coords[0]), 4), 'longitude': round(float(coords[1]), 4)}
+
+
+def track_summary(data) -> dict:
+    # сводка по упакованному треку RunTrack.data
+    ids, scaled = unpack_track(data)
+    return build_summary(ids, scaled / SCALE)
+
+
+def run_summary(run_id) -> dict:
+    ids, scaled, _ = run_track_points(run_id)
+    return build_summary(ids, scaled / SCALE)
+
+
+def backfill_summaries(run_ids, workers=4, batch_size=200, progress=None) -> int:
+    # пачки забегов считаются параллельно, каждая пишется одним bulk_update
+    batches = [run_ids[start:start + batch_size] for start in range(0, len(run_ids), batch_size)]
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='run-summary') as pool:
+        for count in pool.map(_backfill_batch, batches):
+            done += count
+            if progress is not None:
+                progress(done, len(run_ids))
+    return done
+
+
+def _backfill_batch(run_ids) -> int:
+    try:
+        runs = [Run(id=run_id, summary=run_summary(run_id)) for run_id in run_ids]
+        Run.objects.bulk_update(runs, ['summary'])
+        return len(runs)
+    finally:
+        # у каждого потока своё соединение
+        connection.close()
@@ -1,3 +1,1814 @@
-from django.test import TestCase
+import datetime
+import gzip
+import importlib
+import io
+import json
+import itertools
+import os
+import random
+import re
+import runpy
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from urllib.parse import parse_qs, urlsplit
+from types import SimpleNamespace
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models.query import QuerySet
+from django.test import AsyncClient, Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from geopy.distance import geodesic
+from openpyxl import Workbook
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+
+from app_run import challenges, geohash, importers, jobs, leaderboards, metrics, pickups, simplify, summaries
+from app_run.archive import archive_positions
+from app_run.collectibles import items_in_bbox, items_near
+from app_run.distance import as_track, load_track, segment_lengths, track_distance_km
+from app_run.models import AthleteStats, Challenge, CollectibleItem, ImportJob, LeaderboardEntry, Pickup, Run, Position, RunTrack
+from app_run.query_plans import plan_problems
+from app_run.serializers import PositionSerializer
+from app_run.summaries import build_summary
+from app_run.tracking import reconcile_run_distance, refresh_finished_run, save_position
+
+
+class DistanceAccuracyTest(SimpleTestCase):
+    # погрешность методов из app_run/distance.py относительно geopy geodesic (WGS-84)
+
+    SPECIAL = [
+        (90, 0), (89.9999, 45), (-90, 0), (-89.9999, -120),  # полюса
+        (0, 0), (0, 10), (0, 10), (0, 0),  # экватор и повтор точки
+        (0, 179.9999), (0, -179.9999), (10, 179.99), (10, -179.99),  # 180-й меридиан
+        (0, 0), (0.5, 179.7),  # почти антиподы: Винсенти не сходится
+        (-60, -30), (-60, -30),
+    ]
+
+    def tracks(self):
+        rng = random.Random(1)
+        points = []
+        for _ in range(200):
+            lat, lon = rng.uniform(-90, 90), rng.uniform(-180, 180)
+            points += [(lat, lon), (max(-90, min(90, lat + rng.uniform(-0.01, 0.01))), lon + rng.uniform(-0.01, 0.01))]
+        return [as_track(points), as_track(self.SPECIAL)]
+
+    def assertWithinBounds(self, track):
+        expected = np.array([geodesic(tuple(start), tuple(end)).meters for start, end in zip(track[:-1], track[1:])])
+        vincenty = segment_lengths(track, 'vincenty')
+        haversine = segment_lengths(track, 'haversine')
+        moving = expected > 0
+        # Винсенти: до 0.5 мм на сегмент
+        self.assertLess(np.abs(vincenty - expected).max(), 0.0005)
+        # сфера: до 0.56% от длины сегмента
+        self.assertLess((np.abs(haversine - expected)[moving] / expected[moving]).max(), 0.0056)
+        # повтор точки - ровно 0
+        self.assertTrue((vincenty[~moving] == 0).all() and (haversine[~moving] == 0).all())
+        self.assertLess(abs(track_distance_km(track, 'vincenty') * 1000 - expected.sum()), 0.0005 * len(expected))
+
+    def test_bounds(self):
+        for track in self.tracks():
+            with self.subTest(points=len(track)):
+                self.assertWithinBounds(track)
+
+    def test_short_tracks(self):
+        for points in ([], [(55.75, 37.61)]):
+            self.assertEqual(track_distance_km(as_track(points)), 0)
+
+
+class CollectibleQueryTest(TestCase):
+    # поиск по диапазонам geohash совпадает с перебором всех предметов
+
+    CENTERS = [(55.75, 37.61), (0.0, 0.0), (-33.87, 151.21), (10.0, 179.999), (-10.0, -179.999), (89.99, 10.0)]
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(5)
+        items = []
+        for lat, lon in cls.CENTERS:
+            for _ in range(60):
+                item_lat = max(-90.0, min(90.0, lat + rng.uniform(-0.05, 0.05)))
+                item_lon = (lon + rng.uniform(-0.05, 0.05) + 180) % 360 - 180
+                items.append(CollectibleItem(name='item', uid='uid', latitude=item_lat, longitude=item_lon,
+                                             picture='https://example.com/item.png', value=1))
+        for item in items:
+            item.fill_geohash()
+        CollectibleItem.objects.bulk_create(items)
+        cls.items = list(CollectibleItem.objects.order_by('id'))
+
+    def test_prefix_range(self):
+        for prefix in ['u', 'ucfv', 'b7z', 'zz', '9']:
+            low, high = geohash.prefix_range(prefix)
+            self.assertEqual(low, prefix)
+            # верхняя граница - тоже geohash: без символов вроде '~', чей порядок зависит от collation
+            self.assertTrue(high is None or set(high) <= set(geohash.BASE32))
+            for item in self.items:
+                inside = item.geohash >= low and (high is None or item.geohash < high)
+                self.assertEqual(inside, item.geohash.startswith(prefix))
+
+    def test_radius(self):
+        for lat, lon in self.CENTERS:
+            for radius in (500, 2000, 5000):
+                with self.subTest(center=(lat, lon), radius=radius):
+                    expected = [item.id for item in self.items
+                                if geohash.haversine(lat, lon, item.latitude, item.longitude) <= radius]
+                    self.assertEqual([item.id for item in items_near(lat, lon, radius)], expected)
+        response = self.client.get('/api/collectible_item/?lat=10&lon=179.999&radius=5000')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any(item['longitude'] < 0 for item in response.json()))
+
+    def test_bbox(self):
+        for bbox in [(55.7, 37.58, 55.78, 37.64), (-0.02, -0.02, 0.02, 0.02), (9.98, 179.98, 10.02, -179.98),
+                     (-10.03, 179.99, -9.97, -179.97), (89.96, -180, 90, 180)]:
+            min_lat, min_lon, max_lat, max_lon = bbox
+            with self.subTest(bbox=bbox):
+                expected = [
+                    item.id for item in self.items
+                    if min_lat <= item.latitude <= max_lat and (
+                        min_lon <= item.longitude <= max_lon if min_lon <= max_lon
+                        else item.longitude >= min_lon or item.longitude <= max_lon
+                    )
+                ]
+                self.assertTrue(expected)
+                self.assertEqual(list(items_in_bbox(*bbox).order_by('id').values_list('id', flat=True)), expected)
+                response = self.client.get('/api/collectible_item/?min_lat={}&min_lon={}&max_lat={}&max_lon={}'
+                                           .format(*bbox))
+                self.assertEqual([item['id'] for item in response.json()], expected)
+
+
+class CollectibleUploadTest(TestCase):
+    # POST /api/upload_file/: создаются валидные строки, в ответе - невалидные строки как есть
+    HEADER = ['Name', 'UID', 'Value', 'Latitude', 'Longitude', 'URL', 'Comment']
+    ROWS = [
+        ['Coin', 'coin-1', 10, 55.7558, 37.6173, 'https://example.com/coin.png', 'ok'],
+        ['Far', 'far-1', 5, 95, 37.6173, 'https://example.com/far.png', None],
+        ['Broken', 'broken-1', 'ten', 1, 2, 'https://example.com/broken.png', None],
+        [None, None, None, None, None, None, None],
+        ['Gem', 'gem-1', 100, -33.87, 151.21, 'not-a-url', None],
+        ['Star', 'star-1', 1, 0, -180, 'https://example.com/star.png', None],
+    ]
+
+    def upload(self, name, content, content_type):
+        return self.client.post('/api/upload_file/', {'file': SimpleUploadedFile(name, content, content_type)})
+
+    @staticmethod
+    def xlsx(rows):
+        workbook = Workbook()
+        for row in rows:
+            workbook.active.append(row)
+        content = io.BytesIO()
+        workbook.save(content)
+        return content.getvalue()
+
+    def assertImported(self):
+        self.assertEqual(
+            list(CollectibleItem.objects.order_by('id').values_list('uid', 'value', 'latitude', 'longitude', 'picture')),
+            [('coin-1', 10, 55.7558, 37.6173, 'https://example.com/coin.png'),
+             ('star-1', 1, 0.0, -180.0, 'https://example.com/star.png')],
+        )
+        for item in CollectibleItem.objects.all():
+            self.assertEqual(item.geohash, geohash.encode(item.latitude, item.longitude))
+
+    def test_xlsx(self):
+        with mock.patch.object(importers, 'items_changed') as items_changed:
+            response = self.upload('items.xlsx', self.xlsx([self.HEADER] + self.ROWS),
+                                   'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        items_changed.assert_called_once_with()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [self.ROWS[1], self.ROWS[2], self.ROWS[4]])
+        self.assertImported()
+
+    def test_csv(self):
+        lines = [';'.join('' if value is None else str(value) for value in row) for row in [self.HEADER] + self.ROWS]
+        response = self.upload('items.csv', '\n'.join(lines).encode('utf-8-sig'), 'text/csv')
+        self.assertEqual(response.status_code, 200)
+        # ячейки csv приходят строками, пустые - None
+        self.assertEqual(response.json(), [
+            [None if value is None else str(value) for value in row] for row in (self.ROWS[1], self.ROWS[2], self.ROWS[4])
+        ])
+        self.assertImported()
+
+    def test_empty_file(self):
+        for name, content, content_type in [
+            ('empty.xlsx', self.xlsx([]), 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+            ('header.xlsx', self.xlsx([self.HEADER]), 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+            ('empty.csv', b'', 'text/csv'),
+            ('invalid.xlsx', self.xlsx([self.HEADER, self.ROWS[1], self.ROWS[2]]),
+             'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+        ]:
+            with self.subTest(name=name), mock.patch.object(importers, 'items_changed') as items_changed:
+                response = self.upload(name, content, content_type)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()), 2 if name == 'invalid.xlsx' else 0)
+                # ничего не создано - версия каталога и кеш ответов не меняются
+                items_changed.assert_not_called()
+        self.assertFalse(CollectibleItem.objects.exists())
+
+    def test_missing_file(self):
+        response = self.client.post('/api/upload_file/', {})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'detail': 'Файл не передан (key: file)'})
+
+
+class ImportJobTest(TransactionTestCase):
+    # ?background=1: задача доходит до finished/failed, прогресс виден в GET /api/upload_file/<job_id>/
+    def setUp(self):
+        upload_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(upload_dir.cleanup)
+        settings_override = override_settings(IMPORT_UPLOAD_DIR=upload_dir.name, COLLECTIBLE_IMPORT_BATCH_SIZE=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        # свой пул, чтобы дождаться окончания задачи
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(self.executor.shutdown)
+        executor_patch = mock.patch.object(jobs, 'get_executor', return_value=self.executor)
+        executor_patch.start()
+        self.addCleanup(executor_patch.stop)
+
+        # после каждой пачки запрашиваем статус из потока задачи
+        self.reported = []
+        import_items = importers.import_collectible_items
+
+        def observed(uploaded_file, progress=None, **kwargs):
+            def observe(processed, rejected):
+                progress(processed, rejected)
+                job_id = ImportJob.objects.get().id
+                self.reported.append(Client().get(f'/api/upload_file/{job_id}/').json())
+            return import_items(uploaded_file, progress=observe, **kwargs)
+
+        import_patch = mock.patch.object(jobs, 'import_collectible_items', observed)
+        import_patch.start()
+        self.addCleanup(import_patch.stop)
+
+    def upload(self, name, content, content_type):
+        response = self.client.post('/api/upload_file/?background=1',
+                                    {'file': SimpleUploadedFile(name, content, content_type)})
+        self.assertEqual(response.status_code, 202)
+        job = ImportJob.objects.get()
+        self.assertEqual(response.json(), {'job_id': job.id, 'status': 'queued',
+                                           'status_url': f'/api/upload_file/{job.id}/'})
+        self.executor.shutdown(wait=True)
+        return job, self.client.get(response.json()['status_url']).json()
+
+    def test_finished(self):
+        content = CollectibleUploadTest.xlsx([CollectibleUploadTest.HEADER] + CollectibleUploadTest.ROWS)
+        job, status = self.upload('items.xlsx', content,
+                                  'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+        self.assertEqual(status['status'], 'finished')
+        self.assertEqual((status['rows_processed'], status['rows_rejected']), (5, 3))
+        self.assertEqual(status['invalid_rows'], [CollectibleUploadTest.ROWS[i] for i in (1, 2, 4)])
+        self.assertEqual(status['error'], '')
+        self.assertIsNotNone(status['finished_at'])
+        self.assertIsNotNone(status['rows_per_second'])
+        self.assertEqual(CollectibleItem.objects.count(), 2)
+        self.assertFalse(os.path.exists(job.file_path))
+
+        # прогресс растет по пачкам, пока задача в статусе running
+        self.assertEqual([report['status'] for report in self.reported], ['running'] * 3)
+        self.assertEqual([(report['rows_processed'], report['rows_rejected']) for report in self.reported],
+                         [(2, 1), (3, 2), (5, 3)])
+        self.assertTrue(all(report['invalid_rows'] == [] for report in self.reported))
+
+    def test_failed(self):
+        with self.assertLogs('app_run.jobs', 'ERROR'):
+            job, status = self.upload('items.xlsx', b'not a workbook',
+                                      'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+        self.assertEqual(status['status'], 'failed')
+        self.assertTrue(status['error'])
+        self.assertIsNotNone(status['finished_at'])
+        self.assertEqual(self.reported, [])
+        self.assertFalse(CollectibleItem.objects.exists())
+        self.assertFalse(os.path.exists(job.file_path))
+
+
+class ItemGridTest(SimpleTestCase):
+    # кандидаты из соседних ячеек сетки дают тот же результат, что и перебор всех предметов
+    RADIUS = 100
+
+    def grid_and_items(self, centers, seed=18):
+        rng = np.random.default_rng(seed)
+        latitudes, longitudes = [], []
+        for lat, lon in centers:
+            latitudes.append(np.clip(lat + rng.uniform(-0.003, 0.003, 200), -90, 90))
+            longitudes.append((lon + rng.uniform(-0.003, 0.003, 200) + 180) % 360 - 180)
+        latitudes, longitudes = np.concatenate(latitudes), np.concatenate(longitudes)
+        ids = np.arange(1, len(latitudes) + 1, dtype=np.int64)
+        return pickups.ItemGrid(ids, latitudes, longitudes, self.RADIUS), ids, latitudes, longitudes
+
+    def assertMatchesBruteForce(self, centers):
+        grid, ids, latitudes, longitudes = self.grid_and_items(centers)
+        rng = np.random.default_rng(1)
+        for lat, lon in centers:
+            points_lat = np.clip(lat + rng.uniform(-0.003, 0.003, 30), -90, 90)
+            points_lon = (lon + rng.uniform(-0.003, 0.003, 30) + 180) % 360 - 180
+            distances = pickups.haversine(points_lat[:, None], points_lon[:, None], latitudes[None, :], longitudes[None, :])
+            expected = ids[(distances <= self.RADIUS).any(axis=0)].tolist()
+            with self.subTest(center=(lat, lon)):
+                self.assertTrue(expected)
+                self.assertEqual(grid.find(points_lat, points_lon), expected)
+                # по одной точке - то же, что пакетом
+                found = set()
+                for point in zip(points_lat, points_lon):
+                    found.update(grid.find([point[0]], [point[1]]))
+                self.assertEqual(sorted(found), expected)
+
+    def test_regular_latitudes(self):
+        self.assertMatchesBruteForce([(55.75, 37.61), (0.0, 0.0), (-33.87, 151.21)])
+
+    def test_antimeridian(self):
+        self.assertMatchesBruteForce([(0.0, 180.0), (64.0, -179.999), (-45.0, 179.9995)])
+
+    def test_poles(self):
+        self.assertMatchesBruteForce([(89.999, 0.0), (90.0, 120.0), (-89.9995, -60.0), (-90.0, 0.0)])
+
+    def test_empty(self):
+        grid = pickups.ItemGrid(np.empty(0, dtype=np.int64), np.empty(0), np.empty(0), self.RADIUS)
+        self.assertEqual(grid.find([55.0], [37.0]), [])
+
+
+class PickupIngestTest(TestCase):
+    # подбор при записи точки: предмет в радиусе собирается атлетом один раз
+
+    def setUp(self):
+        cache.clear()
+        self.athlete = User.objects.create(username='runner')
+        self.active_run = Run.objects.create(athlete=self.athlete, comment='run', status='in_progress')
+        self.item = CollectibleItem.objects.create(name='coin', uid='coin-1', latitude=55.7558, longitude=37.6173,
+                                                   picture='https://example.com/coin.png', value=10)
+        CollectibleItem.objects.create(name='far', uid='far-1', latitude=55.7658, longitude=37.6173,
+                                       picture='https://example.com/far.png', value=10)
+        with self.captureOnCommitCallbacks(execute=True):
+            pickups.items_changed()
+
+    def test_recorded_once(self):
+        point = {'run': self.active_run.id, 'latitude': 55.7560, 'longitude': 37.6175}
+        for _ in range(2):
+            self.assertEqual(self.client.post('/api/positions/', point, content_type='application/json').status_code, 201)
+        self.client.post('/api/positions/batch/', [point, point], content_type='application/json')
+        self.assertEqual(list(Pickup.objects.values_list('athlete_id', 'item_id', 'run_id')),
+                         [(self.athlete.id, self.item.id, self.active_run.id)])
+        self.assertEqual([row['item'] for row in self.client.get(f'/api/pickups/?athlete={self.athlete.id}').json()],
+                         [self.item.id])
+
+    def test_version_changes_on_commit(self):
+        grid = pickups.get_grid()
+        with self.captureOnCommitCallbacks(execute=True):
+            near = CollectibleItem.objects.create(name='gem', uid='gem-1', latitude=55.7560, longitude=37.6180,
+                                                  picture='https://example.com/gem.png', value=5)
+            pickups.items_changed()
+            # до коммита другие процессы видят старую версию и не перестраивают сетку
+            self.assertIs(pickups.get_grid(), grid)
+        self.assertIsNot(pickups.get_grid(), grid)
+        self.assertIn(near.id, pickups.get_grid().find([55.7560], [37.6180]))
+
+
+class FastListResponsesTest(TestCase):
+    # быстрый путь list-эндпоинтов должен совпадать с DRF-сериализаторами байт в байт
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.athlete = User.objects.create(username='runner', first_name='Иван', last_name='Бегун "quoted"')
+        cls.coach = User.objects.create(username='coach', first_name='Coach', is_staff=True)
+        cls.runs = [
+            Run.objects.create(athlete=cls.athlete, comment=f'run {i} ✓', status=status)
+            for i, status in enumerate(['init', 'in_progress', 'finished', 'finished', 'in_progress'])
+        ]
+        for lat, lon in [(55.7558, 37.6173), (-0.0005, -179.9999), (0, 0), (89.9999, 180)]:
+            Position.objects.create(run=cls.runs[1], latitude=lat, longitude=lon)
+        Position.objects.create(run=cls.runs[4], latitude=1.5, longitude=-2.25)
+        finished = cls.runs[2]
+        finished.distance = 12.345
+        finished.running_distance = 12.3449999
+        finished.save()
+        cls.archived_run = Run.objects.create(athlete=cls.athlete, comment='archived', status='in_progress')
+        for lat, lon in [(-33.8688, 151.2093), (-33.87, 151.21), (-33.8701, -0.0001), (-90, -180)]:
+            Position.objects.create(run=cls.archived_run, latitude=lat, longitude=lon)
+        # ответ DRF по строкам Position - до упаковки и архивации трека
+        cls.expected_positions = {
+            run.id: JSONRenderer().render(
+                PositionSerializer(Position.objects.filter(run=run).order_by('id'), many=True).data
+            )
+            for run in (cls.runs[1], cls.runs[4], cls.archived_run)
+        }
+        client = cls.client_class()
+        for run in (cls.runs[4], cls.archived_run):
+            client.post(f'/api/runs/{run.id}/stop/')
+        Run.objects.filter(id=cls.archived_run.id).update(finished_at=timezone.now() - datetime.timedelta(days=40))
+        archive_positions()
+
+    def assertSameResponse(self, url):
+        with override_settings(FAST_LIST_RESPONSES=False):
+            expected = self.client.get(url)
+        actual = self.client.get(url)
+        self.assertEqual(actual.status_code, expected.status_code)
+        self.assertEqual(actual['Content-Type'], expected['Content-Type'])
+        self.assertEqual(actual.content, expected.content)
+
+    def test_runs_list(self):
+        for url in [
+            '/api/runs/',
+            '/api/runs/?status=finished',
+            f'/api/runs/?athlete={self.athlete.id}&ordering=-created_at',
+            '/api/runs/?size=2&page=2',
+            '/api/runs/?pagination=cursor&size=2',
+        ]:
+            with self.subTest(url=url):
+                self.assertSameResponse(url)
+
+    def test_users_list(self):
+        for url in ['/api/users/', '/api/users/?type=coach', '/api/users/?search=Иван', '/api/users/?size=1']:
+            with self.subTest(url=url):
+                self.assertSameResponse(url)
+
+    def test_positions_list(self):
+        for url in [
+            '/api/positions/',
+            f'/api/positions/?run={self.runs[1].id}',
+            f'/api/positions/?run={self.runs[4].id}',
+            '/api/positions/?pagination=cursor&size=2',
+        ]:
+            with self.subTest(url=url):
+                self.assertSameResponse(url)
+
+    def test_stored_positions(self):
+        # упакованный (runs[4]) и заархивированный трек отдаются так же, как PositionSerializer по строкам
+        self.assertFalse(Position.objects.filter(run=self.archived_run).exists())
+        for run_id, expected in self.expected_positions.items():
+            for fast in (True, False):
+                with self.subTest(run=run_id, fast=fast), override_settings(FAST_LIST_RESPONSES=fast):
+                    response = self.client.get(f'/api/positions/?run={run_id}')
+                    self.assertEqual(response['Content-Type'], 'application/json')
+                    self.assertEqual(response.content, expected)
+
+
+class QueryPlanTest(TestCase):
+    # горячие запросы не должны сканировать или сортировать большие таблицы целиком
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.athlete = User.objects.create(username='runner')
+        User.objects.create(username='coach', is_staff=True)
+        cls.active_run = Run.objects.create(athlete=cls.athlete, comment='run', status='in_progress')
+        Run.objects.create(athlete=cls.athlete, comment='done', status='finished')
+        for i in range(3):
+            Position.objects.create(run=cls.active_run, latitude=55 + i / 1000, longitude=37)
+
+    def assertIndexedPlans(self, queries):
+        self.assertTrue(queries)
+        problems = plan_problems(queries)
+        self.assertFalse(problems, '\n'.join(problems))
+
+    def test_endpoints(self):
+        for url in [
+            f'/api/positions/?run={self.active_run.id}',
+            f'/api/positions/?run={self.active_run.id}&pagination=cursor',
+            f'/api/runs/?athlete={self.athlete.id}&status=finished',
+            f'/api/runs/?athlete={self.athlete.id}',
+            f'/api/runs/?athlete={self.athlete.id}&pagination=cursor',
+            '/api/runs/?pagination=cursor',
+            '/api/runs/?ordering=created_at',
+            '/api/runs/?ordering=-created_at',
+            '/api/users/',
+            '/api/users/?pagination=cursor',
+            '/api/users/?type=coach',
+            '/api/users/?type=athlete&pagination=cursor',
+            f'/api/challenges/?athlete={self.athlete.id}',
+            f'/api/leaderboard/?period=week&metric=runs&athlete={self.athlete.id}',
+            f'/api/leaderboard/?period=all&metric=distance&athlete={self.athlete.id}',
+        ]:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as ctx:
+                    self.assertEqual(self.client.get(url).status_code, 200)
+                self.assertIndexedPlans(ctx.captured_queries)
+
+    def test_run_track(self):
+        with CaptureQueriesContext(connection) as ctx:
+            load_track(self.active_run.id)
+        self.assertIndexedPlans(ctx.captured_queries)
+
+    def test_detects_full_scan(self):
+        self.assertTrue(plan_problems(['SELECT * FROM app_run_position WHERE latitude > 0']))
+        self.assertTrue(plan_problems(['SELECT * FROM app_run_run ORDER BY comment']))
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class ResponseCacheTest(TestCase):
+    # кешированный ответ с ETag: 304 по If-None-Match, запись меняет версию после коммита
+
+    def setUp(self):
+        cache.clear()
+        self.athlete = User.objects.create(username='runner')
+        self.url = f'/api/athlete_info/{self.athlete.id}/'
+
+    def test_not_modified(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url)
+        self.assertEqual((cached.content, cached['ETag']), (first.content, first['ETag']))
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_put_invalidates(self):
+        first = self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(self.url, {'goals': 'marathon', 'weight': 70}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual(response.json(), {'user_id': self.athlete.id, 'goals': 'marathon', 'weight': 70})
+
+    def test_disabled(self):
+        with override_settings(RESPONSE_CACHE_ENABLED=False):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+
+class RunTransitionTest(TestCase):
+    # старт/стоп - один условный UPDATE, пакетный эндпоинт переводит много забегов за запрос
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.athlete = User.objects.create(username='runner')
+
+    def test_single_transitions(self):
+        run = Run.objects.create(athlete=self.athlete, comment='run')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.post(f'/api/runs/{run.id}/start/').status_code, 200)
+        self.assertEqual(self.client.post(f'/api/runs/{run.id}/start/').status_code, 400)
+        self.assertEqual(self.client.post(f'/api/runs/{run.id}/stop/').status_code, 200)
+        self.assertEqual(self.client.post(f'/api/runs/{run.id}/stop/').status_code, 400)
+        self.assertEqual(self.client.post('/api/runs/999999/stop/').status_code, 404)
+
+        run.refresh_from_db()
+        self.assertEqual(run.status, 'finished')
+        self.assertEqual(run.comment, 'run')
+        self.assertIsNotNone(run.finished_at)
+        self.assertEqual(AthleteStats.objects.get(user=self.athlete).finished_runs, 1)
+
+    def test_lifecycle(self):
+        runs = [Run.objects.create(athlete=self.athlete, comment=f'run {i}') for i in range(3)]
+        ids = [run.id for run in runs]
+        self.client.post(f'/api/runs/{ids[0]}/start/')
+
+        response = self.client.post('/api/runs/lifecycle/', {'action': 'start', 'runs': ids + [999999]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'changed': ids[1:],
+            'rejected': [{'id': ids[0], 'status': 'in_progress'}, {'id': 999999, 'status': None}],
+        })
+
+        response = self.client.post('/api/runs/lifecycle/', {'action': 'stop', 'runs': ids},
+                                    content_type='application/json')
+        self.assertEqual(response.json(), {'changed': ids, 'rejected': []})
+        self.assertEqual(AthleteStats.objects.get(user=self.athlete).finished_runs, 3)
+
+        response = self.client.post('/api/runs/lifecycle/', {'action': 'stop', 'runs': ids},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        for body in [{'action': 'pause', 'runs': ids}, {'action': 'stop', 'runs': []},
+                     {'action': 'stop', 'runs': ['1']}, ids]:
+            with self.subTest(body=body):
+                response = self.client.post('/api/runs/lifecycle/', body, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+
+
+class PositionBatchTest(TestCase):
+    # пакет точек: валидные пишутся, ошибки - по индексу и в формате PositionSerializer
+
+    @classmethod
+    def setUpTestData(cls):
+        athlete = User.objects.create(username='runner')
+        cls.active_run = Run.objects.create(athlete=athlete, comment='run', status='in_progress')
+        cls.finished_run = Run.objects.create(athlete=athlete, comment='done', status='finished')
+
+    def post(self, body):
+        return self.client.post('/api/positions/batch/', body, content_type='application/json')
+
+    def test_mixed_batch(self):
+        items = [
+            {'run': self.active_run.id, 'latitude': 55, 'longitude': 37},
+            {'run': self.active_run.id, 'latitude': 95, 'longitude': 37},
+            {'run': self.active_run.id, 'latitude': 'x'},
+            'not a point',
+            {'run': 999999, 'latitude': 1, 'longitude': 1},
+            {'run': self.finished_run.id, 'latitude': 1, 'longitude': 1},
+            {'latitude': 1, 'longitude': 200},
+            {'run': 'abc', 'latitude': 1, 'longitude': 1},
+            {'run': self.finished_run.id, 'latitude': -91, 'longitude': 1},
+            {'run': str(self.active_run.id), 'latitude': '55.0100', 'longitude': 37},
+        ]
+        response = self.post(items)
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(data['created'], 2)
+        self.assertEqual([error['index'] for error in data['errors']], [1, 2, 3, 4, 5, 6, 7, 8])
+        for error in data['errors']:
+            with self.subTest(index=error['index']):
+                serializer = PositionSerializer(data=items[error['index']])
+                self.assertFalse(serializer.is_valid())
+                self.assertEqual(error['errors'], serializer.errors)
+
+        self.assertEqual(
+            list(Position.objects.filter(run=self.active_run).order_by('id').values_list('latitude', 'longitude')),
+            [(Decimal('55.0000'), Decimal('37.0000')), (Decimal('55.0100'), Decimal('37.0000'))],
+        )
+        self.assertFalse(Position.objects.filter(run=self.finished_run).exists())
+        self.active_run.refresh_from_db()
+        self.assertEqual(self.active_run.last_position, Position.objects.filter(run=self.active_run).latest('id'))
+        self.assertAlmostEqual(self.active_run.running_distance, 1.113, places=3)
+
+    def test_rejected_batches(self):
+        response = self.post({'positions': [{'run': self.finished_run.id, 'latitude': 1, 'longitude': 1}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {
+            'created': 0, 'errors': [{'index': 0, 'errors': {'run': ["Run must be in status 'in_progress'."]}}],
+        })
+        for body in [[], {'positions': []}, {'run': self.active_run.id}, 'points']:
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body).status_code, 400)
+        self.assertFalse(Position.objects.exists())
+
+    @override_settings(POSITION_BATCH_MAX_SIZE=3)
+    def test_max_size(self):
+        point = {'run': self.active_run.id, 'latitude': 55, 'longitude': 37}
+        response = self.post([point] * 4)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'detail': 'Batch is too large: 4 > 3.'})
+        self.assertEqual(self.post({'positions': [point] * 3}).json(), {'created': 3, 'errors': []})
+
+
+class SavePositionTest(TestCase):
+    # статус забега перепроверяется под блокировкой: точка не попадает в уже завершённый забег
+
+    def test_run_finished_after_validation(self):
+        run = Run.objects.create(athlete=User.objects.create(username='runner'), comment='run', status='in_progress')
+        serializer = PositionSerializer(data={'run': run.id, 'latitude': 55, 'longitude': 37})
+        self.assertTrue(serializer.is_valid())
+        self.assertEqual(self.client.post(f'/api/runs/{run.id}/stop/').status_code, 200)
+
+        with self.assertRaises(ValidationError) as ctx:
+            save_position(serializer)
+        self.assertEqual(ctx.exception.detail, {'run': ["Run must be in status 'in_progress'."]})
+        self.assertFalse(Position.objects.filter(run=run).exists())
+        run.refresh_from_db()
+        self.assertEqual((run.running_distance, run.last_position_id), (0, None))
+
+
+class RunningDistanceTest(TestCase):
+    # накопленная дистанция по одной точке и пакетами совпадает с полным пересчётом (режим сверки)
+
+    def setUp(self):
+        self.athlete = User.objects.create(username='runner')
+        rng = random.Random(2)
+        lat, lon = 55.75, 37.61
+        self.points = []
+        for _ in range(60):
+            lat, lon = lat + rng.uniform(-0.001, 0.001), lon + rng.uniform(-0.001, 0.001)
+            self.points.append({'latitude': round(lat, 4), 'longitude': round(lon, 4)})
+
+    def start(self):
+        return Run.objects.create(athlete=self.athlete, comment='run', status='in_progress')
+
+    def assertReconciled(self, run):
+        run.refresh_from_db()
+        incremental, full = reconcile_run_distance(run)
+        self.assertGreater(full, 0)
+        self.assertAlmostEqual(incremental, full, places=9)
+        return run
+
+    def test_single_and_batch(self):
+        single = self.start()
+        for point in self.points:
+            self.client.post('/api/positions/', {'run': single.id, **point}, content_type='application/json')
+        batched = self.start()
+        for start in range(0, len(self.points), 7):
+            body = [{'run': batched.id, **point} for point in self.points[start:start + 7]]
+            self.assertEqual(self.client.post('/api/positions/batch/', body, content_type='application/json').status_code, 201)
+
+        self.assertAlmostEqual(
+            self.assertReconciled(single).running_distance, self.assertReconciled(batched).running_distance, places=9,
+        )
+
+    @override_settings(RUN_DISTANCE_RECONCILE=True)
+    def test_finish_in_reconcile_mode(self):
+        run = self.start()
+        self.client.post('/api/positions/batch/', [{'run': run.id, **point} for point in self.points],
+                         content_type='application/json')
+        full = self.assertReconciled(run).running_distance
+        with self.assertNoLogs('app_run.tracking', level='WARNING'):
+            self.assertEqual(self.client.post(f'/api/runs/{run.id}/stop/').status_code, 200)
+        run.refresh_from_db()
+        self.assertEqual(run.distance, round(full, 3))
+
+        # расхождение попадает в лог, завершение берёт полный пересчёт
+        drifted = self.start()
+        self.client.post('/api/positions/batch/', [{'run': drifted.id, **point} for point in self.points],
+                         content_type='application/json')
+        Run.objects.filter(id=drifted.id).update(running_distance=full + 1)
+        with self.assertLogs('app_run.tracking', level='WARNING') as logs:
+            self.client.post(f'/api/runs/{drifted.id}/stop/')
+        self.assertIn(f'Run {drifted.id} distance mismatch', logs.output[0])
+        drifted.refresh_from_db()
+        self.assertEqual(drifted.distance, round(full, 3))
+
+    def test_command(self):
+        runs = [self.start() for _ in range(2)]
+        for run in runs:
+            self.client.post('/api/positions/batch/', [{'run': run.id, **point} for point in self.points],
+                             content_type='application/json')
+        Run.objects.filter(id=runs[1].id).update(running_distance=0.5)
+
+        out = io.StringIO()
+        call_command('reconcile_run_distance', stdout=out)
+        self.assertIn(f'run {runs[1].id}: incremental=0.500000 km', out.getvalue())
+        self.assertIn('checked: 2, mismatched: 1', out.getvalue())
+
+        call_command('reconcile_run_distance', '--fix', stdout=io.StringIO())
+        for run in runs:
+            self.assertReconciled(run)
+        out = io.StringIO()
+        call_command('reconcile_run_distance', stdout=out)
+        self.assertIn('checked: 2, mismatched: 0', out.getvalue())
+
+
+class MigrationSnapshotTest(SimpleTestCase):
+    # копии кода в исторических миграциях считают так же, как текущие модули
+
+    def test_haversine(self):
+        migration = importlib.import_module('app_run.migrations.0012_run_running_distance')
+        rng = random.Random(3)
+        for _ in range(20):
+            points = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(rng.randint(0, 10))]
+            with self.subTest(points=points):
+                self.assertAlmostEqual(
+                    migration.haversine_km(points), track_distance_km(as_track(points), 'haversine'), places=9,
+                )
+        self.assertEqual(migration.haversine_km([(Decimal('55.7500'), Decimal('37.6100'))]), 0)
+
+    def test_geohash(self):
+        migration = importlib.import_module('app_run.migrations.0014_collectibleitem_geohash')
+        rng = random.Random(4)
+        points = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(500)]
+        points += [(-90, -180), (90, 180), (0, 0), (55.7558, 37.6173)]
+        for lat, lon in points:
+            self.assertEqual(migration.encode(lat, lon), geohash.encode(lat, lon))
+
+
+class FinishedRunEditTest(TestCase):
+    # правка точек завершённого забега пересчитывает дистанции и сводку по новому треку
+
+    def setUp(self):
+        self.athlete = User.objects.create(username='runner')
+        self.finished_run = Run.objects.create(athlete=self.athlete, comment='run', status='in_progress')
+        for i in range(5):
+            self.client.post('/api/positions/', {'run': self.finished_run.id, 'latitude': 55 + i / 100, 'longitude': 37},
+                             content_type='application/json')
+        self.client.post(f'/api/runs/{self.finished_run.id}/stop/')
+
+    def assertRebuilt(self):
+        rows = Position.objects.filter(run=self.finished_run).order_by('id').values_list('latitude', 'longitude')
+        expected = track_distance_km(as_track(list(rows)))
+        self.finished_run.refresh_from_db()
+        self.assertAlmostEqual(self.finished_run.running_distance, expected, places=6)
+        self.assertEqual(self.finished_run.distance, round(expected, 3))
+        self.assertEqual(self.finished_run.summary['distance'], round(expected, 3))
+        self.assertEqual(self.finished_run.summary['point_count'], len(rows))
+        self.assertAlmostEqual(AthleteStats.objects.get(user=self.athlete).total_distance, self.finished_run.distance)
+        self.assertEqual(
+            [(row['latitude'], row['longitude']) for row in self.client.get(f'/api/positions/?run={self.finished_run.id}').json()],
+            [(str(lat), str(lon)) for lat, lon in rows],
+        )
+
+    def test_update_last_point(self):
+        before = Run.objects.get(id=self.finished_run.id).distance
+        last = Position.objects.filter(run=self.finished_run).latest('id')
+        response = self.client.patch(f'/api/positions/{last.id}/', {'latitude': 55.05, 'longitude': 37.01},
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertRebuilt()
+        self.assertNotEqual(self.finished_run.distance, before)
+        self.assertEqual(self.finished_run.summary['end'], {'latitude': 55.05, 'longitude': 37.01})
+
+    def test_delete_point(self):
+        last = Position.objects.filter(run=self.finished_run).latest('id')
+        self.assertEqual(self.client.delete(f'/api/positions/{last.id}/').status_code, 204)
+        self.assertRebuilt()
+        self.assertEqual(self.finished_run.summary['end'], {'latitude': 55.03, 'longitude': 37.0})
+
+
+class ArchivedRunEditTest(TestCase):
+    # точки частично заархивированного забега не меняются: упакованный трек не затирается остатком строк
+
+    def setUp(self):
+        self.finished_run = Run.objects.create(athlete=User.objects.create(username='runner'), comment='run',
+                                               status='in_progress')
+        for i in range(5):
+            self.client.post('/api/positions/', {'run': self.finished_run.id, 'latitude': 55 + i / 100, 'longitude': 37},
+                             content_type='application/json')
+        self.client.post(f'/api/runs/{self.finished_run.id}/stop/')
+        # архивация прервана: трек помечен, часть строк уже удалена
+        RunTrack.objects.filter(run=self.finished_run).update(archived_at=timezone.now())
+        Position.objects.filter(id__in=Position.objects.filter(run=self.finished_run).order_by('id')[:2]
+                                .values_list('id', flat=True)).delete()
+        self.track = RunTrack.objects.get(run=self.finished_run)
+        self.finished_run.refresh_from_db()
+
+    def assertUnchanged(self, response):
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'run': ['Positions of an archived run cannot be changed.']})
+        track = RunTrack.objects.get(run=self.finished_run)
+        self.assertEqual((bytes(track.data), track.point_count), (bytes(self.track.data), 5))
+        run = Run.objects.get(id=self.finished_run.id)
+        self.assertEqual((run.distance, run.summary), (self.finished_run.distance, self.finished_run.summary))
+        self.assertEqual(Position.objects.filter(run=self.finished_run).count(), 3)
+
+    def test_update(self):
+        last = Position.objects.filter(run=self.finished_run).latest('id')
+        self.assertUnchanged(self.client.patch(f'/api/positions/{last.id}/', {'latitude': 56},
+                                               content_type='application/json'))
+        last.refresh_from_db()
+        self.assertEqual(last.latitude, Decimal('55.0400'))
+
+    def test_move_to_other_run(self):
+        other = Run.objects.create(athlete=self.finished_run.athlete, comment='other', status='in_progress')
+        last = Position.objects.filter(run=self.finished_run).latest('id')
+        self.assertUnchanged(self.client.patch(f'/api/positions/{last.id}/', {'run': other.id},
+                                               content_type='application/json'))
+        other.refresh_from_db()
+        self.assertEqual((other.running_distance, other.last_position_id), (0, None))
+
+    def test_delete(self):
+        last = Position.objects.filter(run=self.finished_run).latest('id')
+        self.assertUnchanged(self.client.delete(f'/api/positions/{last.id}/'))
+
+    def test_refresh(self):
+        with self.assertRaises(ValidationError):
+            refresh_finished_run(self.finished_run)
+        self.assertEqual(bytes(RunTrack.objects.get(run=self.finished_run).data), bytes(self.track.data))
+
+
+class RunTransitionConcurrencyTest(TransactionTestCase):
+    # параллельные старты и стопы одного забега: побеждает ровно один запрос
+    THREADS = 8
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            # потоки in-memory SQLite делят одну базу с блокировкой таблиц, а не ждут друг друга
+            self.skipTest('needs a database with independent connections')
+
+    def race(self, url) -> list:
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+
+        def request():
+            try:
+                barrier.wait()
+                results.append(Client().post(url).status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=request) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(results)
+
+    def test_one_winner(self):
+        athlete = User.objects.create(username='runner')
+        run = Run.objects.create(athlete=athlete, comment='run')
+        losers = [400] * (self.THREADS - 1)
+        self.assertEqual(self.race(f'/api/runs/{run.id}/start/'), [200] + losers)
+        self.assertEqual(self.race(f'/api/runs/{run.id}/stop/'), [200] + losers)
+        self.assertEqual(AthleteStats.objects.get(user=athlete).finished_runs, 1)
+
+
+class ArchivePositionsTest(TestCase):
+    # точки давно завершённых забегов уходят из Position, чтения отдают тот же трек из RunTrack
+
+    def setUp(self):
+        athlete = User.objects.create(username='runner')
+        long_ago = timezone.now() - datetime.timedelta(days=40)
+        self.old_run = self.create_run(athlete, finish=True)
+        Run.objects.filter(id=self.old_run.id).update(finished_at=long_ago)
+        # забег, завершённый до появления finished_at: трек не упакован, finished_at пуст
+        self.legacy_run = Run.objects.create(athlete=athlete, comment='legacy', status='finished')
+        Run.objects.filter(id=self.legacy_run.id).update(created_at=long_ago)
+        for i in range(4):
+            Position.objects.create(run=self.legacy_run, latitude=-33.9 - i / 100, longitude=151.2)
+        self.recent_run = self.create_run(athlete, finish=True)
+        self.active_run = self.create_run(athlete, finish=False)
+        Run.objects.filter(id=self.active_run.id).update(created_at=long_ago)
+        self.archived_ids = [self.old_run.id, self.legacy_run.id]
+
+    def create_run(self, athlete, finish):
+        run = Run.objects.create(athlete=athlete, comment='run')
+        self.client.post(f'/api/runs/{run.id}/start/')
+        for i in range(5):
+            self.client.post('/api/positions/', {'run': run.id, 'latitude': 55 + i / 100, 'longitude': 37},
+                             content_type='application/json')
+        if finish:
+            self.client.post(f'/api/runs/{run.id}/stop/')
+        return run
+
+    def responses(self, run_id) -> list[bytes]:
+        # список точек забега и все keyset-страницы по ссылкам next
+        pages = [self.client.get(f'/api/positions/?run={run_id}').content]
+        url = f'/api/positions/?run={run_id}&pagination=cursor&size=2'
+        while url:
+            response = self.client.get(url)
+            pages.append(response.content)
+            url = response.json()['next']
+        return pages
+
+    def test_archive(self):
+        before = {run_id: self.responses(run_id) for run_id in self.archived_ids}
+        self.assertEqual(archive_positions(chunk_size=2), (2, 9))
+
+        self.assertFalse(Position.objects.filter(run_id__in=self.archived_ids).exists())
+        self.assertEqual(Position.objects.filter(run__in=[self.recent_run, self.active_run]).count(), 10)
+        self.assertEqual(RunTrack.objects.filter(archived_at__isnull=False).count(), 2)
+        for run_id in self.archived_ids:
+            with self.subTest(run=run_id):
+                self.assertEqual(self.responses(run_id), before[run_id])
+        self.assertEqual(archive_positions(), (0, 0))
+
+    def test_resume_after_interruption(self):
+        before = {run_id: self.responses(run_id) for run_id in self.archived_ids}
+        real_delete = QuerySet.delete
+        deletes = []
+
+        def interrupted_delete(queryset):
+            if deletes:
+                raise RuntimeError('interrupted')
+            deletes.append(queryset)
+            return real_delete(queryset)
+
+        with mock.patch.object(QuerySet, 'delete', interrupted_delete), self.assertRaises(RuntimeError):
+            archive_positions(chunk_size=2)
+        # трек уже помечен и полон, хотя часть строк ещё в Position
+        self.assertEqual(Position.objects.filter(run=self.old_run).count(), 3)
+        self.assertEqual(self.responses(self.old_run.id), before[self.old_run.id])
+
+        self.assertEqual(archive_positions(chunk_size=2), (2, 7))
+        self.assertFalse(Position.objects.filter(run_id__in=self.archived_ids).exists())
+        for run_id in self.archived_ids:
+            with self.subTest(run=run_id):
+                self.assertEqual(self.responses(run_id), before[run_id])
+
+
+class ChallengeRulesTest(TestCase):
+    # награды по порогам AthleteStats: при остановке забега и пересмотром всех атлетов (backfill)
+    TEN_RUNS = 'Сделай 10 Забегов!'
+    FIFTY_KM = 'Пробеги 50 километров!'
+
+    def setUp(self):
+        self.athlete = User.objects.create(username='runner')
+
+    def finish(self, distance=0.0):
+        run = Run.objects.create(athlete=self.athlete, comment='run', status='in_progress', running_distance=distance)
+        self.assertEqual(self.client.post(f'/api/runs/{run.id}/stop/').status_code, 200)
+
+    def awarded(self, athlete=None) -> list[str]:
+        return sorted(Challenge.objects.filter(athlete=athlete or self.athlete).values_list('full_name', flat=True))
+
+    def test_crossed(self):
+        rules = challenges.RuleSet([
+            challenges.FinishedRunsRule('5 runs', 5),
+            challenges.FinishedRunsRule('1 run', 1),
+            challenges.DistanceRule('10 km', 10),
+        ])
+        stats = {'finished_runs': 0, 'total_distance': 0.0}
+        self.assertEqual(rules.crossed(stats, {'finished_runs': 1, 'total_distance': 9.99}), ['1 run'])
+        self.assertEqual(rules.crossed({'finished_runs': 1, 'total_distance': 9.99},
+                                       {'finished_runs': 5, 'total_distance': 10.0}), ['5 runs', '10 km'])
+        self.assertEqual(rules.crossed({'finished_runs': 5, 'total_distance': 10.0},
+                                       {'finished_runs': 6, 'total_distance': 20.0}), [])
+        self.assertEqual(rules.reached({'finished_runs': 7, 'total_distance': 0.0}), ['1 run', '5 runs'])
+
+    def test_ten_runs(self):
+        for _ in range(9):
+            self.finish()
+        self.assertEqual(self.awarded(), [])
+        self.finish()
+        self.assertEqual(self.awarded(), [self.TEN_RUNS])
+        self.finish()
+        self.assertEqual(self.awarded(), [self.TEN_RUNS])
+
+    def test_fifty_km(self):
+        self.finish(49.9)
+        self.assertEqual(self.awarded(), [])
+        self.finish(0.1)
+        self.assertEqual(self.awarded(), [self.FIFTY_KM])
+
+    def test_backfill(self):
+        others = [User.objects.create(username=f'athlete {i}') for i in range(3)]
+        AthleteStats.objects.bulk_create([
+            AthleteStats(user=others[0], finished_runs=12, total_distance=10),
+            AthleteStats(user=others[1], finished_runs=3, total_distance=75),
+            AthleteStats(user=others[2], finished_runs=1, total_distance=1),
+        ])
+        Challenge.objects.create(athlete=others[0], full_name=self.TEN_RUNS)
+
+        self.assertEqual(challenges.backfill(chunk_size=2), 3)
+        self.assertEqual(self.awarded(others[0]), [self.TEN_RUNS])
+        self.assertEqual(self.awarded(others[1]), [self.FIFTY_KM])
+        self.assertEqual(self.awarded(others[2]), [])
+        # повторный прогон ничего не дублирует
+        challenges.backfill()
+        self.assertEqual(Challenge.objects.count(), 2)
+
+
+class ChallengeDedupeMigrationTest(TransactionTestCase):
+    # 0017 оставляет по одной награде на (athlete, full_name) перед уникальным ограничением
+    before = [('app_run', '0016_athletestats')]
+    after = [('app_run', '0017_challenge_rules')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_remove_duplicates(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        old_apps = executor.loader.project_state(self.before).apps
+        OldUser = old_apps.get_model('auth', 'User')
+        OldChallenge = old_apps.get_model('app_run', 'Challenge')
+        first, second = OldUser.objects.create(username='first'), OldUser.objects.create(username='second')
+        kept = [
+            OldChallenge.objects.create(athlete=first, full_name='a').id,
+            OldChallenge.objects.create(athlete=first, full_name='b').id,
+            OldChallenge.objects.create(athlete=second, full_name='a').id,
+        ]
+        for athlete, name in [(first, 'a'), (first, 'a'), (second, 'a'), (first, 'b')]:
+            OldChallenge.objects.create(athlete=athlete, full_name=name)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        self.assertEqual(sorted(Challenge.objects.values_list('id', flat=True)), kept)
+
+
+class LeaderboardTest(TestCase):
+    # итоги недели, месяца и «за всё время» после остановки забега, ранги и кеш топа
+
+    def setUp(self):
+        cache.clear()
+        self.athletes = [User.objects.create(username=f'runner {i}') for i in range(4)]
+        self.today = timezone.localdate()
+
+    def finish(self, athlete, distance, finished_at=None):
+        run = Run.objects.create(athlete=athlete, comment='run', status='in_progress', running_distance=distance)
+        with mock.patch('django.utils.timezone.now', return_value=finished_at or timezone.now()), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(f'/api/runs/{run.id}/stop/').status_code, 200)
+        return run
+
+    def totals(self, athlete, period, day=None):
+        url = f'/api/leaderboard/?period={period}&athlete={athlete.id}'
+        if day is not None:
+            url += f'&date={day}'
+        entry = self.client.get(url).json()['athlete']
+        return entry and (entry['finished_runs'], entry['total_distance'])
+
+    def test_totals_after_stop(self):
+        athlete = self.athletes[0]
+        self.finish(athlete, 5)
+        self.finish(athlete, 3.25)
+        long_ago = timezone.now() - datetime.timedelta(days=40)
+        self.finish(athlete, 10, long_ago)
+
+        self.assertEqual(self.totals(athlete, 'week'), (2, 8.25))
+        self.assertEqual(self.totals(athlete, 'month'), (2, 8.25))
+        self.assertEqual(self.totals(athlete, 'all'), (3, 18.25))
+        self.assertEqual(self.totals(athlete, 'week', long_ago.date()), (1, 10))
+        self.assertEqual(self.totals(athlete, 'month', long_ago.date()), (1, 10))
+        self.assertIsNone(self.totals(self.athletes[1], 'week'))
+
+        # пересчёт по таблице забегов даёт те же итоги, что и обновления при остановке
+        entries = sorted(LeaderboardEntry.objects.values_list('period', 'period_start', 'finished_runs', 'total_distance'))
+        leaderboards.rebuild_leaderboards()
+        self.assertEqual(
+            sorted(LeaderboardEntry.objects.values_list('period', 'period_start', 'finished_runs', 'total_distance')),
+            entries,
+        )
+
+    def test_repeat_and_edit(self):
+        athlete = self.athletes[0]
+        run = self.finish(athlete, 5)
+        self.assertEqual(self.client.post(f'/api/runs/{run.id}/stop/').status_code, 400)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/runs/{run.id}/', {'distance': 7.5}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        for period in leaderboards.PERIODS:
+            with self.subTest(period=period):
+                self.assertEqual(self.totals(athlete, period), (1, 7.5))
+        self.assertEqual(LeaderboardEntry.objects.count(), 2)
+
+    def test_rank_matches_top(self):
+        for athlete, distance in zip(self.athletes, [5, 8, 5, 3]):
+            self.finish(athlete, distance)
+        self.finish(self.athletes[3], 0.5)
+
+        for period in leaderboards.PERIODS:
+            for metric, field in leaderboards.METRICS.items():
+                with self.subTest(period=period, metric=metric):
+                    rows = leaderboards.top(period, metric, 10)
+                    self.assertEqual([row[field] for row in rows], sorted((row[field] for row in rows), reverse=True))
+                    for row in rows:
+                        self.assertEqual(leaderboards.rank(row['athlete'], period, metric), row)
+        self.assertEqual([(row['athlete'], row['rank']) for row in leaderboards.top('week', 'distance', 10)], [
+            (self.athletes[1].id, 1), (self.athletes[0].id, 2), (self.athletes[2].id, 2), (self.athletes[3].id, 4),
+        ])
+        self.assertEqual([row['rank'] for row in leaderboards.top('all', 'runs', 10)], [1, 2, 2, 2])
+
+    def test_cached_top(self):
+        self.finish(self.athletes[0], 5)
+        first = leaderboards.top('week', 'distance', 10)
+        with self.assertNumQueries(0):
+            self.assertEqual(leaderboards.top('week', 'distance', 10), first)
+
+        self.finish(self.athletes[1], 6)
+        self.assertEqual([row['athlete'] for row in leaderboards.top('week', 'distance', 10)],
+                         [self.athletes[1].id, self.athletes[0].id])
+        self.assertEqual([row['athlete'] for row in leaderboards.top('all', 'distance', 10)],
+                         [self.athletes[1].id, self.athletes[0].id])
+
+    def test_invalid_parameters(self):
+        for query in ['period=year', 'metric=pace', 'athlete=abc', 'limit=0', 'limit=101', 'date=2024-13-01']:
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/leaderboard/?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertTrue(response.json()['detail'].startswith('Invalid query parameters: '))
+
+
+class RunStatsRebuildTest(TestCase):
+    # запись забега через /api/runs/ пересчитывает статистику и доски только при изменении итогов
+
+    def setUp(self):
+        cache.clear()
+        self.athlete = User.objects.create(username='runner')
+        self.other = User.objects.create(username='other')
+
+    def create(self, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/runs/', {'athlete': self.athlete.id, 'comment': 'run', **data},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def patch(self, run_id, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/runs/{run_id}/', data, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def totals(self, athlete):
+        # (забеги, км) в AthleteStats, на доске «за всё время» и на доске недели
+        stats = AthleteStats.objects.filter(user=athlete).values_list('finished_runs', 'total_distance').first()
+        boards = [
+            next(((row['finished_runs'], row['total_distance'])
+                  for row in leaderboards.top(period, 'distance', 10) if row['athlete'] == athlete.id), None)
+            for period in (leaderboards.ALL_TIME, leaderboards.WEEK)
+        ]
+        return [stats] + boards
+
+    def test_create_update_destroy(self):
+        self.create(status='in_progress')
+        self.assertEqual(self.totals(self.athlete), [None, None, None])
+        run_id = self.create(status='finished', distance=5)
+        self.assertEqual(self.totals(self.athlete), [(1, 5)] * 3)
+
+        self.patch(run_id, {'distance': 7.5})
+        self.assertEqual(self.totals(self.athlete), [(1, 7.5)] * 3)
+        self.patch(run_id, {'athlete': self.other.id})
+        self.assertEqual(self.totals(self.athlete), [None, None, None])
+        self.assertEqual(self.totals(self.other), [(1, 7.5)] * 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/api/runs/{run_id}/').status_code, 204)
+        self.assertEqual(self.totals(self.other), [None, None, None])
+
+    def test_comment_edit_keeps_boards(self):
+        run_id = self.create(status='finished', distance=5)
+        self.totals(self.athlete)
+        with mock.patch('app_run.views.rebuild_athlete_stats') as rebuild_stats, \
+                mock.patch.object(leaderboards, 'rebuild_leaderboards') as rebuild_boards:
+            self.patch(run_id, {'comment': 'new comment'})
+        rebuild_stats.assert_not_called()
+        rebuild_boards.assert_not_called()
+        # доски остаются в кеше
+        with self.assertNumQueries(0):
+            leaderboards.top(leaderboards.WEEK, 'distance', 10)
+            leaderboards.top(leaderboards.ALL_TIME, 'distance', 10)
+
+    def test_rebuild_affects_own_periods(self):
+        old_run = Run.objects.create(athlete=self.other, comment='old', status='finished', distance=3,
+                                     finished_at=timezone.now() - datetime.timedelta(days=40))
+        leaderboards.rebuild_leaderboards()
+        old_day = timezone.localdate(old_run.finished_at)
+        leaderboards.top(leaderboards.MONTH, 'distance', 10, old_day)
+
+        self.create(status='finished', distance=5)
+        # доска прошлого месяца не сброшена пересчётом другого атлета и периода
+        with self.assertNumQueries(0):
+            leaderboards.top(leaderboards.MONTH, 'distance', 10, old_day)
+
+    def test_command_invalidates_all_time(self):
+        run_id = self.create(status='finished', distance=5)
+        self.assertEqual(self.totals(self.athlete)[1], (1, 5))
+        Run.objects.filter(id=run_id).update(distance=9)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_athlete_stats', stdout=io.StringIO())
+        self.assertEqual(self.totals(self.athlete)[:2], [(1, 9), (1, 9)])
+
+
+class MetricsTest(TestCase):
+    # гистограммы запросов по URL-шаблону и выдача /api/_metrics/ в формате Prometheus
+    ROUTE = '^api/runs/(?P<pk>[^/.]+)/$'
+    SAMPLE = re.compile(r'^(?P<name>[a-z_]+)(?P<labels>\{[^}]*\})? (?P<value>[-+0-9.eInf]+)$')
+
+    def setUp(self):
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+        self.admin = User.objects.create(username='admin', is_staff=True)
+        self.athlete = User.objects.create(username='runner')
+        self.run_id = Run.objects.create(athlete=self.athlete, comment='run').id
+
+    def get_metrics(self):
+        self.client.force_login(self.admin)
+        response = self.client.get('/api/_metrics/')
+        self.client.logout()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        return response.content.decode()
+
+    def samples(self, text) -> dict:
+        # {(имя, метки): значение}; строки комментариев - только HELP и TYPE перед своей метрикой
+        samples = {}
+        declared = set()
+        for line in text.splitlines():
+            if line.startswith('#'):
+                kind, name = line.split(' ', 3)[1:3]
+                self.assertIn(kind, ('HELP', 'TYPE'))
+                declared.add(name)
+                continue
+            match = self.SAMPLE.match(line)
+            self.assertIsNotNone(match, line)
+            name = match['name']
+            self.assertTrue(name in declared or name.rsplit('_', 1)[0] in declared, line)
+            samples[(name, match['labels'] or '')] = float(match['value'])
+        return samples
+
+    def test_admin_only(self):
+        self.assertEqual(self.client.get('/api/_metrics/').status_code, 403)
+        self.client.force_login(self.athlete)
+        self.assertEqual(self.client.get('/api/_metrics/').status_code, 403)
+
+    def test_known_request(self):
+        # часы сдвигаются на 0.25 с при каждом замере: 1 SQL-запрос = 0.25 с в БД, 0.75 с на запрос
+        clock = itertools.count(step=0.25)
+        with mock.patch.object(metrics, 'time', SimpleNamespace(perf_counter=lambda: next(clock), time=time.time)), \
+                self.assertNumQueries(1):
+            response = self.client.get(f'/api/runs/{self.run_id}/')
+        samples = self.samples(self.get_metrics())
+
+        labels = f'route="{self.ROUTE}",method="GET"'
+        for name, value, buckets in [
+            ('app_request_duration_seconds', 0.75, {'0.5': 0, '1.0': 1, '+Inf': 1}),
+            ('app_db_duration_seconds', 0.25, {'0.1': 0, '0.25': 1, '+Inf': 1}),
+            ('app_db_queries', 1, {'1': 1, '+Inf': 1}),
+            ('app_response_size_bytes', len(response.content), {'256': 0, '1024': 1, '+Inf': 1}),
+        ]:
+            with self.subTest(name=name):
+                self.assertEqual(samples[(f'{name}_sum', '{' + labels + '}')], value)
+                self.assertEqual(samples[(f'{name}_count', '{' + labels + '}')], 1)
+                for bound, count in buckets.items():
+                    self.assertEqual(samples[(f'{name}_bucket', '{' + labels + f',le="{bound}"' + '}')], count)
+        self.assertEqual(samples[('app_requests_total', '{' + labels + ',status="200"}')], 1)
+
+    def test_cumulative_buckets(self):
+        for _ in range(3):
+            self.client.get(f'/api/runs/{self.run_id}/')
+        self.client.get('/api/runs/0/')
+        samples = self.samples(self.get_metrics())
+        series = {}
+        for (name, labels), value in samples.items():
+            if name.endswith('_bucket'):
+                series.setdefault((name, re.sub(r',le="[^"]*"', '', labels)), []).append(value)
+        self.assertTrue(series)
+        for (name, labels), counts in series.items():
+            with self.subTest(name=name, labels=labels):
+                self.assertEqual(counts, sorted(counts))
+                self.assertEqual(counts[-1], samples[(name[:-len('_bucket')] + '_count', labels)])
+        labels = f'route="{self.ROUTE}",method="GET"'
+        self.assertEqual(samples[('app_requests_total', '{' + labels + ',status="200"}')], 3)
+        self.assertEqual(samples[('app_requests_total', '{' + labels + ',status="404"}')], 1)
+
+    def test_not_sampled(self):
+        with override_settings(METRICS_SAMPLE_RATE=0):
+            self.assertEqual(self.client.get(f'/api/runs/{self.run_id}/').status_code, 200)
+            self.client.force_login(self.admin)
+            self.assertEqual(self.client.get('/api/_metrics/').content, b'\n')
+        self.assertEqual(metrics.registry.histograms, {})
+
+
+class AsyncEndpointsTest(TestCase):
+    # /api/async/: ответы совпадают с DRF-эндпоинтами записи точек и старта/стопа
+    async_client_class = AsyncClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.athlete = User.objects.create(username='runner')
+        cls.active_run = Run.objects.create(athlete=cls.athlete, comment='run', status='in_progress')
+        cls.new_run = Run.objects.create(athlete=cls.athlete, comment='new')
+
+    async def post(self, url, data=None):
+        return await self.async_client.post(url, data, content_type='application/json')
+
+    async def test_start(self):
+        response = await self.post(f'/api/async/runs/{self.new_run.id}/start/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((await Run.objects.aget(id=self.new_run.id)).status, 'in_progress')
+        self.assertEqual((await self.post(f'/api/async/runs/{self.new_run.id}/start/')).status_code, 400)
+        response = await self.post('/api/async/runs/0/start/')
+        self.assertEqual((response.status_code, response.json()), (404, {'detail': 'No Run matches the given query.'}))
+
+    async def test_position(self):
+        response = await self.post('/api/async/positions/', {'run': self.active_run.id, 'latitude': 55, 'longitude': 37})
+        self.assertEqual(response.status_code, 201)
+        position = await Position.objects.aget(run=self.active_run)
+        self.assertEqual(response.json(), {'id': position.id, 'run': self.active_run.id,
+                                           'latitude': '55.0000', 'longitude': '37.0000'})
+        await self.post('/api/async/positions/', {'run': self.active_run.id, 'latitude': 55.01, 'longitude': 37})
+        run = await Run.objects.aget(id=self.active_run.id)
+        self.assertAlmostEqual(run.running_distance, track_distance_km(as_track([(55, 37), (55.01, 37)])))
+        self.assertEqual(run.last_position_id, (await Position.objects.alatest('id')).id)
+
+    async def test_invalid_position(self):
+        for data in [
+            {'run': self.active_run.id, 'latitude': 95, 'longitude': 'east'},
+            {'run': self.new_run.id, 'latitude': 55, 'longitude': 37},
+            {'run': 0, 'latitude': -91},
+            {'run': 'abc', 'latitude': 55, 'longitude': 181},
+            {},
+            [1, 2],
+        ]:
+            with self.subTest(data=data):
+                serializer = PositionSerializer(data=data)
+                await sync_to_async(serializer.is_valid)()
+                response = await self.post('/api/async/positions/', data)
+                self.assertEqual((response.status_code, response.json()), (400, serializer.errors))
+        self.assertFalse(await Position.objects.aexists())
+
+    async def test_batch(self):
+        response = await self.post('/api/async/positions/batch/', [
+            {'run': self.active_run.id, 'latitude': 55, 'longitude': 37},
+            {'run': self.new_run.id, 'latitude': 55, 'longitude': 37},
+            {'run': self.active_run.id, 'latitude': 55.01, 'longitude': 37},
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {
+            'created': 2,
+            'errors': [{'index': 1, 'errors': {'run': ["Run must be in status 'in_progress'."]}}],
+        })
+        self.assertEqual(await Position.objects.filter(run=self.active_run).acount(), 2)
+        self.assertEqual((await self.post('/api/async/positions/batch/', [])).status_code, 400)
+
+    async def test_stop(self):
+        await self.post('/api/async/positions/', {'run': self.active_run.id, 'latitude': 55, 'longitude': 37})
+        await self.post('/api/async/positions/', {'run': self.active_run.id, 'latitude': 55.01, 'longitude': 37})
+        response = await self.post(f'/api/async/runs/{self.active_run.id}/stop/')
+        self.assertEqual(response.status_code, 200)
+        run = await Run.objects.aget(id=self.active_run.id)
+        self.assertEqual(run.status, 'finished')
+        self.assertEqual(run.distance, round(run.running_distance, 3))
+        self.assertEqual((await AthleteStats.objects.aget(user=self.athlete)).finished_runs, 1)
+        self.assertEqual((await self.post(f'/api/async/runs/{self.active_run.id}/stop/')).status_code, 400)
+        self.assertEqual((await self.post(f'/api/async/runs/{self.new_run.id}/stop/')).status_code, 400)
+        response = await self.post('/api/async/runs/0/stop/')
+        self.assertEqual((response.status_code, response.json()), (404, {'detail': 'No Run matches the given query.'}))
+
+    async def test_not_found(self):
+        self.assertEqual((await self.post('/api/async/runs/0/start/')).status_code, 404)
+        self.assertEqual((await self.async_client.get(f'/api/async/runs/{self.new_run.id}/start/')).status_code, 405)
+        response = await self.async_client.post('/api/async/positions/', b'{', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json()['detail'].startswith('JSON parse error - '))
+
+
+@override_settings(TRACK_EXPORT_CHUNK_SIZE=2)
+class TrackExportTest(TestCase):
+    # GeoJSON и GPX (gzip) отдают все точки в порядке записи: из Position, упакованного и заархивированного трека
+    POINTS = [('55.7558', '37.6173'), ('-0.0005', '-179.9999'), ('0.0000', '0.0000'),
+              ('89.9999', '180.0000'), ('12.3000', '-45.6789')]
+    GPX = '{http://www.topografix.com/GPX/1/1}'
+
+    @classmethod
+    def setUpTestData(cls):
+        athlete = User.objects.create(username='runner')
+        client = cls.client_class()
+        cls.runs = {}
+        for name in ('live', 'finished', 'archived'):
+            run = cls.runs[name] = Run.objects.create(athlete=athlete, comment=name, status='in_progress')
+            for lat, lon in cls.POINTS:
+                client.post('/api/positions/', {'run': run.id, 'latitude': lat, 'longitude': lon},
+                            content_type='application/json')
+        for name in ('finished', 'archived'):
+            client.post(f'/api/runs/{cls.runs[name].id}/stop/')
+        Run.objects.filter(id=cls.runs['archived'].id).update(finished_at=timezone.now() - datetime.timedelta(days=40))
+        archive_positions()
+        cls.runs['empty'] = Run.objects.create(athlete=athlete, comment='empty')
+
+    def export(self, run, fmt, **headers):
+        response = self.client.get(f'/api/runs/{run.id}/track.{fmt}', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="run-{run.id}.{fmt}"')
+        return response, b''.join(response.streaming_content)
+
+    def test_storage(self):
+        self.assertTrue(Position.objects.filter(run=self.runs['live']).exists())
+        self.assertTrue(RunTrack.objects.filter(run=self.runs['finished'], archived_at__isnull=True).exists())
+        self.assertFalse(Position.objects.filter(run=self.runs['archived']).exists())
+
+    def test_geojson(self):
+        for name, run in self.runs.items():
+            with self.subTest(run=name):
+                run.refresh_from_db()
+                response, content = self.export(run, 'geojson')
+                self.assertEqual(response['Content-Type'], 'application/geo+json')
+                self.assertNotIn('Content-Encoding', response)
+                feature = json.loads(content)
+                self.assertEqual(feature['properties'], {'run': run.id, 'athlete': run.athlete_id,
+                                                         'status': run.status, 'distance': run.distance})
+                self.assertEqual(feature['geometry']['type'], 'LineString')
+                points = [] if name == 'empty' else self.POINTS
+                self.assertEqual(feature['geometry']['coordinates'], [[float(lon), float(lat)] for lat, lon in points])
+
+    def test_gzipped_gpx(self):
+        for name, run in self.runs.items():
+            with self.subTest(run=name):
+                response, content = self.export(run, 'gpx', accept_encoding='gzip, deflate')
+                self.assertEqual(response['Content-Type'], 'application/gpx+xml')
+                self.assertEqual(response['Content-Encoding'], 'gzip')
+                self.assertIn('Accept-Encoding', response['Vary'])
+                root = ElementTree.fromstring(gzip.decompress(content))
+                self.assertEqual(root.find(f'{self.GPX}trk/{self.GPX}name').text, f'Run {run.id}')
+                points = [(point.get('lat'), point.get('lon')) for point in root.iter(f'{self.GPX}trkpt')]
+                self.assertEqual(points, [] if name == 'empty' else self.POINTS)
+
+    def test_gzip_disabled(self):
+        run_id = self.runs['finished'].id
+        _, content = self.export(self.runs['finished'], 'gpx', accept_encoding='gzip')
+        response = self.client.get(f'/api/runs/{run_id}/track.gpx?gzip=0', headers={'accept-encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(b''.join(response.streaming_content), gzip.decompress(content))
+        self.assertEqual(self.client.get('/api/runs/0/track.gpx').status_code, 404)
+
+
+class TrackSimplifyTest(TestCase):
+    # ?max_points= и ?simplify= для живого и упакованного трека: Дуглас-Пекер по массиву важности точек
+
+    @classmethod
+    def setUpTestData(cls):
+        athlete = User.objects.create(username='runner')
+        rng = np.random.default_rng(17)
+        cls.runs = []
+        for status in ('in_progress', 'finished'):
+            run = Run.objects.create(athlete=athlete, comment='run', status='in_progress')
+            for i in range(40):
+                Position.objects.create(run=run, latitude=round(55 + i / 1000 + rng.uniform(-3e-4, 3e-4), 4),
+                                        longitude=round(37 + rng.uniform(-3e-4, 3e-4), 4))
+            if status == 'finished':
+                cls.client_class().post(f'/api/runs/{run.id}/stop/')
+            cls.runs.append(run)
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, run, query):
+        response = self.client.get(f'/api/positions/?run={run.id}&{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def full_track(self, run):
+        return self.client.get(f'/api/positions/?run={run.id}').json()
+
+    def test_max_points(self):
+        for run in self.runs:
+            full = self.full_track(run)
+            for max_points in (2, 3, 10, 39):
+                with self.subTest(run=run.id, max_points=max_points):
+                    rows = self.get(run, f'max_points={max_points}')
+                    self.assertEqual(len(rows), max_points)
+                    self.assertEqual((rows[0], rows[-1]), (full[0], full[-1]))
+                    # подмножество исходных точек в исходном порядке
+                    self.assertEqual(rows, [row for row in full if row in rows])
+            for max_points in (40, 1000):
+                with self.subTest(run=run.id, max_points=max_points):
+                    self.assertEqual(self.get(run, f'max_points={max_points}'), full)
+
+    def test_cached_importance(self):
+        finished = self.runs[1]
+        first = self.get(finished, 'max_points=10')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get(finished, 'max_points=10'), first)
+
+    def test_tolerance_matches_douglas_peucker(self):
+        def reference(xy, tolerance, start, end):
+            # классический рекурсивный алгоритм: точки между start и end, которые остаются
+            if end - start < 2:
+                return []
+            distances = simplify.segment_distances(xy[start + 1:end], xy[[start]], xy[[end]])
+            split = start + 1 + int(np.argmax(distances))
+            if distances.max() <= tolerance:
+                return []
+            return reference(xy, tolerance, start, split) + [split] + reference(xy, tolerance, split, end)
+
+        for run in self.runs:
+            full = self.full_track(run)
+            xy = simplify.to_metres([(float(row['latitude']), float(row['longitude'])) for row in full])
+            for tolerance in (0, 1, 5, 20, 1000):
+                with self.subTest(run=run.id, tolerance=tolerance):
+                    expected = [0] + reference(xy, tolerance, 0, len(full) - 1) + [len(full) - 1]
+                    self.assertEqual(self.get(run, f'simplify={tolerance}'), [full[i] for i in expected])
+
+    def test_invalid_parameters(self):
+        run_id = self.runs[0].id
+        for query in [f'run={run_id}&max_points=abc', f'run={run_id}&max_points=2.5', f'run={run_id}&max_points=1',
+                      f'run={run_id}&max_points=0', f'run={run_id}&simplify=-1', f'run={run_id}&simplify=x',
+                      'max_points=10', f'run={run_id}&max_points=10&pagination=cursor']:
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/positions/?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertTrue(response.json()['detail'].startswith('Invalid query parameters: '))
+
+
+class RunSummaryTest(TransactionTestCase):
+    # сводка считается при остановке забега, backfill_run_summaries досчитывает и пересчитывает её в потоках
+
+    def setUp(self):
+        self.athlete = User.objects.create(username='runner')
+
+    def create_run(self, points=25):
+        run = Run.objects.create(athlete=self.athlete, comment='run', status='in_progress')
+        for i in range(points):
+            self.client.post('/api/positions/', {'run': run.id, 'latitude': 55 + i / 1000, 'longitude': 37 + i / 2000},
+                             content_type='application/json')
+        return run
+
+    def expected(self, run):
+        # сводка по строкам Position, без упакованного трека
+        rows = list(Position.objects.filter(run=run).order_by('id').values_list('id', 'latitude', 'longitude'))
+        return build_summary([row[0] for row in rows], [(float(row[1]), float(row[2])) for row in rows])
+
+    def test_stop_stores_summary(self):
+        run = self.create_run()
+        expected = self.expected(run)
+        self.assertEqual(self.client.post(f'/api/runs/{run.id}/stop/').status_code, 200)
+        run.refresh_from_db()
+        self.assertEqual(run.summary, expected)
+        self.assertEqual((expected['point_count'], len(expected['splits'])), (25, 2))
+        self.assertEqual(expected['distance'], run.distance)
+        response = self.client.get(f'/api/runs/{run.id}/summary/')
+        self.assertEqual((response.status_code, response.json()), (200, expected))
+
+    def test_missing_summary(self):
+        run = self.create_run(points=2)
+        for url in [f'/api/runs/{run.id}/summary/', '/api/runs/0/summary/']:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(f'/api/runs/{run.id}/summary/').json(),
+                         {'detail': 'Run summary is not available.'})
+
+    def test_backfill(self):
+        runs = [self.create_run(points) for points in (0, 1, 12, 25)]
+        for run in runs:
+            self.client.post(f'/api/runs/{run.id}/stop/')
+        Run.objects.filter(id=runs[0].id).update(summary=None)
+        Run.objects.filter(id=runs[1].id).update(summary=None)
+        Run.objects.filter(id__in=[runs[2].id, runs[3].id]).update(summary={'stale': True})
+        unfinished = self.create_run(points=3)
+
+        call_command('backfill_run_summaries', workers=1, batch_size=1, stdout=io.StringIO())
+        stored = dict(Run.objects.values_list('id', 'summary'))
+        self.assertEqual([stored[run.id] for run in runs],
+                         [self.expected(runs[0]), self.expected(runs[1]), {'stale': True}, {'stale': True}])
+        self.assertIsNone(stored[unfinished.id])
+
+        # общая in-memory база SQLite блокирует таблицу при параллельной записи: пачки идут в пуле, но по очереди
+        batch_lock = threading.Lock()
+        backfill_batch = summaries._backfill_batch
+
+        def serialized(run_ids):
+            with batch_lock:
+                return backfill_batch(run_ids)
+
+        output = io.StringIO()
+        with mock.patch.object(summaries, '_backfill_batch', serialized):
+            call_command('backfill_run_summaries', '--force', workers=2, batch_size=3, stdout=output)
+        self.assertIn('run summaries: 4', output.getvalue())
+        for run in runs:
+            with self.subTest(run=run.id):
+                run.refresh_from_db()
+                self.assertEqual(run.summary, self.expected(run))
+        self.assertIsNone(Run.objects.get(id=unfinished.id).summary)
+
+
+class SeedLoadTest(TestCase):
+    # seed_load заполняет те же производные данные, что и API: трек, сводку, статистику и лидерборды
+
+    def test_derived_data(self):
+        call_command('seed_load', users=4, coaches=1, runs_per_user=3, positions_per_run=30, items=5, seed=1,
+                     stdout=io.StringIO())
+        finished = Run.objects.filter(status='finished')
+        self.assertTrue(finished.exists())
+        for run in finished:
+            with self.subTest(run=run.id):
+                self.assertEqual(run.summary, summaries.run_summary(run.id))
+                self.assertEqual(run.summary['distance'], run.distance)
+
+        # все забеги завершены сейчас: недельный итог атлета - сумма его завершённых забегов
+        expected = {}
+        for athlete_id, distance in finished.values_list('athlete_id', 'distance'):
+            expected[athlete_id] = expected.get(athlete_id, 0) + distance
+        weekly = dict(LeaderboardEntry.objects.filter(period='week').values_list('athlete_id', 'total_distance'))
+        self.assertEqual(weekly.keys(), expected.keys())
+        for athlete_id, distance in expected.items():
+            self.assertAlmostEqual(weekly[athlete_id], distance, places=6)
+
+
+class ServerlessProfileTest(SimpleTestCase):
+    # профиль serverless в отдельном процессе: каждый маршрут разрешается, первый запрос отдаёт 200
+    SCRIPT = r"""
+import json, re, sys
+
+from django.core.wsgi import get_wsgi_application
+from django.test import RequestFactory
+from django.urls import get_resolver, resolve
+from django.urls.resolvers import RoutePattern, URLResolver
+
+application = get_wsgi_application()
+statuses = []
+body = b''.join(application(RequestFactory().get('/api/company_details/').environ,
+                            lambda status, headers, *args: statuses.append(status)))
+lazy_async = 'app_run.async_urls' not in sys.modules
+
+
+def example(pattern):
+    # пример пути для шаблона: параметры -> 1, суффикс формата -> json
+    if isinstance(pattern, RoutePattern):
+        return re.sub(r'<(?:\w+:)?(\w+)>', lambda m: '.json' if m.group(1) == 'format' else '1', str(pattern))
+    regex = re.sub(r'\(\?P<(\w+)>[^)]*\)', lambda m: 'json' if m.group(1) == 'format' else '1', str(pattern))
+    return regex.strip('^$').replace('\\.', '.').replace('/?', '/')
+
+
+def walk(patterns, prefix=''):
+    for pattern in patterns:
+        path = prefix + example(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            yield from walk(pattern.url_patterns, path)
+        else:
+            yield path, pattern
+
+
+routes = {}
+for path, pattern in walk(get_resolver().url_patterns):
+    match = resolve('/' + path)
+    routes[path] = match.func is pattern.callback
+print(json.dumps({'status': statuses[0], 'body': json.loads(body), 'lazy_async': lazy_async, 'routes': routes}))
+"""
+
+    def test_routes_and_first_request(self):
+        completed = subprocess.run(
+            [sys.executable, '-c', self.SCRIPT], capture_output=True, text=True, cwd=settings.BASE_DIR,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'project_run.settings.serverless'},
+        )
+        self.assertEqual(completed.returncode, 0, completed.stderr)
+        report = json.loads(completed.stdout.splitlines()[-1])
+
+        self.assertEqual(report['status'], '200 OK')
+        self.assertEqual(report['body']['company_name'], settings.COMPANY_NAME)
+        # api/async/ подключается лениво: первый запрос не импортирует async_urls
+        self.assertTrue(report['lazy_async'])
+        self.assertEqual([path for path, matched in report['routes'].items() if not matched], [])
+        for path in ('api/async/positions/', 'api/async/runs/1/stop/', 'api/positions/batch/', 'api/leaderboard/'):
+            self.assertIn(path, report['routes'])
+        self.assertFalse(any(path.startswith('admin/') for path in report['routes']))
+
+
+class PooledSettingsTest(SimpleTestCase):
+    # project_run/settings/pooled.py: переменные DB_* разбираются при импорте, ошибки - ImproperlyConfigured с именем
+
+    def load(self, **environ):
+        from project_run.settings import production
+
+        # модуль выполняется заново; DATABASES из production он меняет на месте - возвращаем как было
+        with mock.patch.dict(os.environ, environ), mock.patch.dict(production.DATABASES['default']), \
+                mock.patch.dict(sys.modules, {'psycopg': mock.Mock(), 'psycopg_pool': mock.Mock()}):
+            return dict(runpy.run_module('project_run.settings.pooled')['DATABASES']['default'])
+
+    def test_defaults(self):
+        database = self.load(DB_CONN_MAX_AGE='', DB_CONN_HEALTH_CHECKS='', DB_POOL='')
+        self.assertEqual((database['CONN_MAX_AGE'], database['CONN_HEALTH_CHECKS']), (0, False))
+        self.assertNotIn('OPTIONS', database)
+
+    def test_valid(self):
+        database = self.load(DB_CONN_MAX_AGE=' 600 ', DB_CONN_HEALTH_CHECKS='true', DB_POOL='')
+        self.assertEqual((database['CONN_MAX_AGE'], database['CONN_HEALTH_CHECKS']), (600, True))
+        database = self.load(DB_CONN_MAX_AGE='', DB_POOL='1', DB_POOL_MIN_SIZE='1', DB_POOL_MAX_SIZE='4',
+                             DB_POOL_TIMEOUT='2.5')
+        self.assertEqual(database['OPTIONS'], {'pool': {'min_size': 1, 'max_size': 4, 'timeout': 2.5}})
+
+    def test_invalid(self):
+        pool = {'DB_CONN_MAX_AGE': '', 'DB_POOL': '1'}
+        for environ, message in [
+            ({'DB_CONN_MAX_AGE': '10m'}, "DB_CONN_MAX_AGE must be an integer, got '10m'"),
+            ({'DB_CONN_MAX_AGE': '-1'}, "DB_CONN_MAX_AGE must be >= 0, got '-1'"),
+            ({**pool, 'DB_POOL_MIN_SIZE': 'two'}, "DB_POOL_MIN_SIZE must be an integer, got 'two'"),
+            ({**pool, 'DB_POOL_MAX_SIZE': '0'}, "DB_POOL_MAX_SIZE must be >= 1, got '0'"),
+            ({**pool, 'DB_POOL_TIMEOUT': 'soon'}, "DB_POOL_TIMEOUT must be a number, got 'soon'"),
+            ({**pool, 'DB_POOL_MIN_SIZE': '5', 'DB_POOL_MAX_SIZE': '3'},
+             'DB_POOL_MIN_SIZE (5) must not exceed DB_POOL_MAX_SIZE (3)'),
+            ({'DB_CONN_MAX_AGE': '60', 'DB_POOL': '1'}, 'DB_POOL=1 cannot be combined with DB_CONN_MAX_AGE'),
+        ]:
+            with self.subTest(environ=environ):
+                with self.assertRaisesMessage(ImproperlyConfigured, message):
+                    self.load(**{'DB_POOL': '', 'DB_POOL_MIN_SIZE': '', 'DB_POOL_MAX_SIZE': '', 'DB_POOL_TIMEOUT': '',
+                                 **environ})
+
+
+class KeysetPaginationTest(TestCase):
+    # ?pagination=cursor: записи между запросами страниц не дают пропусков и повторов, size сохраняется в next
+
+    def setUp(self):
+        self.athlete = User.objects.create(username='runner')
+        self.runs = [Run.objects.create(athlete=self.athlete, comment=f'run {i}') for i in range(7)]
+        self.active_run = self.runs[0]
+        for i in range(7):
+            Position.objects.create(run=self.active_run, latitude=55 + i / 1000, longitude=37)
+
+    def pages(self, url, insert):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            self.assertLessEqual(len(body['results']), 2)
+            ids.extend(row['id'] for row in body['results'])
+            url = body['next']
+            if url:
+                self.assertEqual(parse_qs(urlsplit(url).query)['size'], ['2'])
+            insert()
+        return ids
+
+    def test_runs(self):
+        expected = [run.id for run in sorted(self.runs, key=lambda run: (run.created_at, run.id), reverse=True)]
+        inserted = []
+
+        def insert():
+            inserted.append(Run.objects.create(athlete=self.athlete, comment='new').id)
+
+        for url in ['/api/runs/?pagination=cursor&size=2',
+                    f'/api/runs/?athlete={self.athlete.id}&pagination=cursor&size=2']:
+            with self.subTest(url=url):
+                # новые забеги старше курсора и попадают только в следующий обход с начала
+                self.assertEqual(self.pages(url, insert), expected)
+                expected = [run_id for run_id in reversed(inserted)] + expected
+
+    def test_positions(self):
+        expected = list(Position.objects.filter(run=self.active_run).order_by('id').values_list('id', flat=True))
+        inserted = []
+
+        def insert():
+            if len(inserted) < 3:
+                inserted.append(Position.objects.create(run=self.active_run, latitude=56, longitude=37).id)
+
+        ids = self.pages(f'/api/positions/?run={self.active_run.id}&pagination=cursor&size=2', insert)
+        # точки дописываются в конец трека и приходят на следующих страницах
+        self.assertEqual(ids, expected + inserted)
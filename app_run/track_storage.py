@@ -0,0 +1,189 @@
+"""
+Компактное хранение трека завершённого забега.
+
+Формат (little-endian): заголовок ``b'TRK1'`` + uint32 количество точек,
+далее zlib-сжатые массивы дельт: id позиций (int64), широта и долгота
+в десятитысячных долях градуса (int32). Координаты в Position хранятся
+с 4 знаками после запятой, поэтому упаковка без потерь.
+"""
+import struct
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from app_run import simplify
+from app_run.models import Position, RunTrack
+
+MAGIC = b'TRK1'
+HEADER = struct.Struct('<4sI')
+SCALE = 10_000
+
+
+def pack_track(ids, coords) -> bytes:
+    ids = np.asarray(ids, dtype=np.int64)
+    scaled = np.rint(np.asarray(coords, dtype=np.float64).reshape(-1, 2) * SCALE).astype(np.int32)
+    payload = b''.join((
+        np.diff(ids, prepend=0).astype('<i8').tobytes(),
+        np.diff(scaled[:, 0], prepend=0).astype('<i4').tobytes(),
+        np.diff(scaled[:, 1], prepend=0).astype('<i4').tobytes(),
+    ))
+    return HEADER.pack(MAGIC, len(ids)) + zlib.compress(payload)
+
+
+def unpack_track(data) -> tuple[np.ndarray, np.ndarray]:
+    # (ids int64, координаты int32 в десятитысячных долях градуса формы (n, 2))
+    magic, count = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('Unknown track format')
+    payload = zlib.decompress(bytes(data)[HEADER.size:])
+    ids = np.cumsum(np.frombuffer(payload, dtype='<i8', count=count))
+    offset = count * 8
+    lat = np.cumsum(np.frombuffer(payload, dtype='<i4', count=count, offset=offset), dtype=np.int64)
+    lon = np.cumsum(np.frombuffer(payload, dtype='<i4', count=count, offset=offset + count * 4), dtype=np.int64)
+    return ids, np.stack([lat, lon], axis=1).astype(np.int32)
+
+
+def store_run_track(run_id) -> RunTrack:
+    # упаковка по строкам Position: для заархивированного забега строк уже нет (app_run/archive.py)
+    rows = list(
+        Position.objects.filter(run_id=run_id).order_by('id').values_list('id', 'latitude', 'longitude')
+    )
+    ids = [row[0] for row in rows]
+    coords = [(row[1], row[2]) for row in rows]
+    track, _ = RunTrack.objects.update_or_create(
+        run_id=run_id,
+        defaults={'data': pack_track(ids, coords), 'point_count': len(rows)},
+    )
+    cache.delete(importance_cache_key(run_id))
+    return track
+
+
+def stored_track_data(run_id):
+    # упакованный трек или None
+    return RunTrack.objects.filter(run_id=run_id).values_list('data', flat=True).first()
+
+
+def load_stored_track(run_id):
+    # (ids, координаты в градусах) или None, если трек не упакован
+    data = stored_track_data(run_id)
+    if data is None:
+        return None
+    ids, scaled = unpack_track(data)
+    return ids, scaled / SCALE
+
+
+def stored_track_rows(run_id):
+    # строки в формате PositionSerializer или None, если трек не упакован
+    data = stored_track_data(run_id)
+    if data is None:
+        return None
+    return track_rows(run_id, *unpack_track(data))
+
+
+def archived_track_points(run_id):
+    # (ids, координаты в десятитысячных долях градуса) заархивированного забега или None
+    data = RunTrack.objects.filter(run_id=run_id, archived_at__isnull=False).values_list('data', flat=True).first()
+    if data is None:
+        return None
+    return unpack_track(data)
+
+
+class TrackRows:
+    """
+    Точки упакованного трека с той частью интерфейса QuerySet, которую использует
+    CursorPagination с ordering=('id',): order_by, filter(id__gt/id__lt) и срезы.
+    Строки в формате PositionSerializer собираются только для выбранного среза.
+    """
+    def __init__(self, run_id, ids, scaled, reverse=False):
+        self.run_id = run_id
+        self.ids = ids
+        self.scaled = scaled
+        self.reverse = reverse
+
+    def order_by(self, *ordering):
+        if ordering not in (('id',), ('-id',)):
+            raise ValueError(f'Unsupported ordering: {ordering}')
+        return TrackRows(self.run_id, self.ids, self.scaled, reverse=ordering == ('-id',))
+
+    def filter(self, **lookups):
+        ids, scaled = self.ids, self.scaled
+        for lookup, value in lookups.items():
+            if lookup == 'id__gt':
+                start = np.searchsorted(ids, int(value), side='right')
+                ids, scaled = ids[start:], scaled[start:]
+            elif lookup == 'id__lt':
+                stop = np.searchsorted(ids, int(value), side='left')
+                ids, scaled = ids[:stop], scaled[:stop]
+            else:
+                raise ValueError(f'Unsupported lookup: {lookup}')
+        return TrackRows(self.run_id, ids, scaled, self.reverse)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise TypeError('TrackRows supports only slices')
+        ids, scaled = (self.ids[::-1], self.scaled[::-1]) if self.reverse else (self.ids, self.scaled)
+        return track_rows(self.run_id, ids[index], scaled[index])
+
+
+def track_rows(run_id, ids, scaled) -> list[dict]:
+    run_id = int(run_id)
+    return [
+        {
+            'id': position_id,
+            'run': run_id,
+            'latitude': format_coordinate(lat),
+            'longitude': format_coordinate(lon),
+        }
+        for position_id, (lat, lon) in zip(ids.tolist(), scaled.tolist())
+    ]
+
+
+def format_coordinate(value: int) -> str:
+    # как DecimalField(decimal_places=4) в DRF: '55.7558', '-0.0005'
+    sign = '-' if value < 0 else ''
+    whole, fraction = divmod(abs(value), SCALE)
+    return f'{sign}{whole}.{fraction:04d}'
+
+
+def run_track_points(run_id) -> tuple[np.ndarray, np.ndarray, bool]:
+    # (ids, координаты в десятитысячных долях градуса, упакован ли трек)
+    data = stored_track_data(run_id)
+    if data is not None:
+        return (*unpack_track(data), True)
+    rows = list(Position.objects.filter(run_id=run_id).order_by('id').values_list('id', 'latitude', 'longitude'))
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    scaled = np.array([(int(row[1] * SCALE), int(row[2] * SCALE)) for row in rows], dtype=np.int32).reshape(-1, 2)
+    return ids, scaled, False
+
+
+def importance_cache_key(run_id) -> str:
+    return f'track-importance:{run_id}'
+
+
+def simplified_track_rows(run_id, tolerance=None, max_points=None) -> list[dict]:
+    """
+    Упрощённый трек (см. app_run/simplify.py) в формате PositionSerializer.
+    Для упакованного трека завершённого забега массив важности точек кешируется,
+    и любой уровень детализации - это только фильтр по нему.
+    """
+    ids, scaled, stored = run_track_points(run_id)
+    importance = None
+    if stored:
+        cached = cache.get(importance_cache_key(run_id))
+        if cached is not None and len(cached) == len(ids) * 4:
+            importance = np.frombuffer(cached, dtype=np.float32)
+    if importance is None:
+        importance = simplify.douglas_peucker_importance(simplify.to_metres(scaled / SCALE))
+        if stored:
+            cache.set(
+                importance_cache_key(run_id),
+                importance.astype(np.float32).tobytes(),
+                settings.TRACK_LOD_CACHE_TIMEOUT,
+            )
+    keep = simplify.select(importance, tolerance, max_points)
+    return track_rows(run_id, ids[keep], scaled[keep])
@@ -0,0 +1,297 @@
+import logging
+
+import numpy as np
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models.sql import UpdateQuery
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.fields import empty
+
+from app_run.challenges import award_for_stats_delta
+from app_run import leaderboards
+from app_run.distance import as_track, load_track, track_distance_km
+from app_run.models import Run, Position, RunTrack
+from app_run.pickups import get_grid, record_pickups
+from app_run.serializers import PositionSerializer
+from app_run.stats import record_finished_run
+from app_run.summaries import track_summary
+from app_run.track_storage import store_run_track
+
+logger = logging.getLogger(__name__)
+
+RUN_NOT_IN_PROGRESS = "Run must be in status 'in_progress'."
+RUN_ARCHIVED = 'Positions of an archived run cannot be changed.'
+
+
+def lock_run(run_id) -> Run:
+    # вызывать внутри transaction.atomic(): точки одного забега добавляются строго по очереди
+    return _locked_runs().get(pk=run_id)
+
+
+def lock_runs(run_ids) -> dict:
+    # блокировка в порядке id, чтобы параллельные пакеты не ловили deadlock
+    return {run.id: run for run in _locked_runs().filter(id__in=run_ids).order_by('id')}
+
+
+def _locked_runs():
+    # of=('self',): PostgreSQL не разрешает FOR UPDATE для nullable-стороны LEFT JOIN
+    return Run.objects.select_for_update(of=('self',)).select_related('last_position')
+
+
+def append_positions(run: Run, positions) -> None:
+    # добавляем к накопленной дистанции только новые сегменты: last_position -> positions[0] -> ...
+    if not positions:
+        return
+    points = [(p.latitude, p.longitude) for p in positions]
+    if run.last_position is not None:
+        points.insert(0, (run.last_position.latitude, run.last_position.longitude))
+    run.running_distance += track_distance_km(as_track(points))
+    run.last_position = positions[-1]
+    run.save(update_fields=['running_distance', 'last_position'])
+
+
+def rebuild_running_distance(run: Run) -> None:
+    # полный пересчёт, когда точки трека изменены или удалены задним числом
+    run.running_distance = track_distance_km(load_track(run.id))
+    run.last_position = Position.objects.filter(run_id=run.id).order_by('-id').first()
+    run.save(update_fields=['running_distance', 'last_position'])
+
+
+def reconcile_run_distance(run: Run) -> tuple[float, float]:
+    # (накопленная дистанция, дистанция по полному пересчёту трека), км
+    return run.running_distance, track_distance_km(load_track(run.id))
+
+
+def finish_distance(run: Run) -> float:
+    # дистанция для завершения забега: O(1) без чтения позиций,
+    # в режиме сверки (RUN_DISTANCE_RECONCILE) - по полному пересчёту
+    if not settings.RUN_DISTANCE_RECONCILE:
+        return round(run.running_distance, 3)
+
+    incremental, full = reconcile_run_distance(run)
+    if abs(incremental - full) > settings.RUN_DISTANCE_RECONCILE_TOLERANCE:
+        logger.warning(
+            'Run %s distance mismatch: incremental=%.6f km, full=%.6f km', run.id, incremental, full
+        )
+    return round(full, 3)
+
+
+# колонки забега, нужные для завершения; возвращаются тем же UPDATE
+TRANSITION_RETURNING = ('id', 'athlete_id', 'running_distance')
+
+
+def transition_runs(run_ids, from_status, to_status, **changes) -> list[Run]:
+    """
+    Compare-and-set статуса: UPDATE ... SET status=to_status WHERE id IN (...) AND status=from_status.
+    Меняются только указанные поля; возвращаются (неполные) забеги, которые перевёл
+    именно этот вызов, поэтому из параллельных переходов одного забега побеждает ровно один.
+    """
+    run_ids = sorted(set(run_ids))
+    if len(run_ids) > 1:
+        # пакет - сначала блокировка в порядке id, как в lock_runs: без deadlock с пакетами точек
+        run_ids = list(
+            Run.objects.select_for_update().filter(id__in=run_ids, status=from_status)
+            .order_by('id').values_list('id', flat=True)
+        )
+    if not run_ids:
+        return []
+
+    queryset = Run.objects.filter(id__in=run_ids, status=from_status)
+    values = {'status': to_status, **changes}
+    connection = connections[queryset.db]
+    if connection.vendor in ('postgresql', 'sqlite'):
+        query = queryset.query.chain(UpdateQuery)
+        query.add_update_values(values)
+        sql, params = query.get_compiler(queryset.db).as_sql()
+        columns = ', '.join(connection.ops.quote_name(Run._meta.get_field(name).column)
+                            for name in TRANSITION_RETURNING)
+        with connection.cursor() as cursor:
+            cursor.execute(f'{sql} RETURNING {columns}', params)
+            rows = cursor.fetchall()
+    else:
+        # без UPDATE ... RETURNING: блокировка и обычный UPDATE (вызывать внутри transaction.atomic())
+        rows = list(queryset.select_for_update().values_list(*TRANSITION_RETURNING))
+        queryset.filter(id__in=[row[0] for row in rows]).update(**values)
+    return [Run(**dict(zip(TRANSITION_RETURNING, row)), **values) for row in rows]
+
+
+def start_runs(run_ids) -> list[int]:
+    # id забегов, переведённых из init в in_progress
+    return [run.id for run in transition_runs(run_ids, 'init', 'in_progress')]
+
+
+def stop_runs(run_ids) -> list[int]:
+    # вызывать внутри transaction.atomic(); id забегов, переведённых из in_progress в finished
+    runs = transition_runs(run_ids, 'in_progress', 'finished', finished_at=timezone.now())
+    for run in runs:
+        finish_run(run)
+    return [run.id for run in runs]
+
+
+def finish_run(run: Run) -> None:
+    # вызывать внутри transaction.atomic() для забега, только что переведённого в finished (stop_runs)
+    run.distance = finish_distance(run)
+    # сводка - по только что упакованному треку, без повторного чтения позиций
+    run.summary = track_summary(store_run_track(run.id).data)
+    run.save(update_fields=['distance', 'summary'])
+    # статистика атлета и челленджи - в той же транзакции, что и статус
+    before, after = record_finished_run(run)
+    leaderboards.record_run(run)
+    award_for_stats_delta(run.athlete_id, before, after)
+
+
+def check_not_archived(run_ids) -> None:
+    # вызывать в транзакции до изменения точек: у заархивированного забега полный трек только
+    # в RunTrack, перепаковка по оставшимся строкам Position затёрла бы его усечённым
+    if RunTrack.objects.select_for_update().filter(run_id__in=run_ids, archived_at__isnull=False).exists():
+        raise serializers.ValidationError({'run': [RUN_ARCHIVED]})
+
+
+def refresh_finished_run(run: Run) -> None:
+    # точки завершённого забега изменены задним числом: сначала перепаковка трека
+    # (load_track читает упакованный трек), затем дистанции и сводка по новому треку
+    check_not_archived([run.id])
+    track = store_run_track(run.id)
+    rebuild_running_distance(run)
+    run.distance = round(run.running_distance, 3)
+    run.summary = track_summary(track.data)
+    run.save(update_fields=['distance', 'summary'])
+
+
+def save_position(serializer: PositionSerializer) -> Position:
+    # запись одной точки из провалидированного PositionSerializer
+    data = serializer.validated_data
+    serializer.instance = add_position(data['run'].pk, data['latitude'], data['longitude'])
+    return serializer.instance
+
+
+def add_position(run_id, latitude, longitude) -> Position:
+    # запись одной провалидированной точки под блокировкой забега
+    with transaction.atomic():
+        run = lock_run(run_id)
+        # статус проверен при валидации до блокировки: параллельный стоп мог успеть завершить забег
+        if run.status != 'in_progress':
+            raise serializers.ValidationError({'run': [RUN_NOT_IN_PROGRESS]})
+        position = Position.objects.create(run=run, latitude=latitude, longitude=longitude)
+        append_positions(run, [position])
+        record_pickups(run, [position])
+    return position
+
+
+def parse_position(fields, item) -> tuple:
+    """
+    Разбор точки без запросов к БД: (run_id, latitude, longitude, ошибки по полям),
+    ошибки - в формате PositionSerializer. Диапазоны координат (range_errors)
+    и существование забега проверяет вызывающий код.
+    """
+    point_errors = {}
+    run_id = _parse_run_id(fields['run'], fields['run'].get_value(item), point_errors)
+    coords = []
+    for name in ('latitude', 'longitude'):
+        try:
+            coords.append(fields[name].run_validation(fields[name].get_value(item)))
+        except serializers.ValidationError as exc:
+            point_errors[name] = exc.detail
+            coords.append(None)
+    return run_id, coords[0], coords[1], point_errors
+
+
+def ingest_position_batch(items) -> tuple[list[Position], dict]:
+    """
+    Пакетная запись позиций: [{"run": id, "latitude": .., "longitude": ..}, ...].
+    Возвращает созданные позиции и ошибки по индексу точки в пакете
+    (формат ошибок - как у PositionSerializer). Невалидные точки пропускаются,
+    валидные пишутся одним bulk_create в одной транзакции.
+    """
+    serializer = PositionSerializer()
+    fields = serializer.fields
+    errors = {}
+    parsed = []
+
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors[index] = {'non_field_errors': [
+                f'Invalid data. Expected a dictionary, but got {type(item).__name__}.'
+            ]}
+            continue
+        parsed.append((index, *parse_position(fields, item)))
+
+    # диапазоны координат проверяем разом по всему пакету (NaN - координата не разобрана)
+    if parsed:
+        coords = np.array([
+            (np.nan if lat is None else float(lat), np.nan if lon is None else float(lon))
+            for _, _, lat, lon, _ in parsed
+        ])
+        bad = (np.abs(coords[:, 0]) > 90) | (np.abs(coords[:, 1]) > 180)
+        for i in np.nonzero(bad)[0]:
+            _, _, latitude, longitude, point_errors = parsed[i]
+            point_errors.update(range_errors(serializer, latitude, longitude))
+
+    with transaction.atomic():
+        # статус проверяется один раз на забег, под блокировкой
+        runs = lock_runs({run_id for _, run_id, _, _, _ in parsed if run_id is not None})
+        positions = []
+        for index, run_id, latitude, longitude, point_errors in parsed:
+            run = runs.get(run_id)
+            if run_id is not None:
+                point_errors.update(run_errors(fields, run_id, run))
+            if point_errors:
+                errors[index] = ordered_errors(fields, point_errors)
+            else:
+                positions.append(Position(run=run, latitude=latitude, longitude=longitude))
+
+        positions = Position.objects.bulk_create(positions)
+
+        by_run = {}
+        for position in positions:
+            by_run.setdefault(position.run_id, []).append(position)
+        grid = get_grid() if by_run else None
+        for run_id, run_positions in by_run.items():
+            append_positions(runs[run_id], run_positions)
+            record_pickups(runs[run_id], run_positions, grid)
+
+    return positions, dict(sorted(errors.items()))
+
+
+def run_errors(fields, run_id, run) -> dict:
+    # ошибка поля run для разобранного id; run - забег или None, если его нет
+    if run is None:
+        return {'run': [fields['run'].error_messages['does_not_exist'].format(pk_value=run_id)]}
+    if run.status != 'in_progress':
+        return {'run': [RUN_NOT_IN_PROGRESS]}
+    return {}
+
+
+def ordered_errors(fields, point_errors) -> dict:
+    # все ошибки точки сразу и в порядке полей, как у PositionSerializer
+    return {name: point_errors[name] for name in fields if name in point_errors}
+
+
+def _parse_run_id(field, value, point_errors):
+    if value is empty or value is None:
+        point_errors['run'] = [str(field.error_messages['required'])]
+        return None
+    try:
+        if isinstance(value, bool) or not isinstance(value, (int, str)):
+            raise TypeError
+        return int(value)
+    except (TypeError, ValueError):
+        point_errors['run'] = [field.error_messages['incorrect_type'].format(data_type=type(value).__name__)]
+        return None
+
+
+def range_errors(serializer, latitude, longitude):
+    # ошибки validate_latitude/validate_longitude для разобранных координат
+    point_errors = {}
+    for name, value, validate in (
+        ('latitude', latitude, serializer.validate_latitude),
+        ('longitude', longitude, serializer.validate_longitude),
+    ):
+        if value is None:
+            continue
+        try:
+            validate(value)
+        except serializers.ValidationError as exc:
+            point_errors[name] = exc.detail
+    return point_errors
@@ -1,71 +1,234 @@
+import datetime
+from functools import cache
+
 from django.conf import settings
-from django.db.models import Count, Q
-from django.db.models.aggregates import Sum
+from django.db import transaction
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, action
 from rest_framework.filters import SearchFilter
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
-from app_run.models import Run, User, AthleteInfo, Challenge, Position, CollectibleItem
+from app_run.models import Run, User, AthleteInfo, Challenge, Position, CollectibleItem, ImportJob, Pickup
 from app_run.serializers import RunSerializer, UserSerializer, AthleteInfoSerializer, ChallengeSerializer, \
-    PositionSerializer, CollectibleItemSerializer
-
-from geopy.distance import geodesic
-from openpyxl import load_workbook
+    PositionSerializer, CollectibleItemSerializer, ImportJobSerializer, PickupSerializer
 
+from app_run import leaderboards, metrics, response_cache
+from app_run.collectibles import items_in_bbox, items_near
+from app_run.fast_serializers import FastRunSerializer, FastUserSerializer, FastPositionSerializer
+from app_run.renderers import FastJSONResponse
+from app_run.stats import rebuild_athlete_stats
 
-def calculate_run_distance(run: Run) -> float:
-    points = Position.objects.filter(run=run)
+# модули с numpy (tracking, distance, track_storage, exports, importers, jobs) импортируются
+# внутри представлений, которым они нужны: холодный старт процесса их не загружает
 
-    if points.count() < 2:
-        return 0.0
 
-    total_distance = 0.0
-    prev_point = points[0]
+def calculate_run_distance(run: Run, method: str = None) -> float:
+    # все координаты забега одним запросом, все сегменты - одним векторным проходом
+    from app_run.distance import load_track, track_distance_km
 
-    for point in points[1:]:
-        total_distance += geodesic(
-            (float(prev_point.latitude), float(prev_point.longitude)),
-            (float(point.latitude), float(point.longitude))
-        ).km
-        prev_point = point
-
-    return round(total_distance, 3)
+    track = load_track(run.id)
+    return round(track_distance_km(track, method), 3)
 
 
 @api_view(['GET'])
 def company_details(request):
-    details = {
-        'company_name': settings.COMPANY_NAME,
-        'slogan': settings.SLOGAN,
-        'contacts': settings.CONTACTS
-    }
-    return Response(details)
-
-class RunPagination(PageNumberPagination):
+    def build():
+        details = {
+            'company_name': settings.COMPANY_NAME,
+            'slogan': settings.SLOGAN,
+            'contacts': settings.CONTACTS
+        }
+        return Response(details)
+    return response_cache.cached_response(request, 'company_details', build)
+
+class KeysetPagination(CursorPagination):
+    # keyset-пагинация: WHERE по последнему ключу вместо COUNT(*) и OFFSET
+    page_size = 100
+    page_size_query_param = 'size'
+    max_page_size = 1000
+
+
+class RunKeysetPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class UserKeysetPagination(KeysetPagination):
+    ordering = ('id',)
+
+
+class PositionKeysetPagination(KeysetPagination):
+    ordering = ('id',)
+    page_size = 1000
+    max_page_size = settings.POSITION_PAGE_MAX_SIZE
+
+
+class OptInKeysetPagination(PageNumberPagination):
+    # ?pagination=cursor (или ?cursor=...) включает keyset-пагинацию, иначе - обычная постраничная
+    page_size_query_param = 'size'
+    keyset_pagination_class = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset_paginator = None
+        if self.keyset_pagination_class and wants_keyset_pagination(request):
+            self.keyset_paginator = self.keyset_pagination_class()
+            return self.keyset_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset_paginator is not None:
+            return self.keyset_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+def wants_keyset_pagination(request) -> bool:
+    return request.query_params.get('pagination') == 'cursor' or 'cursor' in request.query_params
+
+
+class RunPagination(OptInKeysetPagination):
     page_size_query_param = 'size'  # Разрешаем изменять количество объектов через query параметр size в url
+    keyset_pagination_class = RunKeysetPagination
 
-class UserPagination(PageNumberPagination):
+class UserPagination(OptInKeysetPagination):
     page_size_query_param = 'size'  # Разрешаем изменять количество объектов через query параметр size в url
+    keyset_pagination_class = UserKeysetPagination
+
+class PositionPagination(OptInKeysetPagination):
+    # позиции без ?pagination=cursor отдаются списком, как и раньше
+    keyset_pagination_class = PositionKeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset_paginator = None
+        if wants_keyset_pagination(request):
+            return super().paginate_queryset(queryset, request, view)
+        return None
+
+@cache
+def get_fast_serializer(fast_serializer_class):
+    return fast_serializer_class()
+
+
+def use_fast_list(request) -> bool:
+    # быстрый путь только для обычного JSON (не browsable API и не ?indent)
+    return (
+        settings.FAST_LIST_RESPONSES
+        and request.accepted_renderer.format == 'json'
+        and 'indent' not in (request.accepted_media_type or '')
+    )
 
-class RunViewSet(viewsets.ModelViewSet):
+
+class FastListMixin:
+    # list из .values() с быстрым JSON-энкодером; запись идёт через обычный сериализатор
+    fast_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        if not use_fast_list(request):
+            return super().list(request, *args, **kwargs)
+
+        fast_serializer = get_fast_serializer(self.fast_serializer_class)
+        rows = fast_serializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return FastJSONResponse(self.get_paginated_response(fast_serializer.to_representation(page)).data)
+        return FastJSONResponse(fast_serializer.to_representation(rows))
+
+
+class RunViewSet(FastListMixin, viewsets.ModelViewSet):
     queryset = Run.objects.select_related('athlete').all()
     serializer_class = RunSerializer
+    fast_serializer_class = FastRunSerializer
     filter_backends = [DjangoFilterBackend, OrderingFilter] # Указываем какй класс будет использоваться для фильтра
     filterset_fields = ['status', 'athlete'] # Поля, по которым будет происходить фильтрация
     ordering_fields = ['created_at']  # Поля по которым будет возможна сортировка
     pagination_class = RunPagination  # Указываем пагинацию
 
+    # статус и дистанцию можно задать напрямую - пересчитываем статистику атлета
+    # поля забега, от которых зависят AthleteStats и лидерборды
+    STATS_FIELDS = ('athlete_id', 'status', 'distance', 'finished_at')
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            run = serializer.save()
+            if run.status == 'finished':
+                self._rebuild_stats({run.athlete_id})
+
+    def perform_update(self, serializer):
+        before = {name: getattr(serializer.instance, name) for name in self.STATS_FIELDS}
+        with transaction.atomic():
+            run = serializer.save()
+            after = {name: getattr(run, name) for name in self.STATS_FIELDS}
+            # правка комментария и т.п. не трогает статистику и кеш лидербордов
+            if before != after and 'finished' in (before['status'], after['status']):
+                self._rebuild_stats({before['athlete_id'], after['athlete_id']})
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            if instance.status == 'finished':
+                self._rebuild_stats({instance.athlete_id})
+
+    @staticmethod
+    def _rebuild_stats(athlete_ids):
+        rebuild_athlete_stats(athlete_ids)
+        leaderboards.rebuild_leaderboards(athlete_ids)
+
+    LIFECYCLE_ACTIONS = {'start': 'start_runs', 'stop': 'stop_runs'}
+
+    @action(detail=False, methods=['post'])
+    def lifecycle(self, request):
+        # {"action": "start"|"stop", "runs": [id, ...]}: все переходы одной транзакцией
+        data = request.data if isinstance(request.data, dict) else {}
+        transition_name = self.LIFECYCLE_ACTIONS.get(data.get('action'))
+        run_ids = data.get('runs')
+        if transition_name is None:
+            return Response({'detail': 'action must be one of start, stop.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(run_ids, list) or not run_ids or \
+                not all(isinstance(run_id, int) and not isinstance(run_id, bool) for run_id in run_ids):
+            return Response({'detail': 'Expected a non-empty list of run ids.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(run_ids) > settings.RUN_LIFECYCLE_MAX_SIZE:
+            return Response(
+                {'detail': f'Batch is too large: {len(run_ids)} > {settings.RUN_LIFECYCLE_MAX_SIZE}.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        from app_run import tracking
+
+        with transaction.atomic():
+            changed = getattr(tracking, transition_name)(run_ids)
+        rejected = sorted(set(run_ids) - set(changed))
+        # текущий статус отклонённых (None - забега нет)
+        statuses = dict(Run.objects.filter(id__in=rejected).values_list('id', 'status')) if rejected else {}
+        return Response(
+            {
+                'changed': changed,
+                'rejected': [{'id': run_id, 'status': statuses.get(run_id)} for run_id in rejected],
+            },
+            status=status.HTTP_200_OK if changed or not rejected else status.HTTP_400_BAD_REQUEST,
+        )
+
+    @action(detail=True, methods=['get'])
+    def summary(self, request, pk=None):
+        # сводка хранится в забеге (app_run/summaries.py): позиции не читаются
+        run = get_object_or_404(Run.objects.only('id', 'summary'), pk=pk)
+        if run.summary is None:
+            return Response({'detail': 'Run summary is not available.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(run.summary)
 
-class UserViewSet(viewsets.ReadOnlyModelViewSet):
+
+class UserViewSet(FastListMixin, viewsets.ReadOnlyModelViewSet):
+    # индексы для списка - частичные, WHERE NOT is_superuser (миграция 0024_user_list_indexes)
     queryset = User.objects.all().exclude(is_superuser=True)
     serializer_class = UserSerializer
+    fast_serializer_class = FastUserSerializer
     filter_backends = [SearchFilter, OrderingFilter]
     search_fields = ['first_name', 'last_name'] # Указываем поля по которым будет вестись поиск
     ordering_fields = ['date_joined']  # Поля по которым будет возможна сортировка
@@ -79,52 +242,57 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
             if user_type == 'coach':
                 is_stuff = True
             qs = qs.filter(is_staff=is_stuff)
-        #  подсчет finished-run для каждого пользователя
+        #  finished-run для каждого пользователя - из таблицы AthleteStats
         qs = qs.annotate(
-            runs_finished=Count('run', filter=Q(run__status='finished'))
+            runs_finished=Coalesce('athlete_stats__finished_runs', 0)
         )
         return qs
 
 class RunStartAPIView(APIView):
     def post(self, request, run_id):
-        run = get_object_or_404(Run, id=run_id)
-        if run.status == 'init':
-            run.status = 'in_progress'
-            run.save()
+        # один условный UPDATE; при отказе - отличаем отсутствующий забег от неверного статуса
+        from app_run.tracking import start_runs
+
+        if start_runs([run_id]):
             return Response(status=status.HTTP_200_OK)
+        get_object_or_404(Run.objects.only('id'), id=run_id)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
 class RunStopAPIView(APIView):
     def post(self, request, run_id):
-        run = get_object_or_404(Run, id=run_id)
-        if run.status == 'in_progress':
-            run.distance = calculate_run_distance(run=run)
-            run.status = 'finished'
-            run.save()
-            # вычисляем статистические данные
-            finished_run = Run.objects.filter(
-                athlete=run.athlete,
-                status='finished'
-            ).aggregate(total_finished=Count('id'), total_finish_distance=Sum('distance'))
-
-            if finished_run['total_finished'] == 10:
-                # создаем запись в таблице челенджей без дубликатов
-                Challenge.objects.get_or_create(
-                    athlete=run.athlete,
-                    full_name="Сделай 10 Забегов!"
-                )
-
-            if finished_run['total_finish_distance'] >= 50:
-                Challenge.objects.get_or_create(
-                    athlete=run.athlete,
-                    full_name="Пробеги 50 километров!"
-                )
+        from app_run.tracking import stop_runs
 
+        with transaction.atomic():
+            stopped = stop_runs([run_id])
+        if stopped:
             return Response(status=status.HTTP_200_OK)
+        get_object_or_404(Run.objects.only('id'), id=run_id)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
+class RunTrackExportAPIView(APIView):
+    # GET /api/runs/<id>/track.geojson|.gpx - потоковая выгрузка, gzip при Accept-Encoding: gzip
+    def get(self, request, run_id, fmt):
+        from app_run.exports import CONTENT_TYPES, track_chunks, gzip_chunks
+
+        run = get_object_or_404(Run, id=run_id)
+        chunks = track_chunks(run, fmt)
+        use_gzip = 'gzip' in request.headers.get('Accept-Encoding', '') and \
+            request.query_params.get('gzip') not in ('0', 'false')
+        if use_gzip:
+            chunks = gzip_chunks(chunks)
+
+        response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = f'attachment; filename="run-{run.id}.{fmt}"'
+        response['Vary'] = 'Accept-Encoding'
+        if use_gzip:
+            response['Content-Encoding'] = 'gzip'
+        return response
+
 class AthleteAPIView(APIView):
     def get(self, request, user_id):
+        return response_cache.cached_response(request, 'athlete', lambda: self._get(user_id), user_id)
+
+    def _get(self, user_id):
         user = get_object_or_404(User, id=user_id)
         athlete_info, _ = AthleteInfo.objects.get_or_create(user=user)
 
@@ -142,6 +310,7 @@ class AthleteAPIView(APIView):
         )
         serializer.is_valid(raise_exception=True)
         serializer.save()
+        response_cache.bump('athlete', user_id)
 
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -151,9 +320,27 @@ class ChallengeViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ["athlete"]
 
-class PositionViewSet(ModelViewSet):
+    def list(self, request, *args, **kwargs):
+        # челленджи одного атлета кешируются, версия меняется при награждении (app_run/challenges.py)
+        athlete_id = request.query_params.get('athlete', '')
+        if not athlete_id.isdigit():
+            return super().list(request, *args, **kwargs)
+        build = super().list
+        return response_cache.cached_response(
+            request, 'challenges', lambda: build(request, *args, **kwargs), int(athlete_id),
+        )
+
+class PickupViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = Pickup.objects.order_by('id')
+    serializer_class = PickupSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ["athlete", "run"]
+
+class PositionViewSet(FastListMixin, ModelViewSet):
     queryset = Position.objects.all()
     serializer_class = PositionSerializer
+    fast_serializer_class = FastPositionSerializer
+    pagination_class = PositionPagination
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -162,92 +349,223 @@ class PositionViewSet(ModelViewSet):
             qs = qs.filter(run_id=run_id)
         return qs
 
+    LOD_PARAMS = ('simplify', 'max_points')
+
+    def list(self, request, *args, **kwargs):
+        from app_run.track_storage import TrackRows, archived_track_points, stored_track_rows
+
+        run_id = request.query_params.get('run')
+        if any(name in request.query_params for name in self.LOD_PARAMS):
+            return self._simplified_list(request, run_id)
+        # трек завершённого забега отдаём из упакованного хранилища, без чтения строк
+        if run_id and run_id.isdigit() and not wants_keyset_pagination(request):
+            rows = stored_track_rows(run_id)
+            if rows is not None:
+                return FastJSONResponse(rows) if use_fast_list(request) else Response(rows)
+        # строк заархивированного забега в Position нет: keyset-страницы - по упакованному треку
+        if run_id and run_id.isdigit():
+            points = archived_track_points(run_id)
+            if points is not None:
+                page = self.paginate_queryset(TrackRows(int(run_id), *points))
+                response = self.get_paginated_response(page)
+                return FastJSONResponse(response.data) if use_fast_list(request) else response
+        return super().list(request, *args, **kwargs)
+
+    def _simplified_list(self, request, run_id):
+        # ?simplify=<допуск, м> и/или ?max_points=N - упрощённый трек одного забега для карты
+        params = request.query_params
+        try:
+            if not run_id or not run_id.isdigit():
+                raise ValueError('run is required')
+            if wants_keyset_pagination(request):
+                raise ValueError('cannot be combined with cursor pagination')
+            tolerance = float(params['simplify']) if 'simplify' in params else None
+            max_points = int(params['max_points']) if 'max_points' in params else None
+            if tolerance is not None and not tolerance >= 0:
+                raise ValueError('simplify must be >= 0')
+            if max_points is not None and max_points < 2:
+                raise ValueError('max_points must be >= 2')
+        except ValueError as exc:
+            return Response({'detail': f'Invalid query parameters: {exc}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        from app_run.track_storage import simplified_track_rows
+
+        rows = simplified_track_rows(run_id, tolerance, max_points)
+        return FastJSONResponse(rows) if use_fast_list(request) else Response(rows)
+
+    def perform_create(self, serializer):
+        from app_run.tracking import save_position
+
+        save_position(serializer)
+
+    def perform_update(self, serializer):
+        from app_run.tracking import check_not_archived, lock_runs
+
+        with transaction.atomic():
+            run_ids = {serializer.instance.run_id}
+            if 'run' in serializer.validated_data:
+                run_ids.add(serializer.validated_data['run'].pk)
+            runs = lock_runs(run_ids)
+            check_not_archived(run_ids)
+            serializer.save()
+            for run in runs.values():
+                self._refresh_run(run)
+
+    def perform_destroy(self, instance):
+        from app_run.tracking import check_not_archived, lock_run
+
+        with transaction.atomic():
+            run = lock_run(instance.run_id)
+            check_not_archived([run.id])
+            instance.delete()
+            self._refresh_run(run)
+
+    def _refresh_run(self, run):
+        from app_run.tracking import rebuild_running_distance, refresh_finished_run
+
+        if run.status != 'finished':
+            rebuild_running_distance(run)
+            return
+        # у завершённого забега меняется итоговая дистанция - пересчитываем статистику атлета
+        refresh_finished_run(run)
+        rebuild_athlete_stats([run.athlete_id])
+        leaderboards.rebuild_leaderboards([run.athlete_id])
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        data, response_status = position_batch_result(request.data)
+        return Response(data, status=response_status)
+
+
+def position_batch_result(data) -> tuple[dict, int]:
+    # пакет точек одного или нескольких забегов: список или {"positions": [...]}
+    items = data.get('positions') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return {'detail': 'Expected a non-empty list of positions.'}, status.HTTP_400_BAD_REQUEST
+    if len(items) > settings.POSITION_BATCH_MAX_SIZE:
+        return (
+            {'detail': f'Batch is too large: {len(items)} > {settings.POSITION_BATCH_MAX_SIZE}.'},
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    from app_run.tracking import ingest_position_batch
+
+    positions, errors = ingest_position_batch(items)
+    response_status = status.HTTP_201_CREATED if positions or not errors else status.HTTP_400_BAD_REQUEST
+    return (
+        {
+            'created': len(positions),
+            'errors': [{'index': index, 'errors': point_errors} for index, point_errors in errors.items()],
+        },
+        response_status,
+    )
+
 class CollectibleItemAPIView(APIView):
+    RADIUS_PARAMS = ('lat', 'lon', 'radius')
+    BBOX_PARAMS = ('min_lat', 'min_lon', 'max_lat', 'max_lon')
+
     def get(self, request):
-        queryset = CollectibleItem.objects.all()
+        # версию каталога меняет импорт предметов (app_run/pickups.py: items_changed)
+        return response_cache.cached_response(request, 'collectibles', lambda: self._get(request))
+
+    def _get(self, request):
+        params = request.query_params
+        try:
+            if any(name in params for name in self.RADIUS_PARAMS):
+                # ?lat=&lon=&radius= (метры)
+                latitude, longitude, radius = (float(params[name]) for name in self.RADIUS_PARAMS)
+                self._check_coordinates(latitude, longitude)
+                if radius <= 0:
+                    raise ValueError('radius must be > 0')
+                queryset = items_near(latitude, longitude, radius)
+            elif any(name in params for name in self.BBOX_PARAMS):
+                # ?min_lat=&min_lon=&max_lat=&max_lon=
+                min_lat, min_lon, max_lat, max_lon = (float(params[name]) for name in self.BBOX_PARAMS)
+                self._check_coordinates(min_lat, min_lon)
+                self._check_coordinates(max_lat, max_lon)
+                if min_lat > max_lat:
+                    raise ValueError('min_lat must be <= max_lat')
+                queryset = items_in_bbox(min_lat, min_lon, max_lat, max_lon).order_by('id')
+            else:
+                queryset = CollectibleItem.objects.all()
+        except KeyError as exc:
+            return Response({'detail': f'Missing query parameter: {exc.args[0]}'}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError as exc:
+            return Response({'detail': f'Invalid query parameters: {exc}'}, status=status.HTTP_400_BAD_REQUEST)
+
         serializer = CollectibleItemSerializer(queryset, many=True)
         return Response(serializer.data)
 
+    @staticmethod
+    def _check_coordinates(latitude, longitude):
+        if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+            raise ValueError('coordinates out of range')
+
+
+class LeaderboardAPIView(APIView):
+    # ?period=week|month|all&metric=distance|runs&limit=&date=YYYY-MM-DD&athlete=<id>
+    DEFAULT_LIMIT = 10
+    MAX_LIMIT = 100
+
+    def get(self, request):
+        params = request.query_params
+        try:
+            period = params.get('period', leaderboards.WEEK)
+            if period not in leaderboards.PERIODS:
+                raise ValueError(f'period must be one of {", ".join(leaderboards.PERIODS)}')
+            metric = params.get('metric', 'distance')
+            if metric not in leaderboards.METRICS:
+                raise ValueError(f'metric must be one of {", ".join(leaderboards.METRICS)}')
+            limit = int(params.get('limit', self.DEFAULT_LIMIT))
+            if not 1 <= limit <= self.MAX_LIMIT:
+                raise ValueError(f'limit must be between 1 and {self.MAX_LIMIT}')
+            day = datetime.date.fromisoformat(params['date']) if 'date' in params else None
+            athlete_id = int(params['athlete']) if 'athlete' in params else None
+        except ValueError as exc:
+            return Response({'detail': f'Invalid query parameters: {exc}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        day = day or timezone.localdate()
+        data = {
+            'period': period,
+            'period_start': leaderboards.period_start(period, day),
+            'metric': metric,
+            'results': leaderboards.top(period, metric, limit, day),
+        }
+        if athlete_id is not None:
+            # место одного атлета, даже если он не попал в топ
+            data['athlete'] = leaderboards.rank(athlete_id, period, metric, day)
+        return Response(data)
+
 
 @api_view(['POST'])
 def upload_collectible_item(request):
-    HEADER_MAP = {
-        "name": "name",
-        "uid": "uid",
-        "value": "value",
-        "latitude": "latitude",
-        "longitude": "longitude",
-        "url": "picture",
-    }
-
-    def clean_value(key: str, value):
-        if value is None:
-            return None
-
-        # чистимо строки
-        if isinstance(value, str):
-            v = value.strip()
-
-            # типова проблема з Excel/CSV-експортом: зайвий ; або лапки
-            v = v.strip('";\' ')
-            if v.endswith(";"):
-                v = v[:-1].strip()
-
-            value = v
-
-        # приводимо типи
-        if key in ("latitude", "longitude"):
-            try:
-                return float(value)
-            except (TypeError, ValueError):
-                return value  # хай впаде валідація
-
-        if key == "value":
-            try:
-                return int(value)
-            except (TypeError, ValueError):
-                return value
-
-        return value
+    from app_run.importers import import_collectible_items
+    from app_run.jobs import create_import_job
 
     uploaded_file = request.FILES.get("file")
     if not uploaded_file:
         return Response({"detail": "Файл не передан (key: file)"}, status=status.HTTP_400_BAD_REQUEST)
 
-    wb = load_workbook(uploaded_file, data_only=True)
-    ws = wb.active
-
-    # читаємо заголовки
-    raw_headers = next(ws.iter_rows(min_row=1, max_row=1, values_only=True))
-    raw_headers = [h if h is not None else "" for h in raw_headers]
-
-    # будуємо список полів, у які будемо мапити колонки
-    mapped_fields = []
-    for h in raw_headers:
-        h_norm = str(h).strip().lower()
-        mapped_fields.append(HEADER_MAP.get(h_norm))  # може бути None, якщо колонка зайва/невідома
+    # ?background=1: импорт в фоне, прогресс - GET /api/upload_file/<job_id>/
+    if request.query_params.get("background", "").lower() in ("1", "true", "yes"):
+        job = create_import_job(uploaded_file)
+        return Response(
+            {"job_id": job.id, "status": job.status, "status_url": f"/api/upload_file/{job.id}/"},
+            status=status.HTTP_202_ACCEPTED,
+        )
 
-    invalid_rows = []
+    invalid_rows = import_collectible_items(uploaded_file)
+    return Response(invalid_rows)
 
-    for row in ws.iter_rows(min_row=2, values_only=True):
-        # пропускаємо повністю пусті рядки
-        if row is None or all(v is None for v in row):
-            continue
 
-        # формуємо data для serializer лише по відомих колонках
-        data = {}
-        for field_name, cell_value in zip(mapped_fields, row):
-            if not field_name:
-                continue
-            data[field_name] = clean_value(field_name, cell_value)
+class ImportJobAPIView(APIView):
+    def get(self, request, job_id):
+        job = get_object_or_404(ImportJob, id=job_id)
+        return Response(ImportJobSerializer(job).data)
 
-        serializer = CollectibleItemSerializer(data=data)
-        if serializer.is_valid():
-            serializer.save()
-        else:
-            # по ТЗ: повертаємо "сирий" рядок (list of lists)
-            invalid_rows.append(list(row))
 
-    wb.close()
+class MetricsAPIView(APIView):
+    permission_classes = [IsAdminUser]
 
-    return Response(invalid_rows)
\ No newline at end of file
+    def get(self, request):
+        return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app_run.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -118,4 +119,63 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 COMPANY_NAME = 'Бегуны 30+'
 SLOGAN = 'Бегаем в любую погоду! От -30 до +30!'
-CONTACTS = 'Город Задунайск, улица 30 Лет СССР, дом 30'
\ No newline at end of file
+CONTACTS = 'Город Задунайск, улица 30 Лет СССР, дом 30'
+# Метод расчёта дистанции забега: 'vincenty', 'haversine' или 'karney' (см. app_run/distance.py)
+RUN_DISTANCE_METHOD = 'vincenty'
+
+# Сверка накопленной дистанции с полным пересчётом трека при остановке забега
+RUN_DISTANCE_RECONCILE = False
+RUN_DISTANCE_RECONCILE_TOLERANCE = 0.001  # км
+
+# Максимальное количество точек в одном запросе /api/positions/batch/
+POSITION_BATCH_MAX_SIZE = 10000
+
+# Размер пачки при импорте предметов (валидация и bulk_create)
+COLLECTIBLE_IMPORT_BATCH_SIZE = 1000
+
+# Фоновый импорт (POST /api/upload_file/?background=1)
+IMPORT_UPLOAD_DIR = BASE_DIR / 'media' / 'imports'
+IMPORT_WORKERS = 2
+
+# Максимальный размер страницы позиций при ?pagination=cursor
+POSITION_PAGE_MAX_SIZE = 5000
+
+# list-эндпоинты runs/users/positions отдают JSON через быстрый путь (app_run/fast_serializers.py)
+FAST_LIST_RESPONSES = True
+
+# Размер пачки точек при потоковой выгрузке трека (GeoJSON/GPX)
+TRACK_EXPORT_CHUNK_SIZE = 2000
+
+# Метрики запросов в памяти процесса (app_run/metrics.py, GET /api/_metrics/ для админов)
+METRICS_ENABLED = True
+METRICS_SAMPLE_RATE = 1.0  # доля замеряемых запросов
+METRICS_WINDOW_SECONDS = 300  # скользящее окно для квантилей
+METRICS_WINDOW_SLOTS = 10
+
+# Сколько хранить в кеше важность точек трека завершённого забега (?simplify=, ?max_points=), сек
+TRACK_LOD_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Сбор предметов во время записи точек (app_run/pickups.py)
+COLLECTIBLE_PICKUP_RADIUS = 100  # м
+COLLECTIBLE_GRID_TTL = 300  # сек, перестройка сетки предметов, даже если каталог не менялся
+
+# Лидерборды (app_run/leaderboards.py, GET /api/leaderboard/): сколько хранить топ в кеше, сек
+LEADERBOARD_CACHE_TIMEOUT = 60
+
+# Кеш готовых JSON-ответов с ETag (app_run/response_cache.py): collectibles, челленджи атлета,
+# athlete_info, company_details. Запись данных меняет версию, TTL - страховка от изменений в обход API.
+# Включать только с общим для всех процессов кешем в CACHES (Redis, Memcached, DatabaseCache):
+# с LocMemCache по умолчанию новая версия видна лишь процессу, обработавшему запись, а остальные
+# воркеры и Lambda отдают устаревшие ответы до RESPONSE_CACHE_TIMEOUT
+RESPONSE_CACHE_ENABLED = False
+RESPONSE_CACHE_TIMEOUT = 300
+
+# Максимум забегов в одном запросе POST /api/runs/lifecycle/
+RUN_LIFECYCLE_MAX_SIZE = 500
+
+# Архивация точек завершённых забегов (app_run/archive.py, manage.py archive_positions)
+POSITION_ARCHIVE_AFTER_DAYS = 30
+POSITION_ARCHIVE_CHUNK_SIZE = 5000  # строк Position в одном DELETE
+
+# Подключать ли /admin/ (в профиле API-only Lambda, project_run/settings/serverless.py, выключено)
+ADMIN_ENABLED = True
@@ -8,4 +8,7 @@ DATABASES = {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
     }
-}
\ No newline at end of file
+}
+
+# локально сервер - один процесс, кеш в памяти процесса общий для всех запросов
+RESPONSE_CACHE_ENABLED = True
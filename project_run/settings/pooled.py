@@ -0,0 +1,53 @@
+from django.core.exceptions import ImproperlyConfigured
+
+from .production import *
+
+# production плюс переиспользование соединений с БД, настраиваемое окружением
+# (production.py не редактируется). Без переменных всё как в production: новое
+# соединение на каждый запрос. Включается через DJANGO_SETTINGS_MODULE=project_run.settings.pooled
+#
+# DB_CONN_MAX_AGE - сколько секунд держать соединение между запросами,
+# DB_CONN_HEALTH_CHECKS=1 - проверять его перед переиспользованием.
+# DB_POOL=1 - пул соединений Django (DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT).
+
+
+def _env_number(name, default, parse=int, minimum=0):
+    # неверное значение - ImproperlyConfigured с именем переменной при старте, а не голый ValueError
+    raw = os.environ.get(name, '').strip()
+    if not raw:
+        return default
+    try:
+        value = parse(raw)
+    except ValueError:
+        raise ImproperlyConfigured(f'{name} must be {"an integer" if parse is int else "a number"}, got {raw!r}')
+    if not value >= minimum:
+        raise ImproperlyConfigured(f'{name} must be >= {minimum}, got {raw!r}')
+    return value
+
+
+def _env_flag(name):
+    return os.environ.get(name, '').strip().lower() in ('1', 'true', 'yes')
+
+
+DATABASES['default']['CONN_MAX_AGE'] = _env_number('DB_CONN_MAX_AGE', 0)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = _env_flag('DB_CONN_HEALTH_CHECKS')
+
+if _env_flag('DB_POOL'):
+    pool_options = {
+        'min_size': _env_number('DB_POOL_MIN_SIZE', 2),
+        'max_size': _env_number('DB_POOL_MAX_SIZE', 10, minimum=1),
+        'timeout': _env_number('DB_POOL_TIMEOUT', 10, parse=float, minimum=0.001),
+    }
+    if pool_options['min_size'] > pool_options['max_size']:
+        raise ImproperlyConfigured(f'DB_POOL_MIN_SIZE ({pool_options["min_size"]}) must not exceed '
+                                   f'DB_POOL_MAX_SIZE ({pool_options["max_size"]})')
+    # пул есть только в psycopg 3, а requirements.txt ставит psycopg2: падаем при старте, а не на первом запросе
+    try:
+        import psycopg  # noqa: F401
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        raise ImproperlyConfigured('DB_POOL=1 requires psycopg 3 with the pool extra: pip install "psycopg[pool]"')
+    if DATABASES['default']['CONN_MAX_AGE']:
+        raise ImproperlyConfigured('DB_POOL=1 cannot be combined with DB_CONN_MAX_AGE: pooled connections '
+                                   'are returned to the pool after each request')
+    DATABASES['default']['OPTIONS'] = {'pool': pool_options}
@@ -0,0 +1,26 @@
+from .pooled import *
+
+# Профиль для API-only Lambda (Zappa): production (с соединениями с БД из окружения, pooled.py)
+# плюс урезанный набор приложений и middleware - без админки, сессий, сообщений и статики, только JSON-ответы.
+# Включается через DJANGO_SETTINGS_MODULE=project_run.settings.serverless
+
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+
+    'app_run',
+]
+
+MIDDLEWARE = [
+    'app_run.metrics.RequestMetricsMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+ADMIN_ENABLED = False
+
+# без сессий остаётся Basic-аутентификация; браузерный API (шаблоны, статика) не нужен
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': ['rest_framework.authentication.BasicAuthentication'],
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+}
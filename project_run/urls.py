@@ -14,26 +14,48 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.conf import settings
 from django.urls import path, include
+from django.utils.functional import lazy
 from rest_framework.routers import DefaultRouter
 
 from app_run.views import company_details, RunViewSet, UserViewSet, RunStartAPIView, RunStopAPIView, AthleteAPIView, \
-    ChallengeViewSet, PositionViewSet, CollectibleItemAPIView, upload_collectible_item
+    ChallengeViewSet, PickupViewSet, PositionViewSet, CollectibleItemAPIView, upload_collectible_item, ImportJobAPIView, \
+    RunTrackExportAPIView, MetricsAPIView, LeaderboardAPIView
+
+
+def async_urlpatterns():
+    from app_run import async_urls
+
+    return async_urls.urlpatterns
+
 
 router = DefaultRouter()
 router.register('api/runs', RunViewSet)
 router.register('api/users', UserViewSet)
 router.register('api/challenges', ChallengeViewSet)
 router.register('api/positions', PositionViewSet)
+router.register('api/pickups', PickupViewSet)
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('api/company_details/', company_details),
     path('api/runs/<int:run_id>/start/', RunStartAPIView.as_view()),
     path('api/runs/<int:run_id>/stop/', RunStopAPIView.as_view()),
+    path('api/runs/<int:run_id>/track.geojson', RunTrackExportAPIView.as_view(), {'fmt': 'geojson'}),
+    path('api/runs/<int:run_id>/track.gpx', RunTrackExportAPIView.as_view(), {'fmt': 'gpx'}),
     path('api/athlete_info/<int:user_id>/', AthleteAPIView.as_view()),
     path('api/collectible_item/', CollectibleItemAPIView.as_view()),
     path('api/upload_file/', upload_collectible_item),
+    path('api/upload_file/<int:job_id>/', ImportJobAPIView.as_view()),
+    path('api/leaderboard/', LeaderboardAPIView.as_view()),
+    path('api/_metrics/', MetricsAPIView.as_view()),
+    # async-версии эндпоинтов записи для ASGI: include() получает ленивый список, поэтому модуль
+    # (и numpy через app_run.tracking) импортируется при первом запросе к api/async/, а не при старте процесса
+    path('api/async/', include(lazy(async_urlpatterns, list)())),
     path('', include(router.urls))
 ]
+
+if settings.ADMIN_ENABLED:
+    from django.contrib import admin
+
+    urlpatterns.insert(0, path('admin/', admin.site.urls))